@@ -0,0 +1,121 @@
+import os
+import sys
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import signal
+import subprocess
+import time
+
+from src.services.orchestrator_worker import serve_broker, spawn_workers, get_authkey
+
+NGINX_TEMPLATE = """# Socket.IO needs sticky sessions: the long-polling transport sends several
+# HTTP requests per session and they must all reach the worker that owns it.
+upstream agentmix_web {{
+    ip_hash;
+{servers}
+}}
+
+server {{
+    listen 80;
+
+    location /socket.io {{
+        proxy_pass http://agentmix_web/socket.io;
+        proxy_http_version 1.1;
+        proxy_buffering off;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "Upgrade";
+        proxy_set_header Host $host;
+    }}
+
+    location / {{
+        proxy_pass http://agentmix_web;
+        proxy_set_header Host $host;
+    }}
+}}"""
+
+
+def nginx_config(host: str, ports):
+    servers = '\n'.join(f'    server {host}:{port};' for port in ports)
+    return NGINX_TEMPLATE.format(servers=servers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run AgentMix with several web and orchestrator worker processes')
+    parser.add_argument('--web-workers', type=int, default=2, help='Flask/Socket.IO processes to start')
+    parser.add_argument('--orchestrator-workers', type=int, default=1, help='Conversation worker processes to start')
+    parser.add_argument('--base-port', type=int, default=5001, help='Port of the first web worker; others count up')
+    parser.add_argument('--host', default='127.0.0.1', help='Address the load balancer uses to reach the web workers')
+    parser.add_argument('--message-queue', default=os.environ.get('AGENTMIX_SOCKETIO_MESSAGE_QUEUE'),
+                        help='Socket.IO message queue URL, e.g. redis://localhost:6379/0')
+    parser.add_argument('--local-message-queue', type=int, metavar='PORT',
+                        help='Start the built-in Redis pub/sub stand-in on this port (development/testing)')
+    parser.add_argument('--print-nginx', action='store_true', help='Print the sticky-session nginx config and exit')
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.web_workers)]
+    if args.print_nginx:
+        print(nginx_config(args.host, ports))
+        return
+
+    message_queue = args.message_queue
+    if args.local_message_queue:
+        from src.services.local_message_queue import LocalPubSubServer
+        LocalPubSubServer('127.0.0.1', args.local_message_queue).start_background()
+        message_queue = f'redis://127.0.0.1:{args.local_message_queue}/0'
+
+    if args.web_workers > 1 and not message_queue:
+        parser.error('--message-queue or --local-message-queue is required with more than one web worker')
+    if args.web_workers > 1 and args.orchestrator_workers < 1:
+        parser.error('--orchestrator-workers must be at least 1 with more than one web worker, '
+                     'otherwise each web process would own its own conversations')
+
+    env = dict(os.environ)
+    env['AGENTMIX_DEBUG'] = '0'
+    if message_queue:
+        env['AGENTMIX_SOCKETIO_MESSAGE_QUEUE'] = message_queue
+
+    processes = []
+    if args.orchestrator_workers > 0:
+        # The launcher hosts the command broker so every web worker can reach every shard
+        get_authkey()
+        serve_broker(args.orchestrator_workers)
+        env['AGENTMIX_WORKER_AUTHKEY'] = os.environ['AGENTMIX_WORKER_AUTHKEY']
+        env['AGENTMIX_ORCHESTRATOR_WORKERS'] = str(args.orchestrator_workers)
+        env['AGENTMIX_HOST_WORKER_BROKER'] = '0'
+        env['AGENTMIX_SPAWN_WORKERS'] = '0'
+        os.environ.update(env)
+        processes.extend(spawn_workers(args.orchestrator_workers))
+
+    main_script = os.path.join(os.path.dirname(__file__), 'main.py')
+    for i, port in enumerate(ports):
+        # Archival and purging of deleted conversations run in the first web worker only
+        worker_env = {**env, 'PORT': str(port), 'AGENTMIX_BACKGROUND_JOBS': '1' if i == 0 else '0'}
+        processes.append(subprocess.Popen([sys.executable, main_script], env=worker_env))
+
+    print(f"Started {args.web_workers} web worker(s) on ports {', '.join(map(str, ports))} "
+          f"and {args.orchestrator_workers} orchestrator worker(s)")
+    if message_queue:
+        print(f"Socket.IO message queue: {message_queue}")
+    print("Put the web workers behind a load balancer with sticky sessions, for example:\n")
+    print(nginx_config(args.host, ports))
+
+    def shutdown(signum, frame):
+        for process in processes:
+            process.terminate()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while True:
+        for process in processes:
+            if process.poll() is not None:
+                print(f"Process {process.args} exited with code {process.returncode}; shutting down")
+                shutdown(None, None)
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
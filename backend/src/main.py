@@ -3,14 +3,22 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+if os.environ.get('AGENTMIX_SOCKETIO_MESSAGE_QUEUE'):
+    # The Redis message queue client needs cooperative sockets under eventlet
+    import eventlet
+    eventlet.monkey_patch()
+
 from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from src.models.user import db
 # Import all models to ensure tables are created
 from src.models.ai_agent import AIAgent
-from src.models.message import Message
-from src.models.conversation import Conversation
+from src.models.message import Message, create_message_indexes
+from src.models.conversation import Conversation, ConversationParticipant, backfill_conversation_participants
+from src.models.conversation_state import ConversationState
+from src.models.conversation_archive import ConversationArchive
+from src.models.message_embedding import MessageEmbedding
 # Import tool models after AIAgent to ensure proper foreign key resolution
 # from src.models.tool import Tool, AgentTool, ToolExecution
 from src.routes.user import user_bp
@@ -18,6 +26,9 @@ from src.routes.ai_agent import ai_agent_bp
 from src.routes.conversation import conversation_bp
 from src.routes.ai_chat import ai_chat_bp
 from src.routes.model_discovery import model_discovery_bp
+from src.routes.archive import archive_bp
+from src.routes.search import search_bp
+from src.routes.realtime import realtime_bp
 # from src.routes.tools import tools_bp
 
 # Import error handling
@@ -32,35 +43,77 @@ CORS(app)
 # Initialize error handling
 handle_flask_errors(app)
 
-# Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-# Initialize conversation orchestrator with HITL support
-from src.services.conversation_orchestrator_hitl import init_orchestrator_hitl
-from src.routes.websocket_hitl import init_websocket_events_hitl
-
-orchestrator = init_orchestrator_hitl(socketio, app)
-init_websocket_events_hitl(socketio)
+# Initialize SocketIO. With several web workers behind a load balancer, set
+# AGENTMIX_SOCKETIO_MESSAGE_QUEUE (e.g. redis://localhost:6379/0) so emits from
+# any process reach clients connected to every worker; see src/launcher.py.
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    message_queue=os.environ.get('AGENTMIX_SOCKETIO_MESSAGE_QUEUE') or None
+)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(ai_agent_bp, url_prefix='/api')
 app.register_blueprint(conversation_bp, url_prefix='/api')
 app.register_blueprint(ai_chat_bp, url_prefix='/api')
 app.register_blueprint(model_discovery_bp)
+app.register_blueprint(archive_bp, url_prefix='/api')
+app.register_blueprint(search_bp, url_prefix='/api')
+app.register_blueprint(realtime_bp, url_prefix='/api')
 # app.register_blueprint(tools_bp)
 
 # uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'AGENTMIX_DATABASE_URI',
+    f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    # Move participant lists from the legacy JSON column into conversation_participant
+    backfill_conversation_participants()
+    create_message_indexes()
+    # Full-text index over message content, maintained by triggers
+    from src.services.message_search import init_message_search
+    init_message_search()
+    # Vectors for retrieval of older context; new messages are embedded on insert
+    from src.services.vector_index import backfill_embeddings
+    backfill_embeddings()
     
     # Initialize built-in tools
     # from src.services.tool_registry import tool_registry
     # tool_registry.initialize_database_tools()
 
+# Initialize conversation orchestrator with HITL support. With
+# AGENTMIX_ORCHESTRATOR_WORKERS > 0 conversation loops run in separate worker
+# processes (src/worker.py), sharded by conversation_id.
+# Conversation events go out through the RoomEmitter, which coalesces each
+# room's events over AGENTMIX_EMIT_BATCH_MS.
+from src.services.conversation_orchestrator_hitl import init_orchestrator_hitl
+from src.services.event_emitter import init_room_emitter
+from src.routes.websocket_hitl import init_websocket_events_hitl
+
+# Room subscriber counts; events for rooms nobody joined are only suppressed when
+# this process serves every client (no shared message queue)
+from src.services.presence import init_presence
+presence = init_presence(authoritative=not os.environ.get('AGENTMIX_SOCKETIO_MESSAGE_QUEUE'))
+room_emitter = init_room_emitter(socketio, presence)
+# Recent messages per conversation, replayed to clients rejoining with last_seen_id
+from src.services.event_replay import replay_buffer
+room_emitter.listeners.append(replay_buffer.on_event)
+# Server-Sent Events streams (/api/conversations/<id>/events) read from the same events
+from src.services.event_bus import event_bus
+room_emitter.listeners.append(event_bus.publish)
+orchestrator_workers = int(os.environ.get('AGENTMIX_ORCHESTRATOR_WORKERS', 0))
+if orchestrator_workers > 0:
+    from src.services.orchestrator_worker import init_sharded_orchestrator
+    orchestrator = init_sharded_orchestrator(room_emitter, orchestrator_workers, app.config['SQLALCHEMY_DATABASE_URI'])
+else:
+    orchestrator = init_orchestrator_hitl(room_emitter, app)
+init_websocket_events_hitl(socketio)
+
 # Health check endpoint
 @app.route('/api/health')
 def health_check():
@@ -88,4 +141,17 @@ def serve(path):
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    socketio.run(app, host='0.0.0.0', port=port, debug=True)
+    debug = os.environ.get('AGENTMIX_DEBUG', '1') == '1'
+    # Resume conversations that were running when the server last stopped. Under
+    # the debug reloader only the serving child process does this.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        orchestrator.recover_conversations()
+        # Database-wide jobs run in one process; the launcher enables them on its first web worker only
+        if os.environ.get('AGENTMIX_BACKGROUND_JOBS', '1') == '1':
+            # Background archival of old completed conversations (AGENTMIX_ARCHIVE_INTERVAL_SECONDS)
+            from src.services.message_archive import start_archive_scheduler
+            start_archive_scheduler(app)
+            # Batched removal of deleted conversations
+            from src.services.conversation_purge import start_purge_worker
+            start_purge_worker(app)
+    socketio.run(app, host='0.0.0.0', port=port, debug=debug)
@@ -1,35 +1,131 @@
 from src.models.user import db
 from datetime import datetime
+from flask import abort
+import json
 
 class Conversation(db.Model):
     id = db.Column(db.String(100), primary_key=True)  # UUID or custom ID
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    participants = db.Column(db.Text, nullable=False)  # JSON string of agent IDs
-    status = db.Column(db.String(20), default='active')  # active, paused, completed
+    participants = db.Column(db.Text, nullable=False)  # JSON string of agent IDs (kept in sync with participant_links)
+    status = db.Column(db.String(20), default='active')  # active, paused, completed, queued, deleted (awaiting purge)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    participant_links = db.relationship(
+        'ConversationParticipant',
+        order_by='ConversationParticipant.position',
+        cascade='all, delete-orphan',
+        backref='conversation'
+    )
+
     def __repr__(self):
         return f'<Conversation {self.name}>'
 
+    @classmethod
+    def visible(cls):
+        """Query for conversations that have not been deleted"""
+        return cls.query.filter(cls.status != 'deleted')
+
+    @classmethod
+    def get_visible(cls, conversation_id):
+        """Get a conversation unless it is deleted and waiting to be purged"""
+        conversation = cls.query.get(conversation_id)
+        if conversation is None or conversation.status == 'deleted':
+            return None
+        return conversation
+
+    @classmethod
+    def set_status(cls, conversation_id, status):
+        """Change a conversation's status unless it was deleted meanwhile (caller commits).
+
+        A conditional UPDATE, so a loop finishing its last turn cannot bring a
+        conversation back that was deleted while it ran. Returns whether a row changed.
+        """
+        return cls.query.filter(
+            cls.id == conversation_id,
+            cls.status != 'deleted'
+        ).update({cls.status: status}, synchronize_session='fetch') > 0
+
+    @classmethod
+    def get_visible_or_404(cls, conversation_id):
+        conversation = cls.get_visible(conversation_id)
+        if conversation is None:
+            abort(404)
+        return conversation
+
     def to_dict(self):
-        import json
         return {
             'id': self.id,
             'name': self.name,
             'description': self.description,
-            'participants': json.loads(self.participants) if self.participants else [],
+            'participants': self.get_participants(),
             'status': self.status,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-    def set_participants(self, participant_ids):
-        import json
+    def set_participants(self, participant_ids, roles=None):
+        """Set the participating agents in speaking order, optionally with {agent_id: role}"""
+        roles = roles or {}
         self.participants = json.dumps(participant_ids)
 
+        # Reuse existing rows so re-setting a member does not delete and re-insert its key
+        existing = {link.agent_id: link for link in self.participant_links}
+        links = []
+        for position, agent_id in enumerate(dict.fromkeys(participant_ids)):
+            link = existing.get(agent_id) or ConversationParticipant(agent_id=agent_id)
+            link.position = position
+            link.role = roles.get(agent_id, link.role or 'participant')
+            links.append(link)
+        self.participant_links = links
+
     def get_participants(self):
-        import json
+        if self.participant_links:
+            return [link.agent_id for link in self.participant_links]
+        # Conversations not yet backfilled into conversation_participant
         return json.loads(self.participants) if self.participants else []
 
+
+class ConversationParticipant(db.Model):
+    """An agent's membership in a conversation, with its speaking position and role"""
+    __tablename__ = 'conversation_participant'
+
+    conversation_id = db.Column(db.String(100), db.ForeignKey('conversation.id'), primary_key=True)
+    agent_id = db.Column(db.Integer, db.ForeignKey('ai_agent.id'), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    role = db.Column(db.String(50), default='participant')
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # The primary key serves conversation -> agents; this serves agent -> conversations
+    __table_args__ = (
+        db.Index('ix_conversation_participant_agent', 'agent_id', 'conversation_id'),
+    )
+
+    def __repr__(self):
+        return f'<ConversationParticipant {self.conversation_id}:{self.agent_id}>'
+
+    def to_dict(self):
+        return {
+            'conversation_id': self.conversation_id,
+            'agent_id': self.agent_id,
+            'position': self.position,
+            'role': self.role,
+            'joined_at': self.joined_at.isoformat() if self.joined_at else None
+        }
+
+
+def backfill_conversation_participants():
+    """Create conversation_participant rows for conversations that only have the JSON list"""
+    linked = db.session.query(ConversationParticipant.conversation_id).distinct()
+    conversations = Conversation.query.filter(~Conversation.id.in_(linked)).all()
+    for conversation in conversations:
+        participant_ids = json.loads(conversation.participants) if conversation.participants else []
+        for position, agent_id in enumerate(dict.fromkeys(participant_ids)):
+            db.session.add(ConversationParticipant(
+                conversation_id=conversation.id,
+                agent_id=agent_id,
+                position=position
+            ))
+    db.session.commit()
+    return len(conversations)
@@ -0,0 +1,35 @@
+from src.models.user import db
+from datetime import datetime
+import json
+
+class ConversationArchive(db.Model):
+    """Where a conversation's messages went when they were moved to cold storage"""
+    __tablename__ = 'conversation_archive'
+
+    conversation_id = db.Column(db.String(100), db.ForeignKey('conversation.id'), primary_key=True)
+    path = db.Column(db.String(500), nullable=False)         # segment file, relative to the archive directory
+    message_count = db.Column(db.Integer, default=0)
+    compressed_bytes = db.Column(db.Integer, default=0)
+    first_timestamp = db.Column(db.DateTime, nullable=True)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+    block_index = db.Column(db.Text, nullable=False)          # JSON [{'offset', 'length', 'count'}] per gzip member
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ConversationArchive {self.conversation_id} ({self.message_count} messages)>'
+
+    def to_dict(self):
+        return {
+            'conversation_id': self.conversation_id,
+            'message_count': self.message_count,
+            'compressed_bytes': self.compressed_bytes,
+            'first_timestamp': self.first_timestamp.isoformat() if self.first_timestamp else None,
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp else None,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+
+    def set_block_index(self, blocks):
+        self.block_index = json.dumps(blocks)
+
+    def get_block_index(self):
+        return json.loads(self.block_index) if self.block_index else []
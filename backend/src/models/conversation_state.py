@@ -0,0 +1,53 @@
+from src.models.user import db
+from datetime import datetime
+import json
+
+class ConversationState(db.Model):
+    """Checkpoint of a running conversation's orchestrator state, used for crash recovery"""
+    __tablename__ = 'conversation_state'
+
+    conversation_id = db.Column(db.String(100), db.ForeignKey('conversation.id'), primary_key=True)
+    message_count = db.Column(db.Integer, default=0)
+    last_speaker_id = db.Column(db.Integer, nullable=True)
+    running = db.Column(db.Boolean, default=True)
+    paused = db.Column(db.Boolean, default=False)
+    waiting_for_human = db.Column(db.Boolean, default=False)
+    human_input_request = db.Column(db.Text, nullable=True)  # JSON {'agent', 'message'}
+    options = db.Column(db.Text, nullable=True)              # JSON start options (mode, quorum, ...)
+    token_usage = db.Column(db.Text, nullable=True)          # JSON running token totals
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ConversationState {self.conversation_id} turn {self.message_count}>'
+
+    def to_dict(self):
+        return {
+            'conversation_id': self.conversation_id,
+            'message_count': self.message_count,
+            'last_speaker_id': self.last_speaker_id,
+            'running': self.running,
+            'paused': self.paused,
+            'waiting_for_human': self.waiting_for_human,
+            'human_input_request': self.get_human_input_request(),
+            'options': self.get_options(),
+            'token_usage': self.get_token_usage(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def set_human_input_request(self, request_dict):
+        self.human_input_request = json.dumps(request_dict) if request_dict else None
+
+    def get_human_input_request(self):
+        return json.loads(self.human_input_request) if self.human_input_request else None
+
+    def set_options(self, options_dict):
+        self.options = json.dumps(options_dict or {})
+
+    def get_options(self):
+        return json.loads(self.options) if self.options else {}
+
+    def set_token_usage(self, usage_dict):
+        self.token_usage = json.dumps(usage_dict or {})
+
+    def get_token_usage(self):
+        return json.loads(self.token_usage) if self.token_usage else {}
@@ -15,6 +15,11 @@ class Message(db.Model):
     sender = db.relationship('AIAgent', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('AIAgent', foreign_keys=[receiver_id], backref='received_messages')
 
+    # Serves "messages of a conversation after id N": paging, export and reconnect replay
+    __table_args__ = (
+        db.Index('ix_message_conversation_id_id', 'conversation_id', 'id'),
+    )
+
     def __repr__(self):
         return f'<Message {self.id} from {self.sender_id} to {self.receiver_id}>'
 
@@ -31,3 +36,9 @@ class Message(db.Model):
             'sender_name': getattr(self.sender, 'name', None) if self.sender else None,
             'receiver_name': getattr(self.receiver, 'name', None) if self.receiver else None
         }
+
+
+def create_message_indexes():
+    """Create indexes added to the message table after it was first created"""
+    for index in Message.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
@@ -0,0 +1,16 @@
+from src.models.user import db
+from datetime import datetime
+
+class MessageEmbedding(db.Model):
+    """Vector representation of a message, used for retrieval of older context"""
+    __tablename__ = 'message_embedding'
+
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id'), primary_key=True)
+    conversation_id = db.Column(db.String(100), nullable=True, index=True)
+    embedder = db.Column(db.String(100), nullable=False)   # name of the embedder that produced the vector
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)     # float32 values, native byte order
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MessageEmbedding {self.message_id} ({self.embedder})>'
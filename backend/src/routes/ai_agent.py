@@ -1,10 +1,28 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
 from src.models.ai_agent import AIAgent
+from src.models.conversation import Conversation, ConversationParticipant
+from src.services.agent_profiles import agent_profile_cache
+from src.services.message_render import message_renders
+from sqlalchemy.orm import selectinload
+import os
 import uuid
 
 ai_agent_bp = Blueprint('ai_agent', __name__)
 
+def invalidate_agent_profile(agent_id):
+    """Drop cached copies of an agent so running conversations and history pages see the change"""
+    invalidate_agent_profiles([agent_id])
+
+def invalidate_agent_profiles(agent_ids):
+    from src.services.conversation_orchestrator_hitl import get_orchestrator_hitl
+    for agent_id in agent_ids:
+        agent_profile_cache.invalidate(agent_id)
+    message_renders.forget_agents(agent_ids)
+    orchestrator = get_orchestrator_hitl()
+    if orchestrator:
+        orchestrator.invalidate_agents(list(agent_ids))
+
 @ai_agent_bp.route('/agents', methods=['GET'])
 def get_agents():
     """Get all AI agents"""
@@ -80,6 +98,38 @@ def get_agent(agent_id):
             'error': str(e)
         }), 500
 
+@ai_agent_bp.route('/agents/<int:agent_id>/conversations', methods=['GET'])
+def get_agent_conversations(agent_id):
+    """Get the conversations an agent takes part in (optionally filtered by ?status=)"""
+    try:
+        AIAgent.query.get_or_404(agent_id)
+        query = Conversation.visible().join(ConversationParticipant).filter(
+            ConversationParticipant.agent_id == agent_id
+        ).options(selectinload(Conversation.participant_links))
+        if request.args.get('status'):
+            query = query.filter(Conversation.status == request.args['status'])
+        conversations = query.order_by(Conversation.created_at.desc()).all()
+        
+        return jsonify({
+            'success': True,
+            'conversations': [
+                {
+                    **conversation.to_dict(),
+                    'role': next(
+                        (link.role for link in conversation.participant_links if link.agent_id == agent_id),
+                        None
+                    )
+                }
+                for conversation in conversations
+            ]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @ai_agent_bp.route('/agents/<int:agent_id>', methods=['PUT'])
 def update_agent(agent_id):
     """Update an AI agent"""
@@ -104,6 +154,7 @@ def update_agent(agent_id):
             agent.status = data['status']
         
         db.session.commit()
+        invalidate_agent_profile(agent_id)
         
         return jsonify({
             'success': True,
@@ -124,6 +175,7 @@ def delete_agent(agent_id):
         agent = AIAgent.query.get_or_404(agent_id)
         db.session.delete(agent)
         db.session.commit()
+        invalidate_agent_profile(agent_id)
         
         return jsonify({
             'success': True,
@@ -144,6 +196,7 @@ def activate_agent(agent_id):
         agent = AIAgent.query.get_or_404(agent_id)
         agent.status = 'active'
         db.session.commit()
+        invalidate_agent_profile(agent_id)
         
         return jsonify({
             'success': True,
@@ -164,6 +217,7 @@ def deactivate_agent(agent_id):
         agent = AIAgent.query.get_or_404(agent_id)
         agent.status = 'inactive'
         db.session.commit()
+        invalidate_agent_profile(agent_id)
         
         return jsonify({
             'success': True,
@@ -177,3 +231,227 @@ def deactivate_agent(agent_id):
             'error': str(e)
         }), 500
 
+
+# Batch endpoints: every item is validated up front, the valid ones are applied
+# in a single transaction and the response carries one result per item, in
+# request order. With ?atomic=1 a single invalid item rejects the whole batch.
+
+AGENT_REQUIRED_FIELDS = ('name', 'provider', 'model', 'api_key')
+AGENT_STATUSES = ('active', 'inactive', 'error')
+MAX_BATCH_SIZE = int(os.environ.get('AGENTMIX_MAX_AGENT_BATCH', 1000))
+
+def _validate_agent_fields(data, required=()):
+    """Return an error message for an invalid agent payload, or None"""
+    if not isinstance(data, dict):
+        return 'Each item must be a JSON object'
+    for field in required:
+        if field not in data:
+            return f'Missing required field: {field}'
+    for field in AGENT_REQUIRED_FIELDS:
+        if field in data and (not isinstance(data[field], str) or not data[field]):
+            return f'{field} must be a non-empty string'
+    if 'config' in data and not isinstance(data['config'], dict):
+        return 'config must be an object'
+    if 'tools' in data and not isinstance(data['tools'], list):
+        return 'tools must be a list'
+    if 'status' in data and data['status'] not in AGENT_STATUSES:
+        return f"Unknown status: {data['status']}"
+    return None
+
+def _apply_agent_fields(agent, data):
+    for field in ('name', 'provider', 'model', 'api_key', 'status'):
+        if field in data:
+            setattr(agent, field, data[field])
+    if 'config' in data:
+        agent.set_config(data['config'])
+    if 'tools' in data:
+        agent.set_tools(data['tools'])
+
+def _batch_items(key):
+    """Read the list under ``key`` from the request body; returns (items, error response)"""
+    data = request.get_json(silent=True)
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({
+            'success': False,
+            'error': f'Expected a non-empty list in "{key}"'
+        }), 400)
+    if len(items) > MAX_BATCH_SIZE:
+        return None, (jsonify({
+            'success': False,
+            'error': f'At most {MAX_BATCH_SIZE} items per batch'
+        }), 400)
+    return items, None
+
+def _batch_failure(index, error):
+    return {'index': index, 'success': False, 'error': error}
+
+def _batch_response(results, applied, created=False):
+    failed = sum(1 for result in results if not result['success'])
+    if request.args.get('atomic') == '1' and failed:
+        # Nothing was applied; mark the valid items as such
+        results = [
+            result if not result['success'] else _batch_failure(result['index'], 'Not applied: another item is invalid')
+            for result in results
+        ]
+        applied = 0
+    status = (201 if created else 200) if applied else 400
+    return jsonify({
+        'success': failed == 0,
+        'applied': applied,
+        'failed': failed,
+        'results': results
+    }), status
+
+def _batch_rejected(results):
+    return request.args.get('atomic') == '1' and any(not result['success'] for result in results)
+
+@ai_agent_bp.route('/agents/batch', methods=['POST'])
+def batch_create_agents():
+    """Create many agents in one transaction: {"agents": [{name, provider, model, api_key, ...}]}"""
+    items, error = _batch_items('agents')
+    if error:
+        return error
+    
+    try:
+        results = [None] * len(items)
+        created = []
+        for index, data in enumerate(items):
+            problem = _validate_agent_fields(data, AGENT_REQUIRED_FIELDS)
+            if problem:
+                results[index] = _batch_failure(index, problem)
+                continue
+            agent = AIAgent(status='inactive')
+            _apply_agent_fields(agent, data)
+            created.append((index, agent))
+        
+        if _batch_rejected([result for result in results if result]):
+            for index, _ in created:
+                results[index] = {'index': index, 'success': True}
+            return _batch_response(results, 0, created=True)
+        
+        if created:
+            db.session.add_all([agent for _, agent in created])
+            # Serialize after the flush (ids assigned) and before the commit
+            # expires the objects, which would reload every row
+            db.session.flush()
+            for index, agent in created:
+                results[index] = {'index': index, 'success': True, 'agent': agent.to_dict()}
+            db.session.commit()
+        
+        return _batch_response(results, len(created), created=True)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@ai_agent_bp.route('/agents/batch', methods=['PUT'])
+def batch_update_agents():
+    """Update many agents in one transaction: {"agents": [{"id": 1, "model": ...}]}"""
+    items, error = _batch_items('agents')
+    if error:
+        return error
+    
+    try:
+        ids = [data.get('id') for data in items if isinstance(data, dict)]
+        agents_by_id = {
+            agent.id: agent for agent in
+            AIAgent.query.filter(AIAgent.id.in_([agent_id for agent_id in ids if isinstance(agent_id, int)]))
+        }
+        
+        results = [None] * len(items)
+        updates = []
+        seen = set()
+        for index, data in enumerate(items):
+            problem = _validate_agent_fields(data)
+            if not problem and not isinstance(data.get('id'), int):
+                problem = 'Missing required field: id'
+            if not problem and data['id'] not in agents_by_id:
+                problem = f"Agent with ID {data['id']} not found"
+            if not problem and data['id'] in seen:
+                problem = f"Agent with ID {data['id']} appears more than once"
+            if problem:
+                results[index] = _batch_failure(index, problem)
+                continue
+            seen.add(data['id'])
+            updates.append((index, data))
+        
+        if _batch_rejected([result for result in results if result]):
+            for index, data in updates:
+                results[index] = {'index': index, 'success': True}
+            return _batch_response(results, 0)
+        
+        for index, data in updates:
+            _apply_agent_fields(agents_by_id[data['id']], data)
+        db.session.flush()
+        for index, data in updates:
+            results[index] = {'index': index, 'success': True, 'agent': agents_by_id[data['id']].to_dict()}
+        db.session.commit()
+        
+        invalidate_agent_profiles([data['id'] for _, data in updates])
+        
+        return _batch_response(results, len(updates))
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def _batch_set_status(status):
+    """Set the status of the agents listed in {"ids": [...]} with one UPDATE"""
+    ids, error = _batch_items('ids')
+    if error:
+        return error
+    
+    try:
+        found = {
+            agent_id for (agent_id,) in
+            db.session.query(AIAgent.id).filter(AIAgent.id.in_([i for i in ids if isinstance(i, int)]))
+        }
+        results = []
+        seen = set()
+        for index, agent_id in enumerate(ids):
+            if isinstance(agent_id, bool) or not isinstance(agent_id, int):
+                results.append(_batch_failure(index, f'Invalid agent ID: {agent_id!r}'))
+            elif agent_id not in found:
+                results.append(_batch_failure(index, f'Agent with ID {agent_id} not found'))
+            elif agent_id in seen:
+                results.append(_batch_failure(index, f'Agent with ID {agent_id} appears more than once'))
+            else:
+                seen.add(agent_id)
+                results.append({'index': index, 'success': True, 'id': agent_id, 'status': status})
+        
+        if seen and not _batch_rejected(results):
+            AIAgent.query.filter(AIAgent.id.in_(seen)).update(
+                {AIAgent.status: status},
+                synchronize_session=False
+            )
+            db.session.commit()
+            invalidate_agent_profiles(seen)
+            applied = len(seen)
+        else:
+            applied = 0
+        
+        return _batch_response(results, applied)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@ai_agent_bp.route('/agents/batch/activate', methods=['POST'])
+def batch_activate_agents():
+    """Activate many agents: {"ids": [1, 2, 3]}"""
+    return _batch_set_status('active')
+
+@ai_agent_bp.route('/agents/batch/deactivate', methods=['POST'])
+def batch_deactivate_agents():
+    """Deactivate many agents: {"ids": [1, 2, 3]}"""
+    return _batch_set_status('inactive')
@@ -0,0 +1,91 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy import func
+from src.models.user import db
+from src.models.conversation_archive import ConversationArchive
+from src.services import message_archive
+
+archive_bp = Blueprint('archive', __name__)
+
+@archive_bp.route('/archive', methods=['GET'])
+def get_archive_stats():
+    """Get totals for archived conversations"""
+    try:
+        conversations, messages, compressed_bytes = db.session.query(
+            func.count(ConversationArchive.conversation_id),
+            func.coalesce(func.sum(ConversationArchive.message_count), 0),
+            func.coalesce(func.sum(ConversationArchive.compressed_bytes), 0)
+        ).one()
+        return jsonify({
+            'success': True,
+            'archived_conversations': conversations,
+            'archived_messages': messages,
+            'compressed_bytes': compressed_bytes
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@archive_bp.route('/archive/run', methods=['POST'])
+def run_archive():
+    """Archive completed conversations older than older_than_days (default AGENTMIX_ARCHIVE_AFTER_DAYS)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        archived = message_archive.archive_completed_conversations(
+            older_than_days=data.get('older_than_days'),
+            limit=int(data.get('limit', 50))
+        )
+        return jsonify({
+            'success': True,
+            'archived': archived
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@archive_bp.route('/conversations/<conversation_id>/archive', methods=['GET'])
+def get_conversation_archive(conversation_id):
+    """Get archive details for one conversation"""
+    archive = ConversationArchive.query.get(conversation_id)
+    if not archive:
+        return jsonify({
+            'success': False,
+            'error': 'Conversation is not archived'
+        }), 404
+    return jsonify({
+        'success': True,
+        'archive': archive.to_dict()
+    })
+
+@archive_bp.route('/conversations/<conversation_id>/archive', methods=['POST'])
+def archive_conversation(conversation_id):
+    """Archive one completed conversation now"""
+    try:
+        from src.models.conversation import Conversation
+        conversation = Conversation.get_visible_or_404(conversation_id)
+        if conversation.status != 'completed':
+            return jsonify({
+                'success': False,
+                'error': 'Only completed conversations can be archived'
+            }), 400
+        
+        archive = message_archive.archive_conversation(conversation_id)
+        if not archive:
+            return jsonify({
+                'success': False,
+                'error': 'Conversation has no messages left to archive'
+            }), 400
+        return jsonify({
+            'success': True,
+            'archive': archive.to_dict()
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
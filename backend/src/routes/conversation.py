@@ -1,17 +1,29 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from src.models.user import db
-from src.models.conversation import Conversation
+from src.models.conversation import Conversation, ConversationParticipant
 from src.models.message import Message
 from src.models.ai_agent import AIAgent
+from src.services import message_archive
+from src.services.message_render import message_renders, render_array, render_envelope
+from src.services.vector_index import request_backfill
+from src.services.conversation_purge import mark_deleted, request_purge
+from src.services.message_ingest import IngestError, iter_stream_lines, parse_ndjson, ingest_messages, import_transcript
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timedelta
+import json
 import uuid
 
 conversation_bp = Blueprint('conversation', __name__)
 
 @conversation_bp.route('/conversations', methods=['GET'])
 def get_conversations():
-    """Get all conversations"""
+    """Get all conversations, optionally only those an agent takes part in (?agent_id=)"""
     try:
-        conversations = Conversation.query.all()
+        query = Conversation.visible().options(selectinload(Conversation.participant_links))
+        agent_id = request.args.get('agent_id', type=int)
+        if agent_id is not None:
+            query = query.join(ConversationParticipant).filter(ConversationParticipant.agent_id == agent_id)
+        conversations = query.all()
         return jsonify({
             'success': True,
             'conversations': [conv.to_dict() for conv in conversations]
@@ -37,16 +49,47 @@ def create_conversation():
                     'error': f'Missing required field: {field}'
                 }), 400
         
-        # Validate participants exist
+        # Validate participants exist (one IN query for all of them)
         participant_ids = data['participants']
+        found_ids = {
+            agent_id for (agent_id,) in
+            db.session.query(AIAgent.id).filter(AIAgent.id.in_(participant_ids))
+        }
         for agent_id in participant_ids:
-            agent = AIAgent.query.get(agent_id)
-            if not agent:
+            if agent_id not in found_ids:
                 return jsonify({
                     'success': False,
                     'error': f'Agent with ID {agent_id} not found'
                 }), 400
         
+        # Optional per-agent roles, e.g. {"3": "moderator"}
+        raw_roles = data.get('roles') or {}
+        if not isinstance(raw_roles, dict):
+            return jsonify({
+                'success': False,
+                'error': 'roles must be an object of agent ID to role'
+            }), 400
+        roles = {}
+        for agent_id, role in raw_roles.items():
+            try:
+                agent_id = int(agent_id)
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid agent ID in roles: {agent_id}'
+                }), 400
+            if agent_id not in participant_ids:
+                return jsonify({
+                    'success': False,
+                    'error': f'Agent with ID {agent_id} in roles is not a participant'
+                }), 400
+            if not isinstance(role, str) or not role:
+                return jsonify({
+                    'success': False,
+                    'error': f'Role for agent {agent_id} must be a non-empty string'
+                }), 400
+            roles[agent_id] = role
+        
         # Create new conversation
         conversation_id = str(uuid.uuid4())
         conversation = Conversation(
@@ -55,7 +98,7 @@ def create_conversation():
             description=data.get('description', ''),
             status='active'
         )
-        conversation.set_participants(participant_ids)
+        conversation.set_participants(participant_ids, roles)
         
         db.session.add(conversation)
         db.session.commit()
@@ -76,7 +119,7 @@ def create_conversation():
 def get_conversation(conversation_id):
     """Get a specific conversation"""
     try:
-        conversation = Conversation.query.get_or_404(conversation_id)
+        conversation = Conversation.get_visible_or_404(conversation_id)
         return jsonify({
             'success': True,
             'conversation': conversation.to_dict()
@@ -89,13 +132,41 @@ def get_conversation(conversation_id):
 
 @conversation_bp.route('/conversations/<conversation_id>/messages', methods=['GET'])
 def get_conversation_messages(conversation_id):
-    """Get all messages in a conversation"""
+    """Get the messages in a conversation (archived ones included), optionally paged with ?offset=&limit="""
     try:
-        messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp).all()
+        Conversation.get_visible_or_404(conversation_id)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = request.args.get('limit', type=int)
+        messages = message_archive.get_rendered_messages(conversation_id, offset, limit)
+        response = {'success': True}
+        if limit is not None:
+            response['total'] = message_archive.count_conversation_messages(conversation_id)
+            response['offset'] = offset
+        # The messages are already JSON; splice them in rather than re-encoding
+        return Response(render_envelope(response, 'messages', render_array(messages)), mimetype='application/json')
+    except Exception as e:
         return jsonify({
-            'success': True,
-            'messages': [msg.to_dict() for msg in messages]
-        })
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@conversation_bp.route('/conversations/<conversation_id>/export', methods=['GET'])
+def export_conversation(conversation_id):
+    """Download a conversation's full message history as JSON lines"""
+    try:
+        conversation = Conversation.get_visible_or_404(conversation_id)
+        header = json.dumps({'conversation': conversation.to_dict()}) + '\n'
+        
+        def generate():
+            yield header
+            for message in message_archive.iter_rendered_messages(conversation_id):
+                yield message + '\n'
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename=conversation_{conversation_id}.jsonl'}
+        )
     except Exception as e:
         return jsonify({
             'success': False,
@@ -118,7 +189,7 @@ def send_message(conversation_id):
                 }), 400
         
         # Validate conversation exists
-        conversation = Conversation.query.get_or_404(conversation_id)
+        conversation = Conversation.get_visible_or_404(conversation_id)
         
         # Validate sender exists and is part of conversation
         sender_id = data['sender_id']
@@ -141,11 +212,113 @@ def send_message(conversation_id):
         db.session.add(message)
         db.session.commit()
         
+        rendered = message_renders.store(
+            message,
+            getattr(message.sender, 'name', None),
+            getattr(message.receiver, 'name', None)
+        )
+        return Response(render_envelope({'success': True}, 'message', rendered),
+                        status=201, mimetype='application/json')
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def _is_ndjson_upload():
+    return request.mimetype in ('application/x-ndjson', 'application/jsonl')
+
+@conversation_bp.route('/conversations/<conversation_id>/messages/bulk', methods=['POST'])
+def bulk_ingest_messages(conversation_id):
+    """Insert many messages at once.
+
+    The body is a JSON array (or {"messages": [...]}) or, with Content-Type
+    application/x-ndjson, one message per line streamed as it is read.
+    Invalid messages are skipped and reported by index (line number for
+    NDJSON); with ?atomic=1 any invalid message rejects the whole upload.
+    """
+    try:
+        conversation = Conversation.get_visible(conversation_id)
+        if not conversation:
+            return jsonify({
+                'success': False,
+                'error': 'Conversation not found'
+            }), 404
+        
+        if _is_ndjson_upload():
+            records = parse_ndjson(iter_stream_lines(request.stream))
+        else:
+            data = request.get_json(silent=True)
+            messages = data.get('messages') if isinstance(data, dict) else data
+            if not isinstance(messages, list):
+                return jsonify({
+                    'success': False,
+                    'error': 'Expected a JSON array of messages'
+                }), 400
+            records = enumerate(messages)
+        
+        result = ingest_messages(conversation, records, atomic=request.args.get('atomic') == '1')
+        if result['inserted']:
+            request_backfill(current_app._get_current_object())
+        
+        # An empty upload is valid and inserts nothing; only one whose every
+        # message was rejected is an error
+        if result['inserted']:
+            status_code = 201
+        elif result['skipped']:
+            status_code = 400
+        else:
+            status_code = 200
+        return jsonify({
+            'success': status_code != 400,
+            **result
+        }), status_code
+        
+    except IngestError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@conversation_bp.route('/conversations/import', methods=['POST'])
+def import_conversation():
+    """Create a conversation from a transcript.
+
+    Accepts the export format (NDJSON whose first line is {"conversation": {...}})
+    or a JSON object {"conversation": {...}, "messages": [...]}.
+    """
+    try:
+        if _is_ndjson_upload():
+            records = parse_ndjson(iter_stream_lines(request.stream))
+            first = next(records, None)
+            header = first[1].get('conversation') if first and isinstance(first[1], dict) else None
+        else:
+            data = request.get_json(silent=True) or {}
+            header = data.get('conversation')
+            records = enumerate(data.get('messages') or [])
+        
+        result = import_transcript(header, records)
+        if result['inserted']:
+            request_backfill(current_app._get_current_object())
+        
         return jsonify({
             'success': True,
-            'message': message.to_dict()
+            **result
         }), 201
         
+    except IngestError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -157,11 +330,11 @@ def send_message(conversation_id):
 def update_conversation_status(conversation_id):
     """Update conversation status"""
     try:
-        conversation = Conversation.query.get_or_404(conversation_id)
+        conversation = Conversation.get_visible_or_404(conversation_id)
         data = request.get_json()
         
         if 'status' in data:
-            conversation.status = data['status']
+            Conversation.set_status(conversation_id, data['status'])
             db.session.commit()
         
         return jsonify({
@@ -191,7 +364,7 @@ def start_conversation(conversation_id):
             }), 500
         
         # Validate conversation exists
-        conversation = Conversation.query.get_or_404(conversation_id)
+        conversation = Conversation.get_visible_or_404(conversation_id)
         
         # Check if conversation has enough participants
         participants = conversation.get_participants()
@@ -201,22 +374,42 @@ def start_conversation(conversation_id):
                 'error': 'Conversation needs at least 2 participants'
             }), 400
         
-        # Start the conversation
-        success = conversation_orchestrator_hitl.start_conversation(conversation_id)
+        # Start the conversation (optional options such as {"mode": "pipelined"}).
+        # Over the admission caps the start is queued; past the queue limit it is rejected.
+        data = request.get_json(silent=True) or {}
+        result = conversation_orchestrator_hitl.admit_conversation(
+            conversation_id,
+            options=data.get('options')
+        )
         
-        if success:
-            conversation.status = 'active'
-            db.session.commit()
-            
+        if result['status'] == 'active':
+            db.session.refresh(conversation)
             return jsonify({
                 'success': True,
                 'message': 'AI conversation started',
                 'conversation': conversation.to_dict()
             })
+        elif result['status'] == 'queued':
+            db.session.refresh(conversation)
+            return jsonify({
+                'success': True,
+                'message': 'AI conversation queued',
+                'queue_position': result.get('queue_position'),
+                'queue_length': result.get('queue_length'),
+                'conversation': conversation.to_dict()
+            }), 202
+        elif result['status'] == 'rejected':
+            response = jsonify({
+                'success': False,
+                'error': result.get('error'),
+                'retry_after': result.get('retry_after')
+            })
+            response.headers['Retry-After'] = str(result.get('retry_after', 1))
+            return response, 429
         else:
             return jsonify({
                 'success': False,
-                'error': 'Failed to start conversation. Check that agents are active.'
+                'error': result.get('error') or 'Failed to start conversation. Check that agents are active.'
             }), 400
             
     except Exception as e:
@@ -238,13 +431,13 @@ def stop_conversation(conversation_id):
             }), 500
         
         # Validate conversation exists
-        conversation = Conversation.query.get_or_404(conversation_id)
+        conversation = Conversation.get_visible_or_404(conversation_id)
         
         # Stop the conversation
         success = conversation_orchestrator_hitl.stop_conversation(conversation_id)
         
         if success:
-            conversation.status = 'paused'
+            Conversation.set_status(conversation_id, 'paused')
             db.session.commit()
             
             return jsonify({
@@ -276,7 +469,7 @@ def get_active_conversations():
                 'active_conversations': []
             })
         
-        active_conversation_ids = list(conversation_orchestrator_hitl.active_conversations.keys())
+        active_conversation_ids = conversation_orchestrator_hitl.get_active_conversations()
         
         return jsonify({
             'success': True,
@@ -290,29 +483,37 @@ def get_active_conversations():
         }), 500
 
 
+def _stop_before_delete(conversation_ids):
+    """Stop conversations that are running or queued so nothing writes to them after deletion"""
+    from src.services.conversation_orchestrator_hitl import get_orchestrator_hitl
+    orchestrator = get_orchestrator_hitl()
+    if not orchestrator:
+        return
+    for conversation_id in conversation_ids:
+        status = orchestrator.get_conversation_status(conversation_id)
+        if status.get('active') or status.get('queued'):
+            orchestrator.stop_conversation(conversation_id)
+
 @conversation_bp.route('/conversations/<conversation_id>', methods=['DELETE'])
 def delete_conversation(conversation_id):
-    """Delete a conversation and all its messages"""
+    """Delete a conversation and all its messages.
+
+    The conversation disappears from the API immediately; its rows are
+    removed in small batches by the background purge job.
+    """
     try:
         # Find the conversation
-        conversation = Conversation.query.get(conversation_id)
+        conversation = Conversation.get_visible(conversation_id)
         if not conversation:
             return jsonify({
                 'success': False,
                 'error': 'Conversation not found'
             }), 404
         
-        # Stop the conversation if it's active
-        from src.services.conversation_orchestrator_hitl import conversation_orchestrator_hitl
-        if conversation_orchestrator_hitl and conversation_orchestrator_hitl.is_conversation_active(conversation_id):
-            conversation_orchestrator_hitl.stop_conversation(conversation_id)
-        
-        # Delete all messages associated with this conversation
-        Message.query.filter_by(conversation_id=conversation_id).delete()
-        
-        # Delete the conversation
-        db.session.delete(conversation)
+        _stop_before_delete([conversation_id])
+        mark_deleted([conversation_id])
         db.session.commit()
+        request_purge()
         
         return jsonify({
             'success': True,
@@ -326,13 +527,67 @@ def delete_conversation(conversation_id):
             'error': str(e)
         }), 500
 
+@conversation_bp.route('/conversations/delete', methods=['POST'])
+def bulk_delete_conversations():
+    """Delete many conversations: {"ids": [...]} or {"older_than_days": 30, "status": "completed"}.
+
+    older_than_days matches conversations not updated for that long, optionally
+    restricted to one status or a list of statuses.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        query = Conversation.visible()
+        if data.get('ids') is not None:
+            if not isinstance(data['ids'], list):
+                return jsonify({
+                    'success': False,
+                    'error': 'ids must be a list'
+                }), 400
+            query = query.filter(Conversation.id.in_(data['ids']))
+        elif data.get('older_than_days') is not None:
+            try:
+                cutoff = datetime.utcnow() - timedelta(days=float(data['older_than_days']))
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'error': 'older_than_days must be a number'
+                }), 400
+            query = query.filter(Conversation.updated_at < cutoff)
+            statuses = data.get('status')
+            if statuses:
+                query = query.filter(Conversation.status.in_(statuses if isinstance(statuses, list) else [statuses]))
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Provide ids or older_than_days'
+            }), 400
+        
+        conversation_ids = [conversation_id for (conversation_id,) in query.with_entities(Conversation.id)]
+        _stop_before_delete(conversation_ids)
+        deleted = mark_deleted(conversation_ids)
+        db.session.commit()
+        if deleted:
+            request_purge()
+        
+        return jsonify({
+            'success': True,
+            'deleted': deleted,
+            'conversation_ids': conversation_ids
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
 @conversation_bp.route('/conversations/<conversation_id>', methods=['PUT'])
 def update_conversation(conversation_id):
     """Update a conversation's name and description"""
     try:
         # Find the conversation
-        conversation = Conversation.query.get(conversation_id)
+        conversation = Conversation.get_visible(conversation_id)
         if not conversation:
             return jsonify({
                 'success': False,
@@ -0,0 +1,209 @@
+import os
+import time
+from flask import Blueprint, Response, jsonify, request
+from src.models.user import db
+from src.models.conversation import Conversation
+from src.services.event_bus import encode_sse, event_bus
+from src.services.event_emitter import get_room_emitter
+from src.services.event_replay import replay_buffer, replay_messages
+from src.services.event_throttle import inbound_throttle, get_typing_coalescer
+from src.services.message_render import message_renders
+from src.services.presence import presence
+
+realtime_bp = Blueprint('realtime', __name__)
+
+@realtime_bp.route('/realtime/stats', methods=['GET'])
+def realtime_stats():
+    """Counters of the real-time layer in this process: emission, presence, replay, throttling and message renders"""
+    try:
+        room_emitter = get_room_emitter()
+        typing_coalescer = get_typing_coalescer()
+        watched = presence.snapshot()
+        return jsonify({
+            'success': True,
+            'emitter': room_emitter.stats() if room_emitter else None,
+            'presence': {
+                'authoritative': presence.authoritative,
+                'connections': len(presence.connections),
+                'watched_conversations': len(watched),
+                'subscribers': sum(watched.values())
+            },
+            'replay': replay_buffer.stats(),
+            'sse': event_bus.stats(),
+            'throttle': inbound_throttle.stats(),
+            'typing': typing_coalescer.stats() if typing_coalescer else None,
+            'message_cache': message_renders.stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# Seconds between checks of a stream's queue, and between keep-alive comments
+SSE_POLL_SECONDS = float(os.environ.get('AGENTMIX_SSE_POLL_MS', 100)) / 1000.0
+SSE_KEEPALIVE_SECONDS = 15.0
+
+def _parse_last_event_id(value, conversation_ids):
+    """Last seen message id per conversation from a Last-Event-ID.
+
+    Single-conversation streams use the message id; multi-conversation streams
+    use "conversation_id:message_id,..." since ids from different conversations
+    may arrive out of order. A bare id applies to every conversation.
+    """
+    if not value:
+        return {}
+    if ':' not in value:
+        return {conversation_id: int(value) for conversation_id in conversation_ids}
+    last_ids = {}
+    for item in value.split(','):
+        conversation_id, _, message_id = item.rpartition(':')
+        if conversation_id in conversation_ids:
+            last_ids[conversation_id] = int(message_id)
+    return last_ids
+
+def _event_stream(conversation_ids, last_ids):
+    """SSE response for conversations, replaying messages after last_ids first"""
+    max_conversations = int(os.environ.get('AGENTMIX_SSE_MAX_CONVERSATIONS', 20))
+    if len(conversation_ids) > max_conversations:
+        return jsonify({
+            'success': False,
+            'error': f'At most {max_conversations} conversations per stream'
+        }), 400
+    visible = {
+        conversation_id for (conversation_id,) in
+        db.session.query(Conversation.id).filter(
+            Conversation.id.in_(conversation_ids),
+            Conversation.status != 'deleted'
+        )
+    }
+    missing = [conversation_id for conversation_id in conversation_ids if conversation_id not in visible]
+    if missing:
+        return jsonify({
+            'success': False,
+            'error': f'Conversation {missing[0]} not found'
+        }), 404
+
+    single = len(conversation_ids) == 1
+    last_ids = dict(last_ids)
+    replayed_upto = {}
+
+    def event_id():
+        if single:
+            return str(last_ids[conversation_ids[0]])
+        return ','.join(f'{conversation_id}:{message_id}' for conversation_id, message_id in last_ids.items())
+
+    # Subscribe before reading the replay so nothing falls between the two
+    subscription = event_bus.subscribe(conversation_ids)
+    try:
+        replay = []
+        for conversation_id, last_seen_id in last_ids.items():
+            messages, truncated = replay_messages(conversation_id, last_seen_id)
+            replay.extend((conversation_id, message) for message in messages)
+            if truncated:
+                replay.append((conversation_id, None))
+    except Exception:
+        event_bus.unsubscribe(subscription)
+        raise
+    finally:
+        # The stream outlives the request's use of the database
+        db.session.remove()
+
+    room_emitter = get_room_emitter()
+    sleep = room_emitter.sleep if room_emitter else time.sleep
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            for conversation_id, message in replay:
+                if message is None:
+                    yield encode_sse('replay_truncated', {'conversation_id': conversation_id})
+                    continue
+                last_ids[conversation_id] = replayed_upto[conversation_id] = message['id']
+                yield f'id: {event_id()}\n' + encode_sse('new_message', {
+                    'conversation_id': conversation_id,
+                    'message': message
+                })
+            idle_since = time.monotonic()
+            while not subscription.overflowed:
+                items = subscription.drain()
+                if not items:
+                    if time.monotonic() - idle_since >= SSE_KEEPALIVE_SECONDS:
+                        idle_since = time.monotonic()
+                        yield ': keep-alive\n\n'
+                    sleep(SSE_POLL_SECONDS)
+                    continue
+                idle_since = time.monotonic()
+                chunk = []
+                for conversation_id, message_id, encoded in items:
+                    if message_id is None:
+                        chunk.append(encoded)
+                    elif message_id > replayed_upto.get(conversation_id, 0):
+                        # (replayed messages can also arrive live; those are skipped)
+                        last_ids[conversation_id] = max(message_id, last_ids.get(conversation_id, 0))
+                        chunk.append(f'id: {event_id()}\n' + encoded)
+                if chunk:
+                    yield ''.join(chunk)
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Keep nginx and similar proxies from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
+
+@realtime_bp.route('/conversations/<conversation_id>/events', methods=['GET'])
+def conversation_events(conversation_id):
+    """Server-Sent Events stream of a conversation's events.
+
+    Each new_message carries its message id as the SSE id; reconnecting
+    clients send it back as Last-Event-ID (or ?last_event_id= on the first
+    connect) and get only the messages they missed.
+    """
+    try:
+        last_ids = _parse_last_event_id(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id'),
+            [conversation_id]
+        )
+        return _event_stream([conversation_id], last_ids)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Last-Event-ID must be a message id'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@realtime_bp.route('/events', methods=['GET'])
+def multi_conversation_events():
+    """Server-Sent Events stream of several conversations (?conversation_ids=a,b,...)"""
+    conversation_ids = list(dict.fromkeys(
+        conversation_id.strip()
+        for conversation_id in (request.args.get('conversation_ids') or '').split(',')
+        if conversation_id.strip()
+    ))
+    if not conversation_ids:
+        return jsonify({
+            'success': False,
+            'error': 'Missing required parameter: conversation_ids'
+        }), 400
+    try:
+        last_ids = _parse_last_event_id(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id'),
+            conversation_ids
+        )
+        return _event_stream(conversation_ids, last_ids)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Last-Event-ID must be "conversation_id:message_id,..." or a message id'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
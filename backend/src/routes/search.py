@@ -0,0 +1,59 @@
+from flask import Blueprint, request, jsonify
+from datetime import datetime
+from src.services.message_search import search_messages, SearchQueryError
+
+search_bp = Blueprint('search', __name__)
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+@search_bp.route('/search/messages', methods=['GET'])
+def search_message_history():
+    """Full-text search over messages.
+
+    Query parameters: q (required), conversation_id, agent_id, since/until
+    (ISO dates), page, per_page (max 100), advanced=1 for raw FTS syntax,
+    total=1 to include an exact result count.
+    """
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': 'Missing required parameter: q'
+        }), 400
+    
+    try:
+        since = _parse_datetime(request.args.get('since'))
+        until = _parse_datetime(request.args.get('until'))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'since and until must be ISO 8601 dates'
+        }), 400
+    
+    try:
+        result = search_messages(
+            query,
+            conversation_id=request.args.get('conversation_id'),
+            agent_id=request.args.get('agent_id', type=int),
+            since=since,
+            until=until,
+            page=max(1, request.args.get('page', 1, type=int)),
+            per_page=min(100, max(1, request.args.get('per_page', 20, type=int))),
+            advanced=request.args.get('advanced') == '1',
+            with_total=request.args.get('total') == '1'
+        )
+        return jsonify({
+            'success': True,
+            **result
+        })
+    except SearchQueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
@@ -1,56 +1,149 @@
+import functools
 from flask_socketio import emit, join_room, leave_room
 from flask import request
-from ..services.conversation_orchestrator_hitl import conversation_orchestrator_hitl
+from ..services.conversation_orchestrator_hitl import get_orchestrator_hitl
+from ..services import event_codec
+from ..services.event_emitter import batch_room, conversation_room, conversation_rooms, packed_room, render_frames
+from ..services.event_replay import replay_messages
+from ..services.presence import presence
+from ..services.event_throttle import inbound_throttle, init_typing_coalescer
 
 def init_websocket_events_hitl(socketio):
     """Initialize WebSocket events for HITL support"""
+    # Resolved here rather than at import time: the orchestrator (in-process or
+    # sharded) is only created once the app is configured
+    conversation_orchestrator_hitl = get_orchestrator_hitl()
+    
+    def on_limited(event):
+        """socketio.on for client events, charged to the sender's token bucket"""
+        def decorator(handler):
+            @functools.wraps(handler)
+            def limited(*args):
+                allowed, first_drop, retry_after = inbound_throttle.check(request.sid, event)
+                if not allowed:
+                    if first_drop:
+                        emit('rate_limited', {'event': event, 'retry_after': round(retry_after, 2)})
+                    return None
+                return handler(*args)
+            return socketio.on(event)(limited)
+        return decorator
+    
+    def relay_typing(conversation_id, sid, user_name, typing):
+        socketio.emit('user_typing', {
+            'conversation_id': conversation_id,
+            'user_name': user_name,
+            'typing': typing
+        }, room=conversation_rooms(conversation_id), skip_sid=sid)
+    
+    typing_coalescer = init_typing_coalescer(relay_typing)
     
     @socketio.on('connect')
     def handle_connect():
         """Handle client connection"""
         print(f"Client connected: {request.sid}")
+        presence.connect(request.sid)
         emit('connected', {'status': 'Connected to AgentMix Platform'})
     
     @socketio.on('disconnect')
     def handle_disconnect():
         """Handle client disconnection"""
         print(f"Client disconnected: {request.sid}")
+        presence.disconnect(request.sid)
+        inbound_throttle.forget(request.sid)
+        typing_coalescer.leave(request.sid)
     
-    @socketio.on('join_conversation')
+    @on_limited('join_conversation')
     def handle_join_conversation(data):
-        """Join a conversation room"""
+        """Join a conversation room.
+
+        With 'batch' events arrive as event_batch frames; with encoding
+        'msgpack' as binary event_packed frames, or as event_batch frames when
+        the server has no MessagePack support. A client that sends
+        'last_seen_id' is first sent the messages it missed, in the same form.
+        """
         conversation_id = data.get('conversation_id')
         if conversation_id:
-            join_room(f'conversation_{conversation_id}')
-            emit('joined_conversation', {
+            encoding = 'msgpack' if data.get('encoding') == 'msgpack' and event_codec.available() else 'json'
+            batched = bool(data.get('batch')) or data.get('encoding') == 'msgpack'
+            if encoding == 'msgpack':
+                mode, room = 'msgpack', packed_room(conversation_id)
+            elif batched:
+                mode, room = 'batch', batch_room(conversation_id)
+            else:
+                mode, room = 'events', conversation_room(conversation_id)
+            for other in conversation_rooms(conversation_id):
+                if other != room:
+                    leave_room(other)
+                    presence.leave(request.sid, other)
+            # Join before reading the replay so nothing falls between the two
+            join_room(room)
+            presence.join(request.sid, room)
+            joined = {
                 'conversation_id': conversation_id,
-                'status': 'Joined conversation'
-            })
+                'status': 'Joined conversation',
+                'batch': batched,
+                'encoding': encoding
+            }
+            if encoding == 'msgpack':
+                joined['codes'] = event_codec.codebook()
+
+            last_seen_id = data.get('last_seen_id')
+            if last_seen_id is not None:
+                try:
+                    messages, truncated = replay_messages(conversation_id, int(last_seen_id))
+                    events = [
+                        ('new_message', {'conversation_id': conversation_id, 'message': message})
+                        for message in messages
+                    ]
+                    if events:
+                        for event, payload in render_frames(conversation_id, events, mode):
+                            emit(event, payload)
+                    joined['replayed'] = len(messages)
+                    joined['replay_truncated'] = truncated
+                except (TypeError, ValueError):
+                    joined['replay_error'] = 'last_seen_id must be a message id'
+                except Exception as e:
+                    print(f"Error replaying conversation {conversation_id}: {e}")
+                    joined['replay_error'] = str(e)
+            emit('joined_conversation', joined)
     
-    @socketio.on('leave_conversation')
+    @on_limited('leave_conversation')
     def handle_leave_conversation(data):
         """Leave a conversation room"""
         conversation_id = data.get('conversation_id')
         if conversation_id:
-            leave_room(f'conversation_{conversation_id}')
+            for room in conversation_rooms(conversation_id):
+                leave_room(room)
+                presence.leave(request.sid, room)
+            typing_coalescer.leave(request.sid, conversation_id)
             emit('left_conversation', {
                 'conversation_id': conversation_id,
                 'status': 'Left conversation'
             })
     
-    @socketio.on('start_conversation')
+    @on_limited('start_conversation')
     def handle_start_conversation(data):
         """Start an AI-to-AI conversation"""
         conversation_id = data.get('conversation_id')
         if conversation_id and conversation_orchestrator_hitl:
-            success = conversation_orchestrator_hitl.start_conversation(conversation_id)
+            result = conversation_orchestrator_hitl.admit_conversation(
+                conversation_id,
+                options=data.get('options')
+            )
+            messages = {
+                'active': 'Conversation started successfully',
+                'queued': 'Conversation queued until capacity frees up'
+            }
             emit('conversation_start_result', {
                 'conversation_id': conversation_id,
-                'success': success,
-                'message': 'Conversation started successfully' if success else 'Failed to start conversation'
+                'success': result['success'],
+                'status': result['status'],
+                'queue_position': result.get('queue_position'),
+                'retry_after': result.get('retry_after'),
+                'message': messages.get(result['status'], result.get('error') or 'Failed to start conversation')
             })
     
-    @socketio.on('stop_conversation')
+    @on_limited('stop_conversation')
     def handle_stop_conversation(data):
         """Stop an AI-to-AI conversation"""
         conversation_id = data.get('conversation_id')
@@ -62,7 +155,7 @@ def init_websocket_events_hitl(socketio):
                 'message': 'Conversation stopped successfully' if success else 'Failed to stop conversation'
             })
     
-    @socketio.on('pause_conversation')
+    @on_limited('pause_conversation')
     def handle_pause_conversation(data):
         """Pause a conversation for human input"""
         conversation_id = data.get('conversation_id')
@@ -76,7 +169,7 @@ def init_websocket_events_hitl(socketio):
                 'message': 'Conversation paused successfully' if success else 'Failed to pause conversation'
             })
     
-    @socketio.on('resume_conversation')
+    @on_limited('resume_conversation')
     def handle_resume_conversation(data):
         """Resume a paused conversation"""
         conversation_id = data.get('conversation_id')
@@ -89,7 +182,7 @@ def init_websocket_events_hitl(socketio):
                 'message': 'Conversation resumed successfully' if success else 'Failed to resume conversation'
             })
     
-    @socketio.on('send_human_message')
+    @on_limited('send_human_message')
     def handle_send_human_message(data):
         """Send a message from human participant"""
         try:
@@ -146,7 +239,7 @@ def init_websocket_events_hitl(socketio):
                 'message': f'Error: {str(e)}'
             })
     
-    @socketio.on('request_human_input')
+    @on_limited('request_human_input')
     def handle_request_human_input(data):
         """Handle AI request for human input"""
         conversation_id = data.get('conversation_id')
@@ -165,7 +258,7 @@ def init_websocket_events_hitl(socketio):
                 'message': 'Human input requested successfully' if success else 'Failed to request human input'
             })
     
-    @socketio.on('get_conversation_status')
+    @on_limited('get_conversation_status')
     def handle_get_conversation_status(data):
         """Get detailed conversation status"""
         conversation_id = data.get('conversation_id')
@@ -177,31 +270,19 @@ def init_websocket_events_hitl(socketio):
                 'status': status
             })
     
-    @socketio.on('typing_start')
+    @on_limited('typing_start')
     def handle_typing_start(data):
-        """Handle user typing indicator"""
+        """Handle user typing indicator (coalesced, see event_throttle)"""
         conversation_id = data.get('conversation_id')
-        user_name = data.get('user_name', 'User')
-        
         if conversation_id:
-            emit('user_typing', {
-                'conversation_id': conversation_id,
-                'user_name': user_name,
-                'typing': True
-            }, room=f'conversation_{conversation_id}', include_self=False)
+            typing_coalescer.update(conversation_id, request.sid, data.get('user_name', 'User'), True)
     
-    @socketio.on('typing_stop')
+    @on_limited('typing_stop')
     def handle_typing_stop(data):
         """Handle user stop typing indicator"""
         conversation_id = data.get('conversation_id')
-        user_name = data.get('user_name', 'User')
-        
         if conversation_id:
-            emit('user_typing', {
-                'conversation_id': conversation_id,
-                'user_name': user_name,
-                'typing': False
-            }, room=f'conversation_{conversation_id}', include_self=False)
+            typing_coalescer.update(conversation_id, request.sid, data.get('user_name', 'User'), False)
     
     return socketio
 
@@ -0,0 +1,182 @@
+"""
+Admission control for conversation starts.
+
+Caps how many conversations run at once, globally and per AI provider, so a
+burst of starts degrades into a queue instead of every conversation hammering
+the providers at the same time. Starts over the caps wait in a lane queue
+(FIFO within a lane, weighted fair across lanes; see services/lanes.py); past
+the maximum queue length they are rejected with a retry hint.
+
+Configuration (0 means unlimited):
+    AGENTMIX_MAX_ACTIVE_CONVERSATIONS        cap on running conversations
+    AGENTMIX_MAX_ACTIVE_PER_PROVIDER         default cap per provider
+    AGENTMIX_PROVIDER_CONVERSATION_LIMITS    per-provider overrides, e.g. "openai=4,anthropic=2"
+    AGENTMIX_MAX_QUEUED_CONVERSATIONS        queue length before starts are rejected (default 100)
+
+Caps apply per orchestrator process. With sharded orchestrator workers each
+worker admits against its share of every cap (see from_env), so the workers
+together stay within the configured limits as long as each cap is at least the
+number of workers; a cap below that still gives every worker one slot.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from src.services.lanes import LaneQueue, DEFAULT_LANE, parse_limits
+
+# Starting estimate of how long a conversation holds its slot, refined as
+# conversations finish
+DEFAULT_CONVERSATION_SECONDS = 60.0
+DURATION_SMOOTHING = 0.2
+
+
+class AdmissionController:
+    """Tracks running conversations and queues starts that exceed the caps"""
+
+    def __init__(self, max_active: int = 0, max_per_provider: int = 0,
+                 provider_limits: Dict[str, int] = None, max_queued: int = 100):
+        self.max_active = max_active
+        self.max_per_provider = max_per_provider
+        self.provider_limits = provider_limits or {}
+        self.max_queued = max_queued
+        self.lock = threading.Lock()
+        self.active = {}           # conversation_id -> {'providers', 'started_at'}
+        self.provider_counts = {}  # provider -> running conversations using it
+        self.queue = LaneQueue()   # queued conversation_ids
+        self.queued = {}           # conversation_id -> {'providers', 'options', 'lane', 'queued_at'}
+        self.average_duration = DEFAULT_CONVERSATION_SECONDS
+
+    @classmethod
+    def from_env(cls, shard: int = 0, shards: int = 1) -> 'AdmissionController':
+        """Caps from the environment, or shard ``shard``'s share of them out of ``shards``"""
+        def share(limit: int) -> int:
+            if not limit or shards <= 1:
+                return limit
+            # Split evenly, the remainder going to the lowest shards; 0 would mean unlimited
+            return max(1, limit // shards + (1 if shard < limit % shards else 0))
+
+        provider_limits = parse_limits(os.environ.get('AGENTMIX_PROVIDER_CONVERSATION_LIMITS', ''))
+        return cls(
+            max_active=share(int(os.environ.get('AGENTMIX_MAX_ACTIVE_CONVERSATIONS', 0))),
+            max_per_provider=share(int(os.environ.get('AGENTMIX_MAX_ACTIVE_PER_PROVIDER', 0))),
+            provider_limits={provider: share(limit) for provider, limit in provider_limits.items()},
+            max_queued=share(int(os.environ.get('AGENTMIX_MAX_QUEUED_CONVERSATIONS', 100)))
+        )
+
+    def provider_limit(self, provider: str) -> int:
+        return self.provider_limits.get(provider, self.max_per_provider)
+
+    def _has_capacity(self, providers: Iterable[str]) -> bool:
+        if self.max_active and len(self.active) >= self.max_active:
+            return False
+        for provider in providers:
+            limit = self.provider_limit(provider)
+            if limit and self.provider_counts.get(provider, 0) >= limit:
+                return False
+        return True
+
+    def _activate(self, conversation_id: str, providers: Iterable[str]):
+        providers = set(providers)
+        self.active[conversation_id] = {'providers': providers, 'started_at': time.time()}
+        for provider in providers:
+            self.provider_counts[provider] = self.provider_counts.get(provider, 0) + 1
+
+    def admit(self, conversation_id: str, providers: Iterable[str], options: Dict[str, Any] = None,
+              lane: str = DEFAULT_LANE, force: bool = False) -> Dict[str, Any]:
+        """Admit, queue or reject a conversation start.
+
+        Returns {'status': 'active'|'queued'|'rejected', ...} with the queue
+        position for queued starts and a retry_after hint (seconds) for rejected
+        ones. ``force`` admits regardless of the caps (recovered conversations).
+        """
+        providers = set(providers)
+        options = options or {}
+        with self.lock:
+            if conversation_id in self.active:
+                return {'status': 'active'}
+            if conversation_id in self.queued:
+                return {'status': 'queued', 'queue_position': self._position(conversation_id),
+                        'queue_length': len(self.queued)}
+
+            # Queued starts are admitted whenever capacity frees up, so every one
+            # still waiting needs a slot that is full. A start whose own providers
+            # have room therefore overtakes nobody and is admitted at once.
+            if force or self._has_capacity(providers):
+                self._activate(conversation_id, providers)
+                return {'status': 'active'}
+
+            if self.max_queued and len(self.queued) >= self.max_queued:
+                return {'status': 'rejected', 'retry_after': self._retry_after(len(self.queued))}
+
+            self.queue.push(conversation_id, lane)
+            self.queued[conversation_id] = {
+                'providers': providers,
+                'options': options,
+                'lane': lane,
+                'queued_at': time.time()
+            }
+            return {'status': 'queued', 'queue_position': self._position(conversation_id),
+                    'queue_length': len(self.queued)}
+
+    def release(self, conversation_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Free a finished (or cancelled) conversation's slot.
+
+        Returns the queued conversations admitted into the freed capacity as
+        (conversation_id, options) pairs, in admission order.
+        """
+        with self.lock:
+            entry = self.active.pop(conversation_id, None)
+            if entry:
+                for provider in entry['providers']:
+                    self.provider_counts[provider] = max(0, self.provider_counts.get(provider, 0) - 1)
+                duration = time.time() - entry['started_at']
+                self.average_duration += DURATION_SMOOTHING * (duration - self.average_duration)
+            if self.queued.pop(conversation_id, None):
+                self.queue.remove(conversation_id)
+            return self._admit_queued()
+
+    def _admit_queued(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Admit queued starts lane by lane, skipping ones whose provider is still full"""
+        admitted = []
+        while not self.max_active or len(self.active) < self.max_active:
+            conversation_id = self.queue.pop(
+                lambda queued_id: self._has_capacity(self.queued[queued_id]['providers'])
+            )
+            if conversation_id is None:
+                break
+            entry = self.queued.pop(conversation_id)
+            self._activate(conversation_id, entry['providers'])
+            admitted.append((conversation_id, entry['options']))
+        return admitted
+
+    def _position(self, conversation_id: str) -> Optional[int]:
+        """1-based position of a queued conversation"""
+        ordered = self.queue.ordered()
+        return ordered.index(conversation_id) + 1 if conversation_id in ordered else None
+
+    def _retry_after(self, queue_length: int) -> int:
+        """Estimate seconds until a new start could be queued again"""
+        slots = self.max_active or max(1, len(self.active))
+        estimate = self.average_duration * (queue_length + 1) / slots
+        return max(1, min(3600, int(math.ceil(estimate))))
+
+    def queue_positions(self) -> Dict[str, int]:
+        """Current 1-based position of every queued conversation"""
+        with self.lock:
+            return {conversation_id: i + 1 for i, conversation_id in enumerate(self.queue.ordered())}
+
+    def is_queued(self, conversation_id: str) -> bool:
+        return conversation_id in self.queued
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'active': len(self.active),
+                'queued': len(self.queued),
+                'queued_by_lane': self.queue.lane_lengths(),
+                'max_active': self.max_active,
+                'provider_counts': dict(self.provider_counts),
+                'average_duration': round(self.average_duration, 1)
+            }
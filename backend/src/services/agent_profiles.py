@@ -0,0 +1,121 @@
+"""
+Process-wide cache of parsed agent profiles.
+
+Conversation turns need an agent's provider, model, key, parsed config and
+system prompt on every call. Reading the AIAgent row and json-decoding its
+config each time is wasted work, so turns read an immutable AgentProfile from
+this cache instead. Routes that change an agent (update, activate, deactivate,
+delete) invalidate its entry; the next turn reloads it from the database.
+"""
+
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from src.models.ai_agent import AIAgent
+from src.services.ai_provider_enhanced import enhanced_ai_provider_service
+
+
+@dataclass(frozen=True)
+class AgentProfile:
+    """Immutable snapshot of an agent, as used by conversation turns"""
+    id: int
+    name: str
+    provider: str
+    model: str
+    api_key: str
+    status: str
+    config: Mapping[str, Any]
+    prompt_prefix: Tuple[str, ...]   # agent-specific system prompt blocks
+    client: Any                      # provider service used to call the model
+
+    @classmethod
+    def from_agent(cls, agent: AIAgent) -> 'AgentProfile':
+        config = agent.get_config()
+        system_message = config.get('system_message', '')
+        return cls(
+            id=agent.id,
+            name=agent.name,
+            provider=agent.provider,
+            model=agent.model,
+            api_key=agent.api_key,
+            status=agent.status,
+            config=MappingProxyType(config),
+            prompt_prefix=(system_message,) if system_message else (),
+            client=enhanced_ai_provider_service
+        )
+
+    def get_config(self) -> Dict[str, Any]:
+        return dict(self.config)
+
+
+class AgentProfileCache:
+    """Thread-safe map of agent id to AgentProfile, filled from the database on miss"""
+
+    def __init__(self):
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every invalidation so a load racing with one is not cached
+        self.version = 0
+
+    def get(self, agent_id: int) -> Optional[AgentProfile]:
+        """Get an agent's profile, loading it if needed (requires an app context on a miss)"""
+        with self.lock:
+            profile = self.profiles.get(agent_id)
+            if profile is not None:
+                self.hits += 1
+                return profile
+            self.misses += 1
+            version = self.version
+
+        agent = AIAgent.query.get(agent_id)
+        if not agent:
+            return None
+        profile = AgentProfile.from_agent(agent)
+        with self.lock:
+            if self.version == version:
+                self.profiles[agent_id] = profile
+        return profile
+
+    def get_many(self, agent_ids: List[int]) -> List[AgentProfile]:
+        """Get profiles for several agents in the given order, loading misses with one IN query.
+
+        Agents that no longer exist are left out.
+        """
+        with self.lock:
+            found = {agent_id: self.profiles[agent_id] for agent_id in agent_ids if agent_id in self.profiles}
+            missing = [agent_id for agent_id in agent_ids if agent_id not in found]
+            self.hits += len(found)
+            self.misses += len(missing)
+            version = self.version
+
+        if missing:
+            loaded = {
+                agent.id: AgentProfile.from_agent(agent)
+                for agent in AIAgent.query.filter(AIAgent.id.in_(missing)).all()
+            }
+            with self.lock:
+                if self.version == version:
+                    self.profiles.update(loaded)
+            found.update(loaded)
+        return [found[agent_id] for agent_id in agent_ids if agent_id in found]
+
+    def invalidate(self, agent_id: int):
+        with self.lock:
+            self.version += 1
+            self.profiles.pop(agent_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.profiles.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'size': len(self.profiles), 'hits': self.hits, 'misses': self.misses}
+
+
+# Global instance
+agent_profile_cache = AgentProfileCache()
@@ -1,7 +1,7 @@
 import openai
 import requests
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 
 class EnhancedAIProviderService:
     """Enhanced service for managing multiple AI providers including free options"""
@@ -552,7 +552,8 @@ class EnhancedAIProviderService:
                         'content': result['choices'][0]['message']['content'],
                         'model': model,
                         'provider': 'together'
-                    }
+                    },
+                    'usage': self._normalize_usage(result.get('usage'))
                 }
             else:
                 return {'success': False, 'error': f'API Error: {response.status_code} - {response.text}'}
@@ -589,7 +590,8 @@ class EnhancedAIProviderService:
                         'content': result['choices'][0]['message']['content'],
                         'model': model,
                         'provider': 'groq'
-                    }
+                    },
+                    'usage': self._normalize_usage(result.get('usage'))
                 }
             else:
                 return {'success': False, 'error': f'API Error: {response.status_code} - {response.text}'}
@@ -655,21 +657,9 @@ class EnhancedAIProviderService:
                 'Content-Type': 'application/json'
             }
             
-            # Convert messages to Ollama format
-            prompt = ""
-            for msg in messages:
-                if msg['role'] == 'system':
-                    prompt += f"System: {msg['content']}\n"
-                elif msg['role'] == 'user':
-                    prompt += f"User: {msg['content']}\n"
-                elif msg['role'] == 'assistant':
-                    prompt += f"Assistant: {msg['content']}\n"
-            
-            prompt += "Assistant: "
-            
             data = {
                 'model': model,
-                'prompt': prompt,
+                'messages': messages,
                 'stream': False,
                 'options': {
                     'temperature': config.get('temperature', 0.7) if config else 0.7,
@@ -678,7 +668,7 @@ class EnhancedAIProviderService:
             }
             
             response = requests.post(
-                'http://localhost:11434/api/generate',
+                'http://localhost:11434/api/chat',
                 headers=headers,
                 json=data,
                 timeout=30
@@ -689,9 +679,13 @@ class EnhancedAIProviderService:
                 return {
                     'success': True,
                     'response': {
-                        'content': result.get('response', '').strip(),
+                        'content': result.get('message', {}).get('content', '').strip(),
                         'model': model,
                         'provider': 'ollama'
+                    },
+                    'usage': {
+                        'input_tokens': result.get('prompt_eval_count', 0),
+                        'output_tokens': result.get('eval_count', 0)
                     }
                 }
             else:
@@ -732,7 +726,8 @@ class EnhancedAIProviderService:
                         'content': result['choices'][0]['message']['content'],
                         'model': model,
                         'provider': 'lmstudio'
-                    }
+                    },
+                    'usage': self._normalize_usage(result.get('usage'))
                 }
             else:
                 return {'success': False, 'error': f'LM Studio API Error: {response.status_code} - {response.text}'}
@@ -814,22 +809,80 @@ class EnhancedAIProviderService:
         
         return providers_list
 
-    def generate_response(self, provider: str, model: str, api_key: str, prompt: str, max_tokens: int = 150) -> str:
+    def generate_response(self, provider: str, model: str, api_key: str, prompt: str = None, max_tokens: int = 150,
+                          messages: List[Dict] = None, cache_key: str = None) -> str:
         """Generate AI response using the specified provider and model"""
+        return self.generate_response_with_usage(
+            provider, model, api_key, prompt, max_tokens,
+            messages=messages, cache_key=cache_key
+        )['content']
+
+    def generate_response_with_usage(self, provider: str, model: str, api_key: str, prompt: str = None, max_tokens: int = 150,
+                                     messages: List[Dict] = None, cache_key: str = None) -> Dict[str, Any]:
+        """Generate AI response and report token usage, including prompt cache hits.
+
+        ``messages`` is an OpenAI-style role-tagged list (``system``, ``user``,
+        ``assistant``); a bare ``prompt`` is treated as a single user message.
+        Leading system messages are the stable prefix: Anthropic gets explicit
+        ``cache_control`` markers on them, OpenAI-compatible APIs receive them
+        unchanged at the front of the request (plus a ``prompt_cache_key`` for
+        OpenAI routing).
+        """
+        if messages is None:
+            messages = [{'role': 'user', 'content': prompt or ''}]
+        messages = [msg for msg in messages if msg.get('content')]
         try:
             if provider == 'openrouter':
-                return self._generate_openrouter_response(model, api_key, prompt, max_tokens)
+                return self._generate_openrouter_response(model, api_key, messages, max_tokens)
             elif provider == 'openai':
-                return self._generate_openai_response(model, api_key, prompt, max_tokens)
+                return self._generate_openai_response(model, api_key, messages, max_tokens, cache_key)
             elif provider == 'anthropic':
-                return self._generate_anthropic_response(model, api_key, prompt, max_tokens)
+                return self._generate_anthropic_response(model, api_key, messages, max_tokens)
+            elif provider in self.providers:
+                result = self.call_ai(provider, model, api_key, messages, {'max_tokens': max_tokens})
+                if result['success']:
+                    return {
+                        'content': (result['response']['content'] or '').strip(),
+                        'usage': result.get('usage', {})
+                    }
+                return {'content': f"Error: {result['error']}", 'usage': {}}
             else:
-                return f"Provider {provider} not supported"
+                return {'content': f"Provider {provider} not supported", 'usage': {}}
         except Exception as e:
             print(f"Error generating response: {e}")
-            return f"Error: {str(e)}"
-    
-    def _generate_openrouter_response(self, model: str, api_key: str, prompt: str, max_tokens: int) -> str:
+            return {'content': f"Error: {str(e)}", 'usage': {}}
+
+    def _split_system_messages(self, messages: List[Dict]) -> Tuple[List[str], List[Dict]]:
+        """Separate system blocks from the user/assistant turns"""
+        system_blocks = [msg['content'] for msg in messages if msg['role'] == 'system']
+        turns = [msg for msg in messages if msg['role'] != 'system']
+        return system_blocks, turns
+
+    def _merge_consecutive_turns(self, turns: List[Dict]) -> List[Dict]:
+        """Collapse adjacent same-role turns for APIs that require alternation"""
+        merged = []
+        for msg in turns:
+            if merged and merged[-1]['role'] == msg['role']:
+                merged[-1] = {'role': msg['role'], 'content': merged[-1]['content'] + "\n" + msg['content']}
+            else:
+                merged.append({'role': msg['role'], 'content': msg['content']})
+        if merged and merged[0]['role'] != 'user':
+            merged.insert(0, {'role': 'user', 'content': '(conversation so far)'})
+        return merged
+
+    def _normalize_usage(self, usage: Dict[str, Any]) -> Dict[str, int]:
+        """Map OpenAI-style and Anthropic-style usage blocks onto one shape"""
+        if not usage:
+            return {}
+        details = usage.get('prompt_tokens_details') or {}
+        return {
+            'input_tokens': usage.get('prompt_tokens', usage.get('input_tokens', 0)) or 0,
+            'output_tokens': usage.get('completion_tokens', usage.get('output_tokens', 0)) or 0,
+            'cached_tokens': details.get('cached_tokens', usage.get('cache_read_input_tokens', 0)) or 0,
+            'cache_creation_tokens': usage.get('cache_creation_input_tokens', 0) or 0
+        }
+
+    def _generate_openrouter_response(self, model: str, api_key: str, messages: List[Dict], max_tokens: int) -> Dict[str, Any]:
         """Generate response using OpenRouter API"""
         try:
             headers = {
@@ -839,11 +892,16 @@ class EnhancedAIProviderService:
                 'X-Title': 'AgentMix'
             }
             
+            system_blocks, turns = self._split_system_messages(messages)
+            if system_blocks and model.startswith('anthropic/'):
+                # OpenRouter forwards cache_control breakpoints to Anthropic models
+                parts = [{'type': 'text', 'text': block} for block in system_blocks]
+                parts[-1]['cache_control'] = {'type': 'ephemeral'}
+                messages = [{'role': 'system', 'content': parts}] + turns
+            
             data = {
                 'model': model,
-                'messages': [
-                    {'role': 'user', 'content': prompt}
-                ],
+                'messages': messages,
                 'max_tokens': max_tokens,
                 'temperature': 0.7
             }
@@ -858,36 +916,47 @@ class EnhancedAIProviderService:
             if response.status_code == 200:
                 result = response.json()
                 if 'choices' in result and len(result['choices']) > 0:
-                    return result['choices'][0]['message']['content'].strip()
+                    return {
+                        'content': result['choices'][0]['message']['content'].strip(),
+                        'usage': self._normalize_usage(result.get('usage'))
+                    }
                 else:
-                    return "No response generated"
+                    return {'content': "No response generated", 'usage': {}}
             else:
-                return f"API Error: {response.status_code} - {response.text}"
+                return {'content': f"API Error: {response.status_code} - {response.text}", 'usage': {}}
                 
         except Exception as e:
-            return f"Error: {str(e)}"
+            return {'content': f"Error: {str(e)}", 'usage': {}}
     
-    def _generate_openai_response(self, model: str, api_key: str, prompt: str, max_tokens: int) -> str:
+    def _generate_openai_response(self, model: str, api_key: str, messages: List[Dict], max_tokens: int,
+                                  cache_key: str = None) -> Dict[str, Any]:
         """Generate response using OpenAI API"""
         try:
             import openai
             client = openai.OpenAI(api_key=api_key)
             
+            # OpenAI caches identical prompt prefixes automatically
+            kwargs = {}
+            if cache_key:
+                kwargs['prompt_cache_key'] = cache_key
+            
             response = client.chat.completions.create(
                 model=model,
-                messages=[
-                    {'role': 'user', 'content': prompt}
-                ],
+                messages=messages,
                 max_tokens=max_tokens,
-                temperature=0.7
+                temperature=0.7,
+                **kwargs
             )
             
-            return response.choices[0].message.content.strip()
+            return {
+                'content': response.choices[0].message.content.strip(),
+                'usage': self._normalize_usage(response.usage.model_dump() if response.usage else None)
+            }
             
         except Exception as e:
-            return f"Error: {str(e)}"
+            return {'content': f"Error: {str(e)}", 'usage': {}}
     
-    def _generate_anthropic_response(self, model: str, api_key: str, prompt: str, max_tokens: int) -> str:
+    def _generate_anthropic_response(self, model: str, api_key: str, messages: List[Dict], max_tokens: int) -> Dict[str, Any]:
         """Generate response using Anthropic API"""
         try:
             headers = {
@@ -896,14 +965,18 @@ class EnhancedAIProviderService:
                 'anthropic-version': '2023-06-01'
             }
             
+            system_blocks, turns = self._split_system_messages(messages)
             data = {
                 'model': model,
                 'max_tokens': max_tokens,
-                'messages': [
-                    {'role': 'user', 'content': prompt}
-                ]
+                'messages': self._merge_consecutive_turns(turns)
             }
             
+            if system_blocks:
+                # Cache breakpoint on the last stable block covers the whole prefix
+                data['system'] = [{'type': 'text', 'text': block} for block in system_blocks]
+                data['system'][-1]['cache_control'] = {'type': 'ephemeral'}
+            
             response = requests.post(
                 'https://api.anthropic.com/v1/messages',
                 headers=headers,
@@ -914,14 +987,17 @@ class EnhancedAIProviderService:
             if response.status_code == 200:
                 result = response.json()
                 if 'content' in result and len(result['content']) > 0:
-                    return result['content'][0]['text'].strip()
+                    return {
+                        'content': result['content'][0]['text'].strip(),
+                        'usage': self._normalize_usage(result.get('usage'))
+                    }
                 else:
-                    return "No response generated"
+                    return {'content': "No response generated", 'usage': {}}
             else:
-                return f"API Error: {response.status_code} - {response.text}"
+                return {'content': f"API Error: {response.status_code} - {response.text}", 'usage': {}}
                 
         except Exception as e:
-            return f"Error: {str(e)}"
+            return {'content': f"Error: {str(e)}", 'usage': {}}
 
 
 
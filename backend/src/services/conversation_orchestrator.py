@@ -7,6 +7,7 @@ from src.models.ai_agent import AIAgent
 from src.models.message import Message
 from src.models.conversation import Conversation
 from src.services.ai_provider import ai_provider_service
+from src.services.pacing import TurnPacer
 from flask_socketio import emit
 import uuid
 
@@ -19,8 +20,8 @@ class ConversationOrchestrator:
         self.active_conversations = {}
         self.conversation_threads = {}
     
-    def start_conversation(self, conversation_id: str) -> bool:
-        """Start an AI-to-AI conversation"""
+    def start_conversation(self, conversation_id: str, options: Dict[str, Any] = None) -> bool:
+        """Start an AI-to-AI conversation (options may set pacing, turn_delay, turns_per_minute)"""
         try:
             # Get conversation from database
             conversation = Conversation.query.get(conversation_id)
@@ -44,7 +45,9 @@ class ConversationOrchestrator:
                 'agents': agents,
                 'message_count': 0,
                 'last_speaker': None,
-                'running': True
+                'running': True,
+                # This orchestrator has no presence info, so 'adaptive' paces as 'fixed'
+                'pacer': TurnPacer.from_options(options, default_delay=2.0)
             }
             
             # Start conversation thread
@@ -69,10 +72,8 @@ class ConversationOrchestrator:
                 self.active_conversations[conversation_id]['running'] = False
                 
                 # Update conversation status in database
-                conversation = Conversation.query.get(conversation_id)
-                if conversation:
-                    conversation.status = 'paused'
-                    db.session.commit()
+                Conversation.set_status(conversation_id, 'paused')
+                db.session.commit()
                 
                 return True
             return False
@@ -110,10 +111,11 @@ class ConversationOrchestrator:
                 
                 # Conversation loop
                 while conv_data['running'] and conv_data['message_count'] < 20:  # Limit to 20 messages
-                    time.sleep(2)  # Wait between messages
+                    time.sleep(conv_data['pacer'].next_delay())  # Wait between messages
                     
                     if not conv_data['running']:
                         break
+                    conv_data['pacer'].turn_started()
                     
                     # Get next speaker (rotate through agents)
                     current_speaker_idx = next(
@@ -143,7 +145,7 @@ class ConversationOrchestrator:
                         conv_data['message_count'] += 1
                 
                 # Mark conversation as completed
-                conversation.status = 'completed'
+                Conversation.set_status(conversation_id, 'completed')
                 db.session.commit()
                 
                 # Clean up
@@ -161,7 +163,7 @@ class ConversationOrchestrator:
             # Get recent conversation history
             recent_messages = Message.query.filter_by(
                 conversation_id=conversation_id
-            ).order_by(Message.timestamp.desc()).limit(5).all()
+            ).order_by(Message.id.desc()).limit(5).all()
             
             # Build conversation context
             messages = []
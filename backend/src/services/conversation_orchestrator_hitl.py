@@ -1,14 +1,61 @@
-import asyncio
+import json
+import os
 import threading
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple, Optional
 from src.models.user import db
-from src.models.ai_agent import AIAgent
 from src.models.message import Message
 from src.models.conversation import Conversation
-from src.services.ai_provider import ai_provider_service
-from flask_socketio import emit
-import uuid
+from src.models.conversation_state import ConversationState
+from src.services.admission import AdmissionController
+from src.services.lanes import LANES, ProviderGates
+from src.services.pacing import PACING_POLICIES, TurnPacer
+from src.services.agent_profiles import AgentProfile, agent_profile_cache
+from src.services.vector_index import RETRIEVAL_SCOPES, build_retrieval_context
+from src.services.event_emitter import conversation_room
+from src.services.presence import presence
+from src.services.message_render import message_renders
+
+# Turn-independent HITL instructions; keep this text stable so it can sit in
+# the cached prompt prefix (anything per-turn belongs in the prompt tail).
+HITL_INSTRUCTIONS = (
+    "You are participating in a multi-AI collaboration with human oversight. "
+    "If you need human input, guidance, or clarification, start your response with '[HUMAN_INPUT_NEEDED]' followed by your specific request. "
+    "Otherwise, provide a thoughtful response that builds on the previous messages. "
+    "Keep your response concise (1-2 sentences) and collaborative."
+)
+
+# Turn-taking modes accepted by start_conversation:
+#   round_robin - generate, persist, emit, then pick the next speaker (default)
+#   pipelined   - launch the next speaker's request as soon as the current
+#                 response is in, overlapping persistence/emit with the call
+#   parallel_round - every participant answers the same context concurrently;
+#                 the next round starts once all (or options['quorum']) finish
+CONVERSATION_MODES = ('round_robin', 'pipelined', 'parallel_round')
+
+# Number of recent messages fed to an agent as conversation context
+HISTORY_WINDOW = 5
+
+# A conversation counts as attended (interactive lane) for this long after its
+# last human message or human input request
+INTERACTIVE_WINDOW_SECONDS = int(os.environ.get('AGENTMIX_INTERACTIVE_WINDOW_SECONDS', 300))
+
+# How often a paused conversation's loop re-checks its state
+PAUSED_POLL_SECONDS = 1.0
+
+# Lifecycle events sent to every client (conversation lists track them);
+# everything else goes to the conversation's room only
+BROADCAST_EVENTS = ('conversation_status', 'conversation_queued')
+
+# Consecutive failed message writes (locked or full database, ...) after which a
+# conversation is paused, and the backoff between retries (doubling up to the max)
+MAX_SEND_FAILURES = int(os.environ.get('AGENTMIX_MAX_SEND_FAILURES', 5))
+SEND_RETRY_SECONDS = 2.0
+SEND_RETRY_MAX_SECONDS = 60.0
+
+# Numeric start options and the type each must convert to
+NUMERIC_OPTIONS = {'turn_delay': float, 'turns_per_minute': float, 'quorum': int, 'retrieval_k': int}
 
 class ConversationOrchestratorHITL:
     """Enhanced service for orchestrating AI-to-AI conversations with Human-in-the-Loop support"""
@@ -18,62 +65,365 @@ class ConversationOrchestratorHITL:
         self.app = app
         self.active_conversations = {}
         self.conversation_threads = {}
+        # Shared pool for provider calls made off the conversation thread
+        # (speculative turns and parallel rounds)
+        self.turn_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('AGENTMIX_TURN_WORKERS', 16)),
+            thread_name_prefix='agentmix-turn'
+        )
+        # Caps on concurrently running conversations; starts over them queue
+        self.admission = AdmissionController.from_env()
+        # Caps on concurrent provider calls, shared out by priority lane
+        self.provider_gates = ProviderGates.from_env()
+        # Per-turn context hooks: callables (conversation_id, agent, history)
+        # returning a text block for the prompt tail, or None
+        self.context_builders = [self._retrieval_context]
+    
+    def start_conversation(self, conversation_id: str, options: Dict[str, Any] = None) -> bool:
+        """Start an AI-to-AI conversation with HITL support (a queued start counts as started)"""
+        return self.admit_conversation(conversation_id, options).get('success', False)
     
-    def start_conversation(self, conversation_id: str) -> bool:
-        """Start an AI-to-AI conversation with HITL support"""
+    def admit_conversation(self, conversation_id: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Start a conversation, or queue it if the admission caps are reached.
+
+        Returns {'success', 'status'} where status is 'active', 'queued' (with
+        queue_position), 'rejected' (with retry_after seconds) or 'invalid'.
+        """
         try:
+            options = dict(options or {})
+            options.setdefault('mode', 'round_robin')
+            if options['mode'] not in CONVERSATION_MODES:
+                print(f"Unknown conversation mode: {options['mode']}")
+                return {'success': False, 'status': 'invalid', 'error': f"Unknown conversation mode: {options['mode']}"}
+            if options.get('lane') and options['lane'] not in LANES:
+                return {'success': False, 'status': 'invalid', 'error': f"Unknown lane: {options['lane']}"}
+            if options.get('pacing') and options['pacing'] not in PACING_POLICIES:
+                return {'success': False, 'status': 'invalid', 'error': f"Unknown pacing policy: {options['pacing']}"}
+            if options.get('retrieval') and options['retrieval'] not in RETRIEVAL_SCOPES:
+                return {'success': False, 'status': 'invalid', 'error': f"Unknown retrieval scope: {options['retrieval']}"}
+            for name, convert in NUMERIC_OPTIONS.items():
+                if options.get(name) is not None:
+                    try:
+                        convert(options[name])
+                    except (TypeError, ValueError):
+                        return {'success': False, 'status': 'invalid', 'error': f"{name} must be a number"}
+            try:
+                # Fails here rather than in the conversation thread (e.g. a bad AGENTMIX_PACING)
+                TurnPacer.from_options(options)
+            except (TypeError, ValueError) as e:
+                return {'success': False, 'status': 'invalid', 'error': str(e)}
+            
             # Get conversation from database
-            conversation = Conversation.query.get(conversation_id)
+            conversation = Conversation.get_visible(conversation_id)
             if not conversation:
-                return False
-            
-            # Get participating agents
-            participant_ids = conversation.get_participants()
-            agents = []
-            for agent_id in participant_ids:
-                agent = AIAgent.query.get(agent_id)
-                if agent and agent.status == 'active':
-                    agents.append(agent)
+                return {'success': False, 'status': 'invalid', 'error': 'Conversation not found'}
             
+            agents = self._load_active_agents(conversation)
             if len(agents) < 2:
-                return False
+                return {'success': False, 'status': 'invalid', 'error': 'Conversation needs at least 2 active agents'}
             
-            # Mark conversation as active
-            self.active_conversations[conversation_id] = {
-                'conversation': conversation,
-                'agents': agents,
-                'message_count': 0,
-                'last_speaker': None,
-                'running': True,
-                'paused': False,
-                'waiting_for_human': False,
-                'human_input_request': None
-            }
-            
-            # Update conversation status
-            conversation.status = 'active'
-            db.session.commit()
+            result = self.admission.admit(
+                conversation_id,
+                {agent.provider for agent in agents},
+                options,
+                lane=self._conversation_lane(conversation_id, options)
+            )
+            if result['status'] == 'active':
+                if conversation_id not in self.active_conversations:
+                    self._launch_conversation(conversation, agents, options)
+            elif result['status'] == 'queued':
+                Conversation.set_status(conversation_id, 'queued')
+                self._stage_queued_state(conversation_id, options)
+                db.session.commit()
+                self._emit_queue_positions()
+            else:
+                result['error'] = 'Too many conversations waiting to start; retry later'
             
-            # Emit status update
-            self.socketio.emit('conversation_status', {
-                'conversation_id': conversation_id,
-                'status': 'active'
-            })
+            result['success'] = result['status'] != 'rejected'
+            return result
             
-            # Start conversation thread
-            thread = threading.Thread(
-                target=self._run_conversation,
-                args=(conversation_id,),
-                daemon=True
+        except Exception as e:
+            print(f"Error starting conversation: {e}")
+            return {'success': False, 'status': 'invalid', 'error': str(e)}
+    
+    def _load_active_agents(self, conversation: Conversation) -> List[AgentProfile]:
+        """Load profiles of the conversation's participating agents that are active"""
+        return [
+            agent for agent in agent_profile_cache.get_many(conversation.get_participants())
+            if agent.status == 'active'
+        ]
+    
+    def _launch_conversation(self, conversation: Conversation, agents: List[AgentProfile], options: Dict[str, Any]):
+        """Mark an admitted conversation active and start its loop"""
+        conversation_id = conversation.id
+        try:
+            self.active_conversations[conversation_id] = self._new_conversation_data(
+                conversation, agents, options
             )
-            thread.start()
-            self.conversation_threads[conversation_id] = thread
             
+            # Update conversation status, checkpointing the initial state with it
+            Conversation.set_status(conversation_id, 'active')
+            self._stage_checkpoint(conversation_id)
+            db.session.commit()
+        except Exception:
+            # Give the admission slot back rather than holding it forever
+            db.session.rollback()
+            self.active_conversations.pop(conversation_id, None)
+            self._release_admission(conversation_id)
+            raise
+        
+        # Emit status update
+        self._emit(conversation_id, 'conversation_status', {
+            'conversation_id': conversation_id,
+            'status': 'active'
+        })
+        
+        self._start_conversation_thread(conversation_id)
+    
+    def _release_admission(self, conversation_id: str):
+        """Free a conversation's slot and start whichever queued conversations now fit"""
+        admitted = self.admission.release(conversation_id)
+        if admitted and self.app:
+            with self.app.app_context():
+                for queued_id, options in admitted:
+                    try:
+                        conversation = Conversation.query.get(queued_id)
+                        agents = self._load_active_agents(conversation) if conversation else []
+                        if len(agents) < 2:
+                            print(f"Dropping queued conversation {queued_id}: not enough active agents")
+                            self._release_admission(queued_id)
+                            continue
+                        self._launch_conversation(conversation, agents, options)
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Error starting queued conversation {queued_id}: {e}")
+        self._emit_queue_positions()
+    
+    def _conversation_lane(self, conversation_id: str, options: Dict[str, Any] = None) -> str:
+        """Priority lane for a conversation, re-evaluated whenever it waits for capacity.
+
+        An explicit options['lane'] wins. Otherwise a conversation is interactive
+        while someone has its room open or a human took part recently, and normal
+        when nobody is watching.
+        """
+        conv_data = self.active_conversations.get(conversation_id, {})
+        options = options if options is not None else conv_data.get('options', {})
+        if options.get('lane') in LANES:
+            return options['lane']
+        return 'interactive' if self._is_attended(conversation_id) else 'normal'
+    
+    def _is_attended(self, conversation_id: str) -> bool:
+        """Whether someone has the conversation open or a human took part recently"""
+        if self._has_room_subscribers(conversation_id):
             return True
-            
+        last_human_at = self.active_conversations.get(conversation_id, {}).get('last_human_at')
+        return bool(last_human_at) and time.time() - last_human_at < INTERACTIVE_WINDOW_SECONDS
+    
+    def _has_room_subscribers(self, conversation_id: str) -> bool:
+        """Whether any client has joined the conversation's rooms.
+
+        Worker processes serve no clients; there presence holds the counts the
+        web processes publish over the broker.
+        """
+        return presence.is_watched(conversation_id)
+    
+    def _emit(self, conversation_id: str, event: str, data: Dict[str, Any]):
+        """Send a conversation event to the clients that joined its room.
+
+        For a headless conversation (known to have no subscribers) the
+        RoomEmitter only records the event for replay; it is never serialized
+        or sent, so such conversations just persist their messages.
+        """
+        if event in BROADCAST_EVENTS:
+            self.socketio.emit(event, data, conversation_id=conversation_id)
+        else:
+            self.socketio.emit(event, data, room=conversation_room(conversation_id))
+    
+    def _emit_queue_positions(self):
+        """Tell every queued conversation where it stands"""
+        positions = self.admission.queue_positions()
+        for conversation_id, position in positions.items():
+            self._emit(conversation_id, 'conversation_queued', {
+                'conversation_id': conversation_id,
+                'queue_position': position,
+                'queue_length': len(positions)
+            })
+    
+    def recover_conversations(self, owns=None) -> List[str]:
+        """Rehydrate conversations that were running when the process last stopped.
+
+        Reads the checkpoints written on every state transition and restarts each
+        conversation loop where it left off: the starter message is not re-sent,
+        persisted turns are not re-run, and paused conversations stay paused with
+        their pending human input request. ``owns`` optionally filters which
+        conversation ids this process is responsible for (sharded workers).
+        """
+        if not self.app:
+            print("Error: Flask app not provided to orchestrator")
+            return []
+
+        recovered = []
+        with self.app.app_context():
+            try:
+                for state in ConversationState.query.all():
+                    conversation_id = state.conversation_id
+                    if owns is not None and not owns(conversation_id):
+                        continue
+                    if conversation_id in self.active_conversations:
+                        continue
+                    
+                    conversation = Conversation.query.get(conversation_id)
+                    if conversation and conversation.status == 'queued':
+                        # A start still waiting for a slot; re-queued below with these options
+                        continue
+                    if not state.running or not conversation or conversation.status != 'active':
+                        db.session.delete(state)
+                        continue
+                    
+                    agents = self._load_active_agents(conversation)
+                    if len(agents) < 2:
+                        print(f"Not enough agents to recover conversation {conversation_id}")
+                        continue
+                    
+                    # Already running before the restart, so not subject to the caps
+                    self.admission.admit(conversation_id, {agent.provider for agent in agents},
+                                         state.get_options(), force=True)
+                    conv_data = self._new_conversation_data(conversation, agents, state.get_options())
+                    conv_data.update({
+                        'message_count': state.message_count or 0,
+                        'last_speaker': state.last_speaker_id,
+                        'paused': bool(state.paused),
+                        'waiting_for_human': bool(state.waiting_for_human),
+                        'human_input_request': state.get_human_input_request()
+                    })
+                    conv_data['token_usage'].update(state.get_token_usage())
+                    self.active_conversations[conversation_id] = conv_data
+                    recovered.append(conversation_id)
+                
+                db.session.commit()
+                
+                # Starts that were still waiting for a slot go back in the queue
+                queued = Conversation.query.filter_by(status='queued').order_by(Conversation.created_at).all()
+                for conversation in queued:
+                    if owns is None or owns(conversation.id):
+                        state = ConversationState.query.get(conversation.id)
+                        self.admit_conversation(conversation.id, state.get_options() if state else None)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error recovering conversations: {e}")
+        
+        for conversation_id in recovered:
+            self._emit(conversation_id, 'conversation_status', {
+                'conversation_id': conversation_id,
+                'status': 'active'
+            })
+            self._start_conversation_thread(conversation_id)
+        
+        if recovered:
+            print(f"Recovered {len(recovered)} conversation(s): {', '.join(recovered)}")
+        return recovered
+    
+    def _new_conversation_data(self, conversation: Conversation, agents: List[AgentProfile],
+                               options: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the in-memory state for a running conversation"""
+        options = dict(options or {})
+        options.setdefault('mode', 'round_robin')
+        conversation_id = conversation.id
+        return {
+            'conversation': conversation,
+            'agents': agents,
+            'message_count': 0,
+            'last_speaker': None,
+            'running': True,
+            'paused': False,
+            'waiting_for_human': False,
+            'human_input_request': None,
+            'options': options,
+            'context_version': 0,
+            'send_failures': 0,
+            'prompt_prefixes': {},
+            'pacer': TurnPacer.from_options(options, is_watched=lambda: self._is_attended(conversation_id)),
+            'wake': threading.Event(),
+            'token_usage': {
+                'input_tokens': 0,
+                'output_tokens': 0,
+                'cached_tokens': 0,
+                'cache_creation_tokens': 0
+            }
+        }
+    
+    def _start_conversation_thread(self, conversation_id: str):
+        """Start the conversation loop thread"""
+        thread = threading.Thread(
+            target=self._run_conversation,
+            args=(conversation_id,),
+            daemon=True
+        )
+        thread.start()
+        self.conversation_threads[conversation_id] = thread
+    
+    def _stage_checkpoint(self, conversation_id: str, advance: Dict[str, Any] = None):
+        """Write the conversation's orchestrator state into the current session.
+
+        The caller commits, so a checkpoint can land in the same transaction as
+        the message that caused it. ``advance`` holds state the caller applies
+        in memory only once that commit succeeds.
+        """
+        conv_data = self.active_conversations.get(conversation_id)
+        if conv_data is None:
+            return
+        conv_data = dict(conv_data, **(advance or {}))
+        
+        state = ConversationState.query.get(conversation_id)
+        if not state:
+            state = ConversationState(conversation_id=conversation_id)
+            db.session.add(state)
+        
+        state.message_count = conv_data['message_count']
+        state.last_speaker_id = conv_data['last_speaker']
+        state.running = conv_data['running']
+        state.paused = conv_data['paused']
+        state.waiting_for_human = conv_data['waiting_for_human']
+        state.set_human_input_request(conv_data['human_input_request'])
+        state.set_options(conv_data['options'])
+        state.set_token_usage(conv_data['token_usage'])
+    
+    def _stage_queued_state(self, conversation_id: str, options: Dict[str, Any]):
+        """Keep a queued start's options in its checkpoint row so recovery queues it as it was (caller commits)"""
+        state = ConversationState.query.get(conversation_id)
+        if not state:
+            state = ConversationState(conversation_id=conversation_id)
+            db.session.add(state)
+        state.message_count = 0
+        state.last_speaker_id = None
+        state.running = False
+        state.paused = False
+        state.waiting_for_human = False
+        state.set_human_input_request(None)
+        state.set_options(options)
+        state.set_token_usage(None)
+    
+    def _checkpoint(self, conversation_id: str):
+        """Persist the conversation's orchestrator state in its own transaction"""
+        if not self.app:
+            return
+        
+        with self.app.app_context():
+            try:
+                self._stage_checkpoint(conversation_id)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error checkpointing conversation {conversation_id}: {e}")
+    
+    def _clear_checkpoint(self, conversation_id: str):
+        """Drop the checkpoint of a conversation that has finished"""
+        try:
+            ConversationState.query.filter_by(conversation_id=conversation_id).delete()
+            db.session.commit()
         except Exception as e:
-            print(f"Error starting conversation: {e}")
-            return False
+            db.session.rollback()
+            print(f"Error clearing checkpoint for conversation {conversation_id}: {e}")
     
     def pause_conversation(self, conversation_id: str, reason: str = "Human intervention requested") -> bool:
         """Pause conversation for human input"""
@@ -82,12 +432,14 @@ class ConversationOrchestratorHITL:
                 conv_data = self.active_conversations[conversation_id]
                 conv_data['paused'] = True
                 conv_data['waiting_for_human'] = True
+                self._invalidate_speculation(conversation_id)
+                self._checkpoint(conversation_id)
                 
                 # Send system message
                 self._send_system_message(conversation_id, f"🔄 Conversation paused: {reason}")
                 
                 # Emit pause notification
-                self.socketio.emit('conversation_paused', {
+                self._emit(conversation_id, 'conversation_paused', {
                     'conversation_id': conversation_id,
                     'reason': reason
                 })
@@ -106,12 +458,16 @@ class ConversationOrchestratorHITL:
                 conv_data['paused'] = False
                 conv_data['waiting_for_human'] = False
                 conv_data['human_input_request'] = None
+                conv_data['send_failures'] = 0
+                self._invalidate_speculation(conversation_id)
+                self._checkpoint(conversation_id)
+                self._wake(conversation_id)
                 
                 # Send system message
                 self._send_system_message(conversation_id, "▶️ Conversation resumed")
                 
                 # Emit resume notification
-                self.socketio.emit('conversation_resumed', {
+                self._emit(conversation_id, 'conversation_resumed', {
                     'conversation_id': conversation_id
                 })
                 
@@ -128,6 +484,11 @@ class ConversationOrchestratorHITL:
                 print("Error: Flask app not provided to orchestrator")
                 return False
 
+            # Any in-flight speculative turn was generated without this message
+            self._invalidate_speculation(conversation_id)
+            if conversation_id in self.active_conversations:
+                self.active_conversations[conversation_id]['last_human_at'] = time.time()
+            
             with self.app.app_context():
                 # Create and save human message
                 message = Message(
@@ -139,9 +500,10 @@ class ConversationOrchestratorHITL:
                 )
                 db.session.add(message)
                 db.session.commit()
+                message_renders.store(message)
                 
                 # Broadcast message
-                self.socketio.emit('new_message', {
+                self._emit(conversation_id, 'new_message', {
                     'conversation_id': conversation_id,
                     'message': {
                         'id': message.id,
@@ -158,6 +520,9 @@ class ConversationOrchestratorHITL:
                     self.active_conversations[conversation_id].get('waiting_for_human')):
                     self.resume_conversation(conversation_id)
                 
+                # Let the next agent answer without sitting out the pacing delay
+                self._wake(conversation_id)
+                
                 return True
         except Exception as e:
             print(f"Error sending human message: {e}")
@@ -172,6 +537,7 @@ class ConversationOrchestratorHITL:
                     'agent': requesting_agent,
                     'message': request_message
                 }
+                self.active_conversations[conversation_id]['last_human_at'] = time.time()
             
             # Pause conversation
             self.pause_conversation(conversation_id, f"{requesting_agent} requested human input")
@@ -183,7 +549,7 @@ class ConversationOrchestratorHITL:
             )
             
             # Emit specific human input request
-            self.socketio.emit('human_input_requested', {
+            self._emit(conversation_id, 'human_input_requested', {
                 'conversation_id': conversation_id,
                 'requesting_agent': requesting_agent,
                 'request_message': request_message
@@ -197,17 +563,29 @@ class ConversationOrchestratorHITL:
     def stop_conversation(self, conversation_id: str) -> bool:
         """Stop an AI-to-AI conversation"""
         try:
+            if self.admission.is_queued(conversation_id):
+                # Cancel a start that is still waiting for a slot
+                Conversation.set_status(conversation_id, 'completed')
+                ConversationState.query.filter_by(conversation_id=conversation_id).delete()
+                db.session.commit()
+                self._release_admission(conversation_id)
+                self._emit(conversation_id, 'conversation_status', {
+                    'conversation_id': conversation_id,
+                    'status': 'completed'
+                })
+                return True
+            
             if conversation_id in self.active_conversations:
                 self.active_conversations[conversation_id]['running'] = False
+                self._wake(conversation_id)
                 
                 # Update conversation status in database
-                conversation = Conversation.query.get(conversation_id)
-                if conversation:
-                    conversation.status = 'completed'
-                    db.session.commit()
+                Conversation.set_status(conversation_id, 'completed')
+                self._stage_checkpoint(conversation_id)
+                db.session.commit()
                 
                 # Emit status update
-                self.socketio.emit('conversation_status', {
+                self._emit(conversation_id, 'conversation_status', {
                     'conversation_id': conversation_id,
                     'status': 'completed'
                 })
@@ -232,10 +610,8 @@ class ConversationOrchestratorHITL:
                     print(f"Conversation {conversation_id} not found")
                     return
                 
-                # Get fresh agent objects
-                agent_ids = conversation.participants
-                agents = [AIAgent.query.get(agent_id) for agent_id in agent_ids]
-                agents = [agent for agent in agents if agent]  # Filter out None
+                # Turns work from cached agent profiles rather than ORM rows
+                agents = agent_profile_cache.get_many(conversation.get_participants())
                 
                 if len(agents) < 2:
                     print(f"Not enough agents for conversation {conversation_id}")
@@ -244,63 +620,36 @@ class ConversationOrchestratorHITL:
                 conv_data = self.active_conversations[conversation_id]
                 conv_data['conversation'] = conversation
                 conv_data['agents'] = agents
+                pipelined = conv_data['options'].get('mode') == 'pipelined'
                 
-                # Initial conversation starter
-                starter_message = f"Hello everyone! Let's start our collaboration on: {conversation.description or conversation.name}"
-                
-                # Send initial message from first agent
-                first_agent = agents[0]
-                self._send_ai_message(
-                    conversation_id,
-                    first_agent,
-                    starter_message
-                )
-                
-                conv_data['last_speaker'] = first_agent.id
-                conv_data['message_count'] += 1
+                # Build every agent's prompt prefix up front so turns (including
+                # speculative ones on other threads) only read it
+                for agent in agents:
+                    self._get_prompt_prefix(conversation_id, agent)
                 
-                # Conversation loop
-                while conv_data['running'] and conv_data['message_count'] < 100:
-                    time.sleep(1)  # Reduced wait time for faster conversation
-                    
-                    # Check if conversation should continue
-                    if not conv_data['running'] or conv_data['paused'] or conv_data['waiting_for_human']:
-                        continue
-                    
-                    # Get next speaker (rotate through agents)
-                    current_speaker_idx = next(
-                        (i for i, agent in enumerate(agents) if agent.id == conv_data['last_speaker']),
-                        0
-                    )
-                    next_speaker_idx = (current_speaker_idx + 1) % len(agents)
-                    next_speaker = agents[next_speaker_idx]
+                # Initial conversation starter (already sent if this conversation
+                # was recovered from a checkpoint)
+                if conv_data['message_count'] == 0:
+                    starter_message = f"Hello everyone! Let's start our collaboration on: {conversation.description or conversation.name}"
                     
-                    # Generate response from next speaker
-                    response = self._generate_agent_response(
+                    # Send initial message from first agent
+                    sent = self._send_ai_message(
                         conversation_id,
-                        next_speaker,
-                        conv_data['message_count']
+                        agents[0],
+                        starter_message
                     )
-                    
-                    if response:
-                        # Check if AI is requesting human input
-                        if self._should_request_human_input(response):
-                            clean_request = response.replace('[HUMAN_INPUT_NEEDED]', '').strip()
-                            self.request_human_input(conversation_id, next_speaker.name, clean_request)
-                            continue
-                        
-                        self._send_ai_message(
-                            conversation_id,
-                            next_speaker,
-                            response
-                        )
-                        
-                        conv_data['last_speaker'] = next_speaker.id
-                        conv_data['message_count'] += 1
-                
-                # Mark conversation as completed
-                conversation.status = 'completed'
+                    self._record_send_result(conversation_id, sent)
+                
+                # Either returns once the conversation stops or hits the message cap
+                if conv_data['options'].get('mode') == 'parallel_round':
+                    self._run_parallel_rounds(conversation_id, agents)
+                else:
+                    self._run_turns(conversation_id, agents, pipelined)
+                
+                # Mark conversation as completed (unless it was deleted while running)
+                Conversation.set_status(conversation_id, 'completed')
                 db.session.commit()
+                self._clear_checkpoint(conversation_id)
                 
                 # Clean up
                 if conversation_id in self.active_conversations:
@@ -312,78 +661,318 @@ class ConversationOrchestratorHITL:
                 print(f"Error in conversation loop: {e}")
                 import traceback
                 traceback.print_exc()
+            finally:
+                self._release_admission(conversation_id)
+    
+    def _get_prompt_prefix(self, conversation_id: str, agent: AgentProfile) -> List[str]:
+        """Get the immutable per-agent prompt prefix for a conversation.
+
+        The prefix (system message, HITL instructions, conversation brief) is
+        built once and reused verbatim on every turn so provider prompt caches hit.
+        """
+        conv_data = self.active_conversations.get(conversation_id, {})
+        prefixes = conv_data.setdefault('prompt_prefixes', {})
+        if agent.id not in prefixes:
+            prefix = list(agent.prompt_prefix)
+            prefix.append(HITL_INSTRUCTIONS)
+            conversation = conv_data.get('conversation')
+            if conversation:
+                brief = f"Conversation: {conversation.name}"
+                if conversation.description:
+                    brief += f"\nTopic: {conversation.description}"
+                prefix.append(brief)
+            prefixes[agent.id] = tuple(prefix)
+        return list(prefixes[agent.id])
+
+    def _run_turns(self, conversation_id: str, agents: List[AgentProfile], pipelined: bool):
+        """Run turns one speaker at a time (round_robin and pipelined modes)"""
+        conv_data = self.active_conversations[conversation_id]
+        speculation = None
+        
+        # Conversation loop
+        while conv_data['running'] and conv_data['message_count'] < 100:
+            self._wait_for_turn(conversation_id)
+            
+            # Check if conversation should continue
+            if not conv_data['running'] or conv_data['paused'] or conv_data['waiting_for_human']:
+                continue
+            conv_data['pacer'].turn_started()
+            
+            # Get next speaker (rotate through agents)
+            next_speaker = self._get_next_speaker(agents, conv_data['last_speaker'])
+            
+            # Take the speculative turn if nothing changed since it was launched
+            response = None
+            if speculation:
+                if (speculation['agent_id'] == next_speaker.id and
+                        speculation['context_version'] == conv_data['context_version']):
+                    history = speculation['history']
+                    response, usage = speculation['future'].result()
+                speculation = None
+            
+            if response is None:
+                history = self._load_recent_history(conversation_id)
+                response, usage = self._generate_agent_response(
+                    conversation_id,
+                    next_speaker,
+                    conv_data['message_count'],
+                    history
+                )
+            
+            if response:
+                # Check if AI is requesting human input
+                if self._should_request_human_input(response):
+                    clean_request = response.replace('[HUMAN_INPUT_NEEDED]', '').strip()
+                    self.request_human_input(conversation_id, next_speaker.name, clean_request)
+                    continue
+            
+                if pipelined and conv_data['message_count'] + 1 < 100:
+                    speculation = self._speculate_next_turn(
+                        conversation_id,
+                        self._get_next_speaker(agents, next_speaker.id),
+                        conv_data['message_count'] + 1,
+                        history + [{
+                            'sender_id': next_speaker.id,
+                            'sender_name': next_speaker.name,
+                            'message_type': 'ai',
+                            'content': response
+                        }]
+                    )
+            
+                sent = self._send_ai_message(
+                    conversation_id,
+                    next_speaker,
+                    response,
+                    usage
+                )
+                self._record_send_result(conversation_id, sent)
+                if not sent:
+                    speculation = None
+    
+    def _run_parallel_rounds(self, conversation_id: str, agents: List[AgentProfile]):
+        """Run rounds in which every agent answers the same context concurrently.
+
+        Responses are persisted and emitted in arrival order, so a round takes the
+        slowest provider's latency rather than the sum. With options['quorum'] set,
+        the round closes once that many agents have answered and stragglers are
+        dropped. A human message or pause mid-round also closes it so the next
+        round sees the new context.
+        """
+        conv_data = self.active_conversations[conversation_id]
+        quorum = conv_data['options'].get('quorum') or len(agents)
+        quorum = max(1, min(int(quorum), len(agents)))
+        
+        while conv_data['running'] and conv_data['message_count'] < 100:
+            self._wait_for_turn(conversation_id)
+            
+            if not conv_data['running'] or conv_data['paused'] or conv_data['waiting_for_human']:
+                continue
+            conv_data['pacer'].turn_started()
+            
+            # Everyone sees the same window, wide enough to include the last round
+            history = self._load_recent_history(conversation_id, max(HISTORY_WINDOW, len(agents)))
+            context_version = conv_data['context_version']
+            turn_number = conv_data['message_count']
+            futures = {
+                self.turn_executor.submit(
+                    self._generate_response_threaded,
+                    conversation_id,
+                    agent.id,
+                    turn_number,
+                    history
+                ): agent
+                for agent in agents
+            }
+            
+            answered = 0
+            for future in as_completed(futures):
+                if not conv_data['running'] or conv_data['context_version'] != context_version:
+                    break
+                
+                agent = futures[future]
+                response, usage = future.result()
+                if not response:
+                    continue
+                
+                if self._should_request_human_input(response):
+                    clean_request = response.replace('[HUMAN_INPUT_NEEDED]', '').strip()
+                    self.request_human_input(conversation_id, agent.name, clean_request)
+                    break
+                
+                sent = self._send_ai_message(conversation_id, agent, response, usage)
+                self._record_send_result(conversation_id, sent)
+                if not sent:
+                    break
+                
+                answered += 1
+                if answered >= quorum or conv_data['message_count'] >= 100:
+                    break
+    
+    def invalidate_agent(self, agent_id: int):
+        self.invalidate_agents([agent_id])
     
-    def _generate_agent_response(self, conversation_id: str, agent: AIAgent, turn_number: int) -> str:
-        """Generate a response from an AI agent with HITL awareness"""
+    def invalidate_agents(self, agent_ids: List[int]):
+        """Drop cached profiles and prompt prefixes of agents after they change.
+
+        Running conversations pick up the new profiles on their next turn; the
+        profiles are reloaded with one query however many agents changed.
+        """
+        for agent_id in agent_ids:
+            agent_profile_cache.invalidate(agent_id)
+        if not self.app:
+            return
+        
+        with self.app.app_context():
+            profiles = {profile.id: profile for profile in agent_profile_cache.get_many(list(agent_ids))}
+            for conv_data in list(self.active_conversations.values()):
+                prefixes = conv_data.get('prompt_prefixes', {})
+                agents = conv_data.get('agents', [])
+                for agent_id in agent_ids:
+                    prefixes.pop(agent_id, None)
+                for i, agent in enumerate(agents):
+                    if agent.id in profiles:
+                        agents[i] = profiles[agent.id]
+    
+    def _wait_for_turn(self, conversation_id: str):
+        """Wait until the next turn may start under the conversation's pacing policy.
+
+        Resume, stop and human messages cut the wait short.
+        """
+        conv_data = self.active_conversations[conversation_id]
+        if conv_data['paused'] or conv_data['waiting_for_human']:
+            delay = PAUSED_POLL_SECONDS
+        else:
+            delay = conv_data['pacer'].next_delay()
+        if delay > 0:
+            conv_data['wake'].wait(delay)
+        conv_data['wake'].clear()
+    
+    def _wake(self, conversation_id: str):
+        """Interrupt the conversation loop's pacing wait"""
+        conv_data = self.active_conversations.get(conversation_id)
+        if conv_data is not None:
+            conv_data['wake'].set()
+    
+    def _get_next_speaker(self, agents: List[AgentProfile], last_speaker_id: Optional[int]) -> AgentProfile:
+        """Pick the agent after the last speaker in round-robin order"""
+        current_speaker_idx = next(
+            (i for i, agent in enumerate(agents) if agent.id == last_speaker_id),
+            0
+        )
+        return agents[(current_speaker_idx + 1) % len(agents)]
+    
+    def _invalidate_speculation(self, conversation_id: str):
+        """Mark any speculative turn in flight as stale"""
+        conv_data = self.active_conversations.get(conversation_id)
+        if conv_data is not None:
+            conv_data['context_version'] = conv_data.get('context_version', 0) + 1
+    
+    def _speculate_next_turn(self, conversation_id: str, agent: AgentProfile, turn_number: int,
+                             history: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Launch the next speaker's provider call before the current turn is persisted.
+
+        The result is only used if the conversation's context version is unchanged
+        when the loop gets to it; a human message, pause or system notice in the
+        meantime discards it.
+        """
+        conv_data = self.active_conversations[conversation_id]
+        history = history[-HISTORY_WINDOW:]
+        future = self.turn_executor.submit(
+            self._generate_response_threaded,
+            conversation_id,
+            agent.id,
+            turn_number,
+            history
+        )
+        return {
+            'agent_id': agent.id,
+            'context_version': conv_data['context_version'],
+            'history': history,
+            'future': future
+        }
+    
+    def _generate_response_threaded(self, conversation_id: str, agent_id: int, turn_number: int,
+                                    history: List[Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+        """Run a turn on a pool thread with its own app context"""
+        with self.app.app_context():
+            agent = agent_profile_cache.get(agent_id)
+            if not agent:
+                return None, {}
+            return self._generate_agent_response(conversation_id, agent, turn_number, history)
+    
+    def _load_recent_history(self, conversation_id: str, limit: int = HISTORY_WINDOW) -> List[Dict[str, Any]]:
+        """Load the recent message window as plain dicts, oldest first"""
+        recent_messages = Message.query.filter_by(
+            conversation_id=conversation_id
+        ).order_by(Message.id.desc()).limit(limit).all()
+        
+        return [
+            {
+                'id': msg.id,
+                'sender_id': msg.sender_id,
+                'sender_name': msg.sender.name if msg.sender else f"Agent {msg.sender_id}",
+                'message_type': msg.message_type,
+                'content': msg.content
+            }
+            for msg in reversed(recent_messages)
+        ]
+    
+    def _generate_agent_response(self, conversation_id: str, agent: AgentProfile, turn_number: int,
+                                 history: List[Dict[str, Any]] = None) -> Tuple[str, Dict[str, int]]:
+        """Generate a response from an AI agent with HITL awareness.
+
+        Returns the response text and the provider's token usage for the turn.
+        """
         try:
             # Get recent conversation history
-            recent_messages = Message.query.filter_by(
-                conversation_id=conversation_id
-            ).order_by(Message.timestamp.desc()).limit(5).all()
+            if history is None:
+                history = self._load_recent_history(conversation_id)
             
-            # Build conversation context
-            messages = []
+            # Stable prefix first, then the variable tail (history and turn cue)
+            messages = [
+                {'role': 'system', 'content': block}
+                for block in self._get_prompt_prefix(conversation_id, agent)
+            ]
             
-            # Add system message with HITL instructions
-            system_msg = agent.get_config().get('system_message', '')
-            if system_msg:
-                messages.append({
-                    'role': 'system',
-                    'content': system_msg
-                })
+            for msg in history:
+                if msg['message_type'] == 'human':
+                    messages.append({'role': 'user', 'content': f"Human: {msg['content']}"})
+                elif msg['sender_id'] == agent.id:
+                    messages.append({'role': 'assistant', 'content': msg['content']})
+                else:
+                    messages.append({'role': 'user', 'content': f"{msg['sender_name']}: {msg['content']}"})
             
-            # Add HITL context
-            hitl_context = f"You are participating in a multi-AI collaboration with human oversight. This is turn {turn_number}. "
-            hitl_context += "If you need human input, guidance, or clarification, start your response with '[HUMAN_INPUT_NEEDED]' followed by your specific request. "
-            hitl_context += "Otherwise, provide a thoughtful response that builds on the previous messages. "
-            hitl_context += "Keep your response concise (1-2 sentences) and collaborative."
+            # Per-turn context such as retrieved older messages; it changes every
+            # turn, so it goes in the tail rather than the cached system prefix
+            for build_context in self.context_builders:
+                context = build_context(conversation_id, agent, history)
+                if context:
+                    messages.append({'role': 'user', 'content': context})
             
             messages.append({
-                'role': 'system',
-                'content': hitl_context
+                'role': 'user',
+                'content': f"This is turn {turn_number}. {agent.name}, please respond:"
             })
             
-            # Add recent message history
-            for msg in reversed(recent_messages):
-                if msg.message_type == 'human':
-                    messages.append({
-                        'role': 'user',
-                        'content': f"Human: {msg.content}"
-                    })
-                elif msg.sender_id != agent.id:  # Don't include own messages
-                    sender_name = msg.sender.name if msg.sender else f"Agent {msg.sender_id}"
-                    messages.append({
-                        'role': 'user',
-                        'content': f"{sender_name}: {msg.content}"
-                    })
-            
             # Use real AI provider to generate response
             try:
-                from src.services.ai_provider_enhanced import EnhancedAIProviderService
                 import random
-                ai_service = EnhancedAIProviderService()
-                
-                # Build the prompt for the AI
-                prompt = ""
-                for msg in messages:
-                    if msg['role'] == 'system':
-                        prompt += f"System: {msg['content']}\n"
-                    elif msg['role'] == 'user':
-                        prompt += f"{msg['content']}\n"
-                
-                prompt += f"\n{agent.name}, please respond:"
-                
-                # Generate response using the agent's provider and model
-                response = ai_service.generate_response(
-                    provider=agent.provider,
-                    model=agent.model,
-                    api_key=agent.api_key,
-                    prompt=prompt,
-                    max_tokens=150
-                )
+                
+                # Generate response using the agent's provider and model, waiting
+                # for a provider call slot in the conversation's lane
+                with self.provider_gates.slot(agent.provider, self._conversation_lane(conversation_id)):
+                    result = agent.client.generate_response_with_usage(
+                        provider=agent.provider,
+                        model=agent.model,
+                        api_key=agent.api_key,
+                        messages=messages,
+                        max_tokens=150,
+                        cache_key=f"agentmix-{conversation_id}-{agent.id}"
+                    )
+                response = result['content']
                 
                 if response and response.strip():
-                    return response.strip()
+                    return response.strip(), result.get('usage', {})
                 else:
                     # Fallback to demo response if API fails
                     demo_responses = [
@@ -393,7 +982,7 @@ class ConversationOrchestratorHITL:
                         "Based on the conversation so far, I suggest we prioritize the core features.",
                         "I agree with the previous points, and I'd like to add scalability considerations."
                     ]
-                    return random.choice(demo_responses)
+                    return random.choice(demo_responses), {}
                     
             except Exception as e:
                 print(f"Error generating AI response: {e}")
@@ -406,22 +995,75 @@ class ConversationOrchestratorHITL:
                     "Based on the conversation so far, I suggest we prioritize the core features.",
                     "I agree with the previous points, and I'd like to add scalability considerations."
                 ]
-                return random.choice(demo_responses)
+                return random.choice(demo_responses), {}
                 
         except Exception as e:
             print(f"Error generating agent response: {e}")
-            return f"[Error: {str(e)}]"
+            return f"[Error: {str(e)}]", {}
+    
+    def _retrieval_context(self, conversation_id: str, agent: AgentProfile,
+                           history: List[Dict[str, Any]]) -> Optional[str]:
+        """Older messages relevant to the recent window, per the conversation's retrieval options"""
+        conv_data = self.active_conversations.get(conversation_id) or {}
+        options = conv_data.get('options', {})
+        try:
+            return build_retrieval_context(
+                conversation_id,
+                history,
+                scope=options.get('retrieval'),
+                top_k=options.get('retrieval_k')
+            )
+        except Exception as e:
+            print(f"Error retrieving context for {conversation_id}: {e}")
+            return None
+    
+    def _usage_totals(self, conv_data: Dict[str, Any], usage: Dict[str, int]) -> Dict[str, int]:
+        """The conversation's token usage totals with one turn's usage added"""
+        totals = dict(conv_data.get('token_usage') or {})
+        for key, value in (usage or {}).items():
+            totals[key] = totals.get(key, 0) + (value or 0)
+        return totals
+    
+    def _record_send_result(self, conversation_id: str, sent: bool):
+        """Count consecutive failed message writes, backing off after each.
+
+        A write that keeps failing would otherwise have the loop call the
+        provider again at once, spending tokens on turns that are never saved.
+        After MAX_SEND_FAILURES in a row the conversation is paused.
+        """
+        conv_data = self.active_conversations.get(conversation_id)
+        if conv_data is None:
+            return
+        if sent:
+            conv_data['send_failures'] = 0
+            return
+        
+        failures = conv_data.get('send_failures', 0) + 1
+        conv_data['send_failures'] = failures
+        if failures >= MAX_SEND_FAILURES:
+            self.pause_conversation(conversation_id, f"{failures} messages in a row could not be saved")
+            return
+        # Stop and resume cut the backoff short
+        conv_data['wake'].wait(min(SEND_RETRY_MAX_SECONDS, SEND_RETRY_SECONDS * 2 ** (failures - 1)))
+        conv_data['wake'].clear()
     
     def _should_request_human_input(self, response: str) -> bool:
         """Check if AI response is requesting human input"""
         return response.startswith('[HUMAN_INPUT_NEEDED]')
     
-    def _send_ai_message(self, conversation_id: str, agent: AIAgent, content: str):
-        """Send an AI message"""
+    def _send_ai_message(self, conversation_id: str, agent: AgentProfile, content: str,
+                         usage: Dict[str, int] = None) -> bool:
+        """Send an AI message and advance the turn; returns whether it was saved.
+
+        The turn counter and last speaker are checkpointed in the same commit as
+        the message, so a recovered conversation never re-runs a persisted turn,
+        and only advance in memory once that commit succeeds.
+        """
         if not self.app:
             print("Error: Flask app not provided to orchestrator")
-            return
+            return False
 
+        saved = False
         with self.app.app_context():
             try:
                 message = Message(
@@ -429,27 +1071,48 @@ class ConversationOrchestratorHITL:
                     receiver_id=None,  # Broadcast to all
                     content=content,
                     message_type='ai',
-                    conversation_id=conversation_id
+                    conversation_id=conversation_id,
+                    message_metadata=json.dumps({'usage': usage}) if usage else None
                 )
                 
                 db.session.add(message)
+                
+                conv_data = self.active_conversations.get(conversation_id)
+                advance = None
+                if conv_data is not None:
+                    advance = {
+                        'last_speaker': agent.id,
+                        'message_count': conv_data['message_count'] + 1,
+                        'token_usage': self._usage_totals(conv_data, usage)
+                    }
+                    self._stage_checkpoint(conversation_id, advance)
+                
                 db.session.commit()
+                saved = True
+                if advance:
+                    conv_data.update(advance)
+                message_renders.store(message, agent.name)
                 
                 # Broadcast message
-                self.socketio.emit('new_message', {
+                payload = {
+                    'id': message.id,
+                    'sender_type': 'ai',
+                    'sender_name': agent.name,
+                    'content': content,
+                    'timestamp': message.timestamp.isoformat(),
+                    'message_type': 'ai'
+                }
+                if usage:
+                    payload['usage'] = usage
+                self._emit(conversation_id, 'new_message', {
                     'conversation_id': conversation_id,
-                    'message': {
-                        'id': message.id,
-                        'sender_type': 'ai',
-                        'sender_name': agent.name,
-                        'content': content,
-                        'timestamp': message.timestamp.isoformat(),
-                        'message_type': 'ai'
-                    }
+                    'message': payload
                 })
                 
             except Exception as e:
+                db.session.rollback()
                 print(f"Error sending AI message: {e}")
+        return saved
     
     def _send_system_message(self, conversation_id: str, content: str):
         """Send a system message"""
@@ -457,6 +1120,8 @@ class ConversationOrchestratorHITL:
             print("Error: Flask app not provided to orchestrator")
             return
 
+        self._invalidate_speculation(conversation_id)
+
         with self.app.app_context():
             try:
                 message = Message(
@@ -469,9 +1134,10 @@ class ConversationOrchestratorHITL:
                 
                 db.session.add(message)
                 db.session.commit()
+                message_renders.store(message)
                 
                 # Broadcast message
-                self.socketio.emit('new_message', {
+                self._emit(conversation_id, 'new_message', {
                     'conversation_id': conversation_id,
                     'message': {
                         'id': message.id,
@@ -484,6 +1150,7 @@ class ConversationOrchestratorHITL:
                 })
                 
             except Exception as e:
+                db.session.rollback()
                 print(f"Error sending system message: {e}")
     
     def get_active_conversations(self) -> List[str]:
@@ -503,13 +1170,26 @@ class ConversationOrchestratorHITL:
                 'paused': conv_data.get('paused', False),
                 'waiting_for_human': conv_data.get('waiting_for_human', False),
                 'message_count': conv_data.get('message_count', 0),
-                'human_input_request': conv_data.get('human_input_request')
+                'human_input_request': conv_data.get('human_input_request'),
+                'token_usage': conv_data.get('token_usage', {}),
+                'lane': self._conversation_lane(conversation_id),
+                'pacing': conv_data['pacer'].policy
+            }
+        if self.admission.is_queued(conversation_id):
+            return {
+                'active': False,
+                'queued': True,
+                'queue_position': self.admission.queue_positions().get(conversation_id)
             }
         return {'active': False}
 
 # Global instance
 conversation_orchestrator_hitl = None
 
+def get_orchestrator_hitl():
+    """Get the active HITL orchestrator (in-process or sharded across workers)"""
+    return conversation_orchestrator_hitl
+
 def init_orchestrator_hitl(socketio, app=None):
     """Initialize the global HITL orchestrator instance"""
     global conversation_orchestrator_hitl
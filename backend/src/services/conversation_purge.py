@@ -0,0 +1,152 @@
+"""
+Two-phase deletion of conversations.
+
+Deleting a conversation only marks it ``deleted``, which hides it from the API
+at once. A background job then purges the rows in small batches, committing
+and pausing between batches, so a conversation with hundreds of thousands of
+messages never holds the SQLite write lock long enough to stall orchestrator
+commits. The job only purges conversations marked for at least the grace
+period, so a turn still in flight when the delete happened lands before the
+messages are swept.
+
+Configuration:
+    AGENTMIX_PURGE_BATCH_SIZE       messages deleted per transaction (default 500)
+    AGENTMIX_PURGE_PAUSE_SECONDS    pause between batches (default 0.05)
+    AGENTMIX_PURGE_GRACE_SECONDS    age of a deletion before it is purged (default 30)
+    AGENTMIX_PURGE_INTERVAL_SECONDS how often the job looks for work when not woken (default 60)
+
+The job runs in one process (see AGENTMIX_BACKGROUND_JOBS in main.py). A delete
+handled by another web worker cannot wake it and is purged on its next interval.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from src.models.user import db
+from src.models.message import Message
+from src.models.conversation import Conversation
+from src.models.conversation_state import ConversationState
+from src.models.message_embedding import MessageEmbedding
+from src.services.message_archive import delete_archive
+from src.services.vector_index import vector_index
+from src.services.event_replay import replay_buffer
+from src.services.message_render import message_renders
+
+# Conversations purged per pass of the job
+PURGE_LIMIT = 20
+
+_wake = threading.Event()
+
+
+def mark_deleted(conversation_ids: List[str]) -> int:
+    """Hide conversations and queue them for purging (caller stops them first and commits)"""
+    if not conversation_ids:
+        return 0
+    for conversation_id in conversation_ids:
+        vector_index.forget(conversation_id)
+        replay_buffer.forget(conversation_id)
+        message_renders.forget_conversation(conversation_id)
+    return Conversation.query.filter(
+        Conversation.id.in_(conversation_ids),
+        Conversation.status != 'deleted'
+    ).update({
+        Conversation.status: 'deleted',
+        Conversation.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+
+
+def purge_conversation(conversation_id: str, batch_size: int = None, pause: float = None) -> int:
+    """Delete a conversation's rows batch by batch; returns the number of messages removed"""
+    if batch_size is None:
+        batch_size = int(os.environ.get('AGENTMIX_PURGE_BATCH_SIZE', 500))
+    if pause is None:
+        pause = float(os.environ.get('AGENTMIX_PURGE_PAUSE_SECONDS', 0.05))
+
+    removed = 0
+    while True:
+        ids = [
+            message_id for (message_id,) in
+            db.session.query(Message.id).filter(Message.conversation_id == conversation_id).limit(batch_size)
+        ]
+        if not ids:
+            break
+        MessageEmbedding.query.filter(MessageEmbedding.message_id.in_(ids)).delete(synchronize_session=False)
+        Message.query.filter(Message.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+        # Let other writers in between batches
+        time.sleep(pause)
+
+    # Leftover vectors of messages that were archived or bulk inserted
+    MessageEmbedding.query.filter_by(conversation_id=conversation_id).delete(synchronize_session=False)
+    delete_archive(conversation_id)
+    ConversationState.query.filter_by(conversation_id=conversation_id).delete(synchronize_session=False)
+    conversation = Conversation.query.get(conversation_id)
+    if conversation is not None:
+        db.session.delete(conversation)
+    db.session.commit()
+    # A turn that was in flight when the conversation was marked may have cached it again
+    vector_index.forget(conversation_id)
+    replay_buffer.forget(conversation_id)
+    message_renders.forget_conversation(conversation_id)
+    return removed
+
+
+def purge_deleted_conversations(grace_seconds: float = None, limit: int = PURGE_LIMIT) -> Dict[str, int]:
+    """Purge conversations marked deleted at least ``grace_seconds`` ago (requires an app context)"""
+    if grace_seconds is None:
+        grace_seconds = float(os.environ.get('AGENTMIX_PURGE_GRACE_SECONDS', 30))
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    conversation_ids = [
+        conversation_id for (conversation_id,) in
+        db.session.query(Conversation.id).filter(
+            Conversation.status == 'deleted',
+            Conversation.updated_at <= cutoff
+        ).order_by(Conversation.updated_at).limit(limit)
+    ]
+
+    purged = {}
+    for conversation_id in conversation_ids:
+        try:
+            purged[conversation_id] = purge_conversation(conversation_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error purging conversation {conversation_id}: {e}")
+    return purged
+
+
+def request_purge():
+    """Wake the purge job instead of waiting for its next interval"""
+    _wake.set()
+
+
+def start_purge_worker(app, interval: float = None) -> Optional[threading.Thread]:
+    """Run the purge job in a background thread"""
+    if interval is None:
+        interval = float(os.environ.get('AGENTMIX_PURGE_INTERVAL_SECONDS', 60))
+    grace = float(os.environ.get('AGENTMIX_PURGE_GRACE_SECONDS', 30))
+
+    def run():
+        while True:
+            woken = _wake.wait(interval)
+            _wake.clear()
+            if woken:
+                # Deletions only become purgeable once the grace period is over
+                time.sleep(grace)
+            with app.app_context():
+                try:
+                    while True:
+                        purged = purge_deleted_conversations()
+                        if purged:
+                            print(f"Purged {len(purged)} deleted conversation(s), {sum(purged.values())} messages")
+                        if len(purged) < PURGE_LIMIT:
+                            break
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error in purge job: {e}")
+
+    thread = threading.Thread(target=run, daemon=True, name='agentmix-purge')
+    thread.start()
+    return thread
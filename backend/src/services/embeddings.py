@@ -0,0 +1,89 @@
+"""
+Text embedders for message retrieval.
+
+An embedder has a ``name`` (stored with every vector, so switching embedders
+re-embeds history instead of mixing spaces), a ``dim`` and ``embed(text)``
+returning an L2-normalised list of floats. The default HashingEmbedder needs no
+model download or network access: it hashes word unigrams and bigrams into a
+fixed number of signed buckets with sublinear term frequency.
+
+Configuration:
+    AGENTMIX_EMBEDDER       'hashing' (default) or 'package.module:factory' for a custom embedder
+    AGENTMIX_EMBEDDING_DIM  dimensions of the hashing embedder (default 256)
+"""
+
+import hashlib
+import importlib
+import math
+import os
+import re
+from collections import Counter
+from typing import List, Optional
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can could do for from has have i if in into is it its
+i'm i'd i'll let me my of on or our so that the their then there these this to us was
+we what when which will with would you your
+""".split())
+
+
+class HashingEmbedder:
+    """Feature-hashing bag of unigrams and bigrams"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def tokenize(self, text: str) -> List[str]:
+        return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+    def embed(self, text: str) -> List[float]:
+        tokens = self.tokenize(text or '')
+        features = [(Counter(tokens), 1.0)]
+        # Bigrams carry half weight; they sharpen matches on phrases
+        features.append((Counter(f"{first} {second}" for first, second in zip(tokens, tokens[1:])), 0.5))
+
+        vector = [0.0] * self.dim
+        for counts, weight in features:
+            for feature, count in counts.items():
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                bucket = int.from_bytes(digest, 'little')
+                sign = 1.0 if bucket >> 63 else -1.0
+                vector[bucket % self.dim] += sign * weight * (1.0 + math.log(count))
+
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm == 0:
+            return vector
+        return [value / norm for value in vector]
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed(text) for text in texts]
+
+
+_embedder = None
+
+
+def load_embedder(spec: str = None):
+    """Build the embedder named by ``spec`` (or AGENTMIX_EMBEDDER)"""
+    spec = spec or os.environ.get('AGENTMIX_EMBEDDER', 'hashing')
+    if spec == 'hashing':
+        return HashingEmbedder(int(os.environ.get('AGENTMIX_EMBEDDING_DIM', 256)))
+    module_name, _, factory_name = spec.partition(':')
+    if not factory_name:
+        raise ValueError(f"AGENTMIX_EMBEDDER must be 'hashing' or 'module:factory', got {spec!r}")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = load_embedder()
+    return _embedder
+
+
+def set_embedder(embedder: Optional[object]):
+    """Replace the process-wide embedder (None reloads it from the environment)"""
+    global _embedder
+    _embedder = embedder
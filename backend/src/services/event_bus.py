@@ -0,0 +1,121 @@
+"""
+In-process fan-out of conversation events to Server-Sent Events streams.
+
+The bus is a RoomEmitter listener, so it sees every conversation event the
+Socket.IO rooms get, including events of headless conversations. An event is
+encoded once, however many streams receive it. Each stream has a bounded
+queue (AGENTMIX_SSE_QUEUE_SIZE, default 1000). A stream that falls that far
+behind is closed, and its client reconnects with Last-Event-ID and catches up
+from the replay buffer or the database.
+
+Subscribers are counted in presence (room ``conversation_<id>:sse``), so
+conversations watched only over SSE are still treated as attended.
+
+Events of conversations run by sharded orchestrator workers reach the bus
+either as relayed emits or, when the workers emit through
+AGENTMIX_SOCKETIO_MESSAGE_QUEUE, as events the worker passes to every web
+process over the broker (see orchestrator_worker).
+"""
+
+import itertools
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from src.services.event_emitter import sse_room
+from src.services.presence import presence
+
+
+def encode_sse(event: str, data: Any) -> str:
+    """The event and data lines of an SSE message (without the id line)"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def event_message_id(event: str, data: Any) -> Optional[int]:
+    """The message id an event carries, usable as its SSE id"""
+    if event == 'new_message' and isinstance(data, dict) and isinstance(data.get('message'), dict):
+        return data['message'].get('id')
+    return None
+
+
+class Subscription:
+    """One SSE stream's queue of (conversation_id, message id or None, encoded event)"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, conversation_ids: Iterable[str], size: int):
+        self.key = f'sse:{next(self._ids)}'
+        self.conversation_ids = list(conversation_ids)
+        self.size = size
+        self.events: deque = deque()
+        self.overflowed = False
+
+    def put(self, item: Tuple[str, Optional[int], str]):
+        if len(self.events) >= self.size:
+            # Too far behind: the stream ends and the client resumes from Last-Event-ID
+            self.overflowed = True
+            return
+        self.events.append(item)
+
+    def drain(self) -> List[Tuple[str, Optional[int], str]]:
+        items = []
+        while self.events:
+            items.append(self.events.popleft())
+        return items
+
+
+class EventBus:
+    """Conversation events, fanned out to SSE subscriptions"""
+
+    def __init__(self, queue_size: int = None):
+        self.queue_size = queue_size or int(os.environ.get('AGENTMIX_SSE_QUEUE_SIZE', 1000))
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+        self.lock = threading.Lock()
+        self.published = 0
+        self.overflows = 0
+
+    def publish(self, conversation_id: str, event: str, data: Any):
+        """RoomEmitter listener"""
+        subscriptions = self.subscribers.get(conversation_id)
+        if not subscriptions:
+            return
+        item = (conversation_id, event_message_id(event, data), encode_sse(event, data))
+        with self.lock:
+            subscriptions = list(self.subscribers.get(conversation_id, ()))
+        for subscription in subscriptions:
+            overflowed = subscription.overflowed
+            subscription.put(item)
+            if subscription.overflowed and not overflowed:
+                self.overflows += 1
+        self.published += 1
+
+    def subscribe(self, conversation_ids: Iterable[str]) -> Subscription:
+        subscription = Subscription(conversation_ids, self.queue_size)
+        with self.lock:
+            for conversation_id in subscription.conversation_ids:
+                self.subscribers.setdefault(conversation_id, set()).add(subscription)
+                presence.join(subscription.key, sse_room(conversation_id))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            for conversation_id in subscription.conversation_ids:
+                subscriptions = self.subscribers.get(conversation_id)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self.subscribers[conversation_id]
+        presence.disconnect(subscription.key)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'conversations': len(self.subscribers),
+                'streams': len({sub for subs in self.subscribers.values() for sub in subs}),
+                'published': self.published,
+                'overflows': self.overflows
+            }
+
+
+event_bus = EventBus()
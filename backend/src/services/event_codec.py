@@ -0,0 +1,155 @@
+"""
+Compact binary encoding of conversation events.
+
+Clients that join a conversation with ``{'encoding': 'msgpack'}`` receive each
+burst of events as one ``event_packed`` frame whose payload is MessagePack
+bytes (sent as a Socket.IO binary attachment):
+
+    {'c': conversation_id, 'e': [[event code, data], ...]}
+
+Event names and the common field names are replaced by the short codes in
+EVENT_CODES and FIELD_CODES (sent to the client in ``joined_conversation``),
+and the conversation id is dropped from each event since the frame carries it.
+Unknown events and fields keep their names. msgpack is in requirements.txt;
+an install without it sends such clients JSON ``event_batch`` frames instead.
+
+Run ``python -m src.services.event_codec`` from backend/ for a comparison of
+bytes on the wire per encoding.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+EVENT_CODES = {
+    'new_message': 1,
+    'conversation_status': 2,
+    'conversation_paused': 3,
+    'conversation_resumed': 4,
+    'human_input_requested': 5,
+    'conversation_queued': 6
+}
+
+FIELD_CODES = {
+    'conversation_id': 'c',
+    'message': 'm',
+    'id': 'i',
+    'sender_type': 't',
+    'sender_name': 'n',
+    'content': 'b',
+    'timestamp': 'ts',
+    'message_type': 'k',
+    'usage': 'u',
+    'input_tokens': 'ui',
+    'output_tokens': 'uo',
+    'status': 's',
+    'reason': 'r',
+    'requesting_agent': 'ra',
+    'request_message': 'rm',
+    'queue_position': 'qp',
+    'queue_length': 'ql'
+}
+
+_EVENT_NAMES = {code: event for event, code in EVENT_CODES.items()}
+_FIELD_NAMES = {code: field for field, code in FIELD_CODES.items()}
+
+
+def available() -> bool:
+    """Whether MessagePack encoding can be offered to clients"""
+    return msgpack is not None
+
+
+def codebook() -> Dict[str, Any]:
+    """Code tables a client needs to expand packed frames"""
+    return {'events': EVENT_CODES, 'fields': FIELD_CODES}
+
+
+def _rename(value: Any, names: Dict[str, str]) -> Any:
+    if isinstance(value, dict):
+        return {names.get(key, key): _rename(item, names) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rename(item, names) for item in value]
+    return value
+
+
+def compact_events(conversation_id: str, events: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    """Replace event and field names with their codes"""
+    packed = []
+    for event, data in events:
+        if isinstance(data, dict) and data.get('conversation_id') == conversation_id:
+            data = {key: value for key, value in data.items() if key != 'conversation_id'}
+        packed.append([EVENT_CODES.get(event, event), _rename(data, FIELD_CODES)])
+    return {'c': conversation_id, 'e': packed}
+
+
+def expand_events(frame: Dict[str, Any]) -> Tuple[str, List[Tuple[str, Any]]]:
+    """Inverse of compact_events"""
+    conversation_id = frame['c']
+    events = []
+    for code, data in frame['e']:
+        data = _rename(data, _FIELD_NAMES)
+        if isinstance(data, dict):
+            data.setdefault('conversation_id', conversation_id)
+        events.append((_EVENT_NAMES.get(code, code), data))
+    return conversation_id, events
+
+
+def encode_events(conversation_id: str, events: List[Tuple[str, Any]]) -> Optional[bytes]:
+    """MessagePack bytes for an event_packed frame, or None without msgpack"""
+    if msgpack is None:
+        return None
+    return msgpack.packb(compact_events(conversation_id, events), use_bin_type=True)
+
+
+def decode_events(payload: bytes) -> Tuple[str, List[Tuple[str, Any]]]:
+    return expand_events(msgpack.unpackb(payload, raw=False))
+
+
+def wire_sizes(conversation_id: str, events: List[Tuple[str, Any]]) -> Dict[str, Optional[int]]:
+    """Payload bytes of the same events as per-event JSON, an event_batch frame and an event_packed frame"""
+    separators = (',', ':')
+    packed = encode_events(conversation_id, events)
+    return {
+        'json_per_event': sum(len(json.dumps([event, data], separators=separators)) for event, data in events),
+        'json_batch': len(json.dumps(['event_batch', {
+            'conversation_id': conversation_id,
+            'events': [{'event': event, 'data': data} for event, data in events]
+        }], separators=separators)),
+        'compact_json': len(json.dumps(compact_events(conversation_id, events), separators=separators)),
+        'msgpack': len(packed) if packed is not None else None
+    }
+
+
+def _sample_events(count: int) -> List[Tuple[str, Any]]:
+    conversation_id = '6f1c0b8e-3a57-4f6e-9d2a-1f0e5c7b9a42'
+    events = []
+    for i in range(count):
+        events.append(('new_message', {
+            'conversation_id': conversation_id,
+            'message': {
+                'id': 1000 + i,
+                'sender_type': 'ai',
+                'sender_name': f'Agent {i % 3}',
+                'content': 'Building on that, we could cache the rendered prompt prefix per agent.',
+                'timestamp': '2025-01-01T12:00:%02d.123456' % (i % 60),
+                'message_type': 'ai',
+                'usage': {'input_tokens': 812, 'output_tokens': 37}
+            }
+        }))
+    return events
+
+
+if __name__ == '__main__':
+    sample = _sample_events(50)
+    conversation = sample[0][1]['conversation_id']
+    print(f"msgpack {'available' if available() else 'not installed'}")
+    for burst in (1, 10, 50):
+        sizes = wire_sizes(conversation, sample[:burst])
+        baseline = sizes['json_per_event']
+        print(f"{burst:>3} new_message events: " + ', '.join(
+            f"{name} {size} B ({size / baseline:.0%})" for name, size in sizes.items() if size is not None
+        ))
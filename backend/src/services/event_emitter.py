@@ -0,0 +1,252 @@
+"""
+Coalesced per-room Socket.IO emission.
+
+RoomEmitter wraps the Socket.IO server and is handed to the orchestrator in its
+place. Events addressed to a conversation room are held for a few milliseconds
+(AGENTMIX_EMIT_BATCH_MS, default 10; 0 disables batching) and then sent
+together, in the order they were emitted. Clients that join a conversation with
+``{'batch': true}`` are put in the conversation's batch room and get the whole
+backlog as one ``event_batch`` frame:
+
+    {'conversation_id': ..., 'events': [{'event': 'new_message', 'data': {...}}, ...]}
+
+Clients joining with ``{'encoding': 'msgpack'}`` get the same burst as one
+binary ``event_packed`` frame instead (see event_codec). Other clients keep
+receiving one frame per event. Events in IMMEDIATE_EVENTS
+flush the room's backlog and go out at once, as does any room whose backlog
+reaches AGENTMIX_EMIT_BATCH_MAX events (default 100). Emits without a
+conversation room pass straight through; broadcasts that name their
+conversation (``conversation_id=``) are still passed to the listeners.
+
+Given a PresenceTracker, rooms known to be empty are skipped, and events of a
+conversation nobody watches are only passed to the listeners (the replay
+buffer) - never rendered or sent.
+"""
+
+import heapq
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from src.services import event_codec
+
+ROOM_PREFIX = 'conversation_'
+BATCH_ROOM_SUFFIX = ':batch'
+PACKED_ROOM_SUFFIX = ':msgpack'
+# Presence key of Server-Sent Events subscribers (not a Socket.IO room)
+SSE_ROOM_SUFFIX = ':sse'
+
+# Events a waiting human should see without any added delay
+IMMEDIATE_EVENTS = {'human_input_requested', 'conversation_paused', 'conversation_resumed'}
+
+
+def conversation_room(conversation_id: str) -> str:
+    """Room of clients receiving one frame per event"""
+    return f'{ROOM_PREFIX}{conversation_id}'
+
+
+def batch_room(conversation_id: str) -> str:
+    """Room of clients that opted into event_batch frames"""
+    return f'{ROOM_PREFIX}{conversation_id}{BATCH_ROOM_SUFFIX}'
+
+
+def packed_room(conversation_id: str) -> str:
+    """Room of clients that opted into MessagePack event_packed frames"""
+    return f'{ROOM_PREFIX}{conversation_id}{PACKED_ROOM_SUFFIX}'
+
+
+def sse_room(conversation_id: str) -> str:
+    return f'{ROOM_PREFIX}{conversation_id}{SSE_ROOM_SUFFIX}'
+
+
+def conversation_rooms(conversation_id: str) -> List[str]:
+    """Every room a viewer of the conversation may have joined"""
+    return [conversation_room(conversation_id), batch_room(conversation_id), packed_room(conversation_id)]
+
+
+def render_frames(conversation_id: str, events: List[Tuple[str, Any]], mode: str) -> List[Tuple[str, Any]]:
+    """(event, payload) frames carrying ``events`` to a client of the given mode.
+
+    Modes: 'events' (one frame per event), 'batch' (one event_batch frame) and
+    'msgpack' (one event_packed frame).
+    """
+    if mode == 'msgpack':
+        return [('event_packed', event_codec.encode_events(conversation_id, events))]
+    if mode == 'batch':
+        return [('event_batch', {
+            'conversation_id': conversation_id,
+            'events': [{'event': event, 'data': data} for event, data in events]
+        })]
+    return list(events)
+
+
+def room_conversation_id(room: Any) -> Optional[str]:
+    """Conversation id of a plain conversation room name, else None"""
+    if (isinstance(room, str) and room.startswith(ROOM_PREFIX)
+            and not room.endswith((BATCH_ROOM_SUFFIX, PACKED_ROOM_SUFFIX, SSE_ROOM_SUFFIX))):
+        return room[len(ROOM_PREFIX):]
+    return None
+
+
+class RoomEmitter:
+    """Drop-in stand-in for the Socket.IO server that coalesces emits per conversation room"""
+
+    def __init__(self, socketio, window_ms: float = None, max_batch: int = None, presence=None):
+        self.socketio = socketio
+        # PresenceTracker of this process; nothing is suppressed without one
+        self.presence = presence
+        if window_ms is None:
+            window_ms = float(os.environ.get('AGENTMIX_EMIT_BATCH_MS', 10))
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch or int(os.environ.get('AGENTMIX_EMIT_BATCH_MAX', 100))
+        # conversation_id -> [(event, data)] waiting to be sent
+        self.pending: Dict[str, List[Tuple[str, Any]]] = {}
+        # (deadline, conversation_id) for each room with a backlog
+        self.deadlines: List[Tuple[float, str]] = []
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        # Held while sending so a room's frames never interleave out of order
+        self.send_lock = threading.RLock()
+        self.flusher = None
+        self.frames_sent = 0
+        self.events_sent = 0
+        self.events_suppressed = 0
+        # Callables (conversation_id, event, data) told of every conversation event
+        self.listeners = []
+
+    def __getattr__(self, name):
+        # Everything else (server, on, start_background_task, ...) is the real server's
+        return getattr(self.socketio, name)
+
+    def emit(self, event: str, data: Any = None, room: str = None, immediate: bool = None,
+             conversation_id: str = None, **kwargs):
+        """Queue an event for a conversation room, or emit it directly otherwise.
+
+        ``conversation_id`` marks a broadcast as an event of that conversation,
+        so listeners (the SSE bus) see it too.
+        """
+        room_id = room_conversation_id(room)
+        if room_id is None or kwargs:
+            if conversation_id is not None:
+                self.notify(conversation_id, event, data)
+            if room:
+                kwargs['room'] = room
+            elif self.presence is not None and not self.presence.has_connections():
+                self.events_suppressed += 1
+                return
+            self.socketio.emit(event, data, **kwargs)
+            return
+        conversation_id = room_id
+        self.notify(conversation_id, event, data)
+        if self.presence is not None and self.presence.is_headless(conversation_id):
+            # Nobody to send it to: skip rendering and sending altogether
+            self.events_suppressed += 1
+            return
+        if immediate is None:
+            immediate = event in IMMEDIATE_EVENTS
+        if immediate or self.window <= 0:
+            with self.send_lock:
+                self._send(conversation_id, self._take(conversation_id) + [(event, data)])
+            return
+
+        with self.lock:
+            backlog = self.pending.get(conversation_id)
+            if backlog is None:
+                backlog = self.pending[conversation_id] = []
+                heapq.heappush(self.deadlines, (time.monotonic() + self.window, conversation_id))
+                self._ensure_flusher()
+                self.ready.notify()
+            backlog.append((event, data))
+            full = len(backlog) >= self.max_batch
+        if full:
+            self.flush(conversation_id)
+
+    def notify(self, conversation_id: str, event: str, data: Any):
+        """Tell the listeners of a conversation event without sending it"""
+        for listener in self.listeners:
+            try:
+                listener(conversation_id, event, data)
+            except Exception as e:
+                print(f"Error in event listener for {event}: {e}")
+
+    def flush(self, conversation_id: str = None):
+        """Send the backlog of one conversation room, or of every room"""
+        with self.send_lock:
+            if conversation_id is not None:
+                self._send(conversation_id, self._take(conversation_id))
+                return
+            with self.lock:
+                conversation_ids = list(self.pending)
+            for pending_id in conversation_ids:
+                self._send(pending_id, self._take(pending_id))
+
+    def _take(self, conversation_id: str) -> List[Tuple[str, Any]]:
+        with self.lock:
+            # A deadline left in the heap at most flushes a later backlog early
+            return self.pending.pop(conversation_id, [])
+
+    def _send(self, conversation_id: str, events: List[Tuple[str, Any]]):
+        """Emit a backlog: one frame per event to the plain room, one frame each to the batch and packed rooms"""
+        if not events:
+            return
+        try:
+            rooms = [('events', conversation_room(conversation_id)), ('batch', batch_room(conversation_id))]
+            if event_codec.available():
+                rooms.append(('msgpack', packed_room(conversation_id)))
+            for mode, room in rooms:
+                if not self._room_occupied(room):
+                    continue
+                for event, data in render_frames(conversation_id, events, mode):
+                    self.socketio.emit(event, data, room=room)
+                    self.frames_sent += 1
+            self.events_sent += len(events)
+        except Exception as e:
+            print(f"Error emitting events for conversation {conversation_id}: {e}")
+
+    def _room_occupied(self, room: str) -> bool:
+        """False only for rooms known to be empty"""
+        return self.presence is None or not self.presence.room_is_empty(room)
+
+    def _ensure_flusher(self):
+        if self.flusher is None or not self.flusher.is_alive():
+            self.flusher = threading.Thread(target=self._run_flusher, daemon=True, name='agentmix-emit')
+            self.flusher.start()
+
+    def _run_flusher(self):
+        """Send each room's backlog once its batching window has passed"""
+        while True:
+            with self.lock:
+                while not self.deadlines:
+                    self.ready.wait()
+                deadline, conversation_id = self.deadlines[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.ready.wait(delay)
+                    continue
+                heapq.heappop(self.deadlines)
+            self.flush(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            pending = sum(len(events) for events in self.pending.values())
+        return {
+            'window_ms': self.window * 1000.0,
+            'events_sent': self.events_sent,
+            'events_suppressed': self.events_suppressed,
+            'frames_sent': self.frames_sent,
+            'pending_events': pending
+        }
+
+
+room_emitter = None
+
+
+def get_room_emitter() -> Optional[RoomEmitter]:
+    return room_emitter
+
+
+def init_room_emitter(socketio, presence=None) -> RoomEmitter:
+    """Wrap the Socket.IO server in the global RoomEmitter"""
+    global room_emitter
+    room_emitter = RoomEmitter(socketio, presence=presence)
+    return room_emitter
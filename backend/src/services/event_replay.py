@@ -0,0 +1,138 @@
+"""
+Replay of missed messages when a viewer rejoins a conversation.
+
+A client that reconnects sends the id of the last message it saw with
+``join_conversation`` (``last_seen_id``) and is sent only the messages after
+it, in the frame format it joined with. Recent ``new_message`` payloads are
+kept per conversation in an in-memory ring buffer fed by the RoomEmitter
+(AGENTMIX_REPLAY_BUFFER_SIZE messages for each of the
+AGENTMIX_REPLAY_CONVERSATIONS most recently active conversations). When the
+buffer does not reach back to ``last_seen_id`` - after a restart, or for
+conversations emitting from another process - the messages are read with a
+range query on the (conversation_id, id) index.
+
+At most AGENTMIX_REPLAY_MAX messages (default 500) are replayed; beyond that
+the client is told the replay was truncated and should reload the history.
+A message emitted while the client joins may arrive both live and in the
+replay, so clients should ignore ids they already have.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+from src.models.user import db
+from src.models.message import Message
+from src.models.ai_agent import AIAgent
+
+
+def get_replay_limit() -> int:
+    return int(os.environ.get('AGENTMIX_REPLAY_MAX', 500))
+
+
+def message_payload(message_id: int, message_type: str, sender_name: Optional[str], content: str,
+                    timestamp, metadata: Optional[str] = None) -> Dict[str, Any]:
+    """The ``message`` of a new_message event, rebuilt from a stored row"""
+    sender_type = message_type if message_type in ('human', 'system') else 'ai'
+    payload = {
+        'id': message_id,
+        'sender_type': sender_type,
+        'sender_name': sender_name or {'human': 'User', 'system': 'System'}.get(sender_type),
+        'content': content,
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'message_type': message_type
+    }
+    if metadata:
+        try:
+            usage = json.loads(metadata).get('usage')
+        except (ValueError, AttributeError):
+            usage = None
+        if usage:
+            payload['usage'] = usage
+    return payload
+
+
+def load_messages_since(conversation_id: str, last_seen_id: int, limit: int) -> List[Dict[str, Any]]:
+    """Messages after ``last_seen_id``, oldest first (requires an app context)"""
+    rows = db.session.query(
+        Message.id, Message.message_type, AIAgent.name, Message.content,
+        Message.timestamp, Message.message_metadata
+    ).outerjoin(AIAgent, AIAgent.id == Message.sender_id).filter(
+        Message.conversation_id == conversation_id,
+        Message.id > last_seen_id
+    ).order_by(Message.id).limit(limit).all()
+    return [message_payload(*row) for row in rows]
+
+
+class ReplayBuffer:
+    """Ring buffers of recent new_message payloads, one per conversation"""
+
+    def __init__(self, size: int = None, conversations: int = None):
+        self.size = size or int(os.environ.get('AGENTMIX_REPLAY_BUFFER_SIZE', 200))
+        self.max_conversations = conversations or int(os.environ.get('AGENTMIX_REPLAY_CONVERSATIONS', 1000))
+        self.buffers: 'OrderedDict[str, deque]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def on_event(self, conversation_id: str, event: str, data: Any):
+        """RoomEmitter listener"""
+        if event == 'new_message' and isinstance(data, dict) and isinstance(data.get('message'), dict):
+            self.record(conversation_id, data['message'])
+
+    def record(self, conversation_id: str, message: Dict[str, Any]):
+        if message.get('id') is None:
+            return
+        with self.lock:
+            buffer = self.buffers.get(conversation_id)
+            if buffer is None:
+                buffer = self.buffers[conversation_id] = deque(maxlen=self.size)
+                if len(self.buffers) > self.max_conversations:
+                    self.buffers.popitem(last=False)
+            else:
+                self.buffers.move_to_end(conversation_id)
+            if not buffer or message['id'] > buffer[-1]['id']:
+                buffer.append(message)
+            elif all(buffered['id'] != message['id'] for buffered in buffer):
+                # Emitted out of commit order (e.g. a human message racing an agent turn)
+                ordered = sorted([*buffer, message], key=lambda buffered: buffered['id'])
+                buffer.clear()
+                buffer.extend(ordered[-self.size:])
+
+    def since(self, conversation_id: str, last_seen_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Buffered messages after ``last_seen_id``, or None if the buffer does not reach back that far"""
+        with self.lock:
+            buffer = self.buffers.get(conversation_id)
+            # Only ids from the oldest buffered one onwards are known to be complete
+            if not buffer or last_seen_id < buffer[0]['id']:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [message for message in buffer if message['id'] > last_seen_id]
+
+    def forget(self, conversation_id: str):
+        with self.lock:
+            self.buffers.pop(conversation_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'conversations': len(self.buffers),
+                'messages': sum(len(buffer) for buffer in self.buffers.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+replay_buffer = ReplayBuffer()
+
+
+def replay_messages(conversation_id: str, last_seen_id: int,
+                    limit: int = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """Messages a client missed since ``last_seen_id`` and whether the list was cut at ``limit``"""
+    limit = limit or get_replay_limit()
+    messages = replay_buffer.since(conversation_id, last_seen_id)
+    if messages is None:
+        messages = load_messages_since(conversation_id, last_seen_id, limit + 1)
+    return messages[:limit], len(messages) > limit
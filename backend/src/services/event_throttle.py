@@ -0,0 +1,220 @@
+"""
+Limits on what a single Socket.IO client can make the server do.
+
+Every inbound event a client sends is charged to a token bucket of its own
+(per socket and event name). Events over the limit are dropped and counted; the
+client gets one ``rate_limited`` notice each time it starts being throttled,
+not one per dropped event.
+
+Typing indicators are coalesced: each socket's typing state in a conversation
+is relayed at most once per AGENTMIX_TYPING_INTERVAL_MS (default 1000), always
+ending on the latest state, and repeats of the state already relayed are
+dropped. A client that leaves or disconnects while typing is shown as stopped.
+
+Configuration:
+    AGENTMIX_SOCKET_EVENT_RATES   events per second per socket, e.g. "send_human_message=2,*=20"
+                                  (overrides DEFAULT_EVENT_RATES; '*' is any other event)
+    AGENTMIX_SOCKET_BURST_FACTOR  bucket size in seconds' worth of the rate (default 3)
+    AGENTMIX_TYPING_INTERVAL_MS   minimum spacing of relayed typing updates (default 1000)
+"""
+
+import heapq
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from src.services.lanes import parse_limits
+
+# Events per second per socket; 0 means unlimited
+DEFAULT_EVENT_RATES = {
+    'send_human_message': 2,
+    'request_human_input': 1,
+    'start_conversation': 1,
+    'stop_conversation': 1,
+    'pause_conversation': 1,
+    'resume_conversation': 1,
+    'get_conversation_status': 5,
+    'join_conversation': 5,
+    'leave_conversation': 5,
+    'typing_start': 10,
+    # A dropped stop would leave the user shown as typing; the coalescer keeps it cheap
+    'typing_stop': 0,
+    '*': 20
+}
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second with bursts of up to ``capacity``"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'throttled')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.throttled = False
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class InboundThrottle:
+    """Per-socket token buckets for inbound events"""
+
+    def __init__(self, rates: Dict[str, int] = None, burst_factor: float = None):
+        self.rates = dict(DEFAULT_EVENT_RATES)
+        self.rates.update(rates if rates is not None else
+                          parse_limits(os.environ.get('AGENTMIX_SOCKET_EVENT_RATES', '')))
+        if burst_factor is None:
+            burst_factor = float(os.environ.get('AGENTMIX_SOCKET_BURST_FACTOR', 3))
+        self.burst_factor = max(1.0, burst_factor)
+        self.buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self.dropped = Counter()
+        self.lock = threading.Lock()
+
+    def _bucket(self, sid: str, event: str) -> Optional[TokenBucket]:
+        buckets = self.buckets.setdefault(sid, {})
+        bucket = buckets.get(event)
+        if bucket is None:
+            rate = self.rates.get(event, self.rates.get('*', 0))
+            if rate <= 0:
+                return None
+            bucket = buckets[event] = TokenBucket(rate, rate * self.burst_factor)
+        return bucket
+
+    def check(self, sid: str, event: str) -> Tuple[bool, bool, float]:
+        """(allowed, first drop since the client was last allowed, seconds until a retry would pass)"""
+        with self.lock:
+            bucket = self._bucket(sid, event)
+            if bucket is None:
+                return True, False, 0.0
+            if bucket.take():
+                bucket.throttled = False
+                return True, False, 0.0
+            self.dropped[event] += 1
+            first = not bucket.throttled
+            bucket.throttled = True
+            return False, first, bucket.retry_after()
+
+    def forget(self, sid: str):
+        with self.lock:
+            self.buckets.pop(sid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'sockets': len(self.buckets), 'dropped': dict(self.dropped)}
+
+
+class TypingCoalescer:
+    """Relays each socket's typing state per conversation at most once per interval"""
+
+    def __init__(self, send, interval_ms: float = None):
+        # send(conversation_id, sid, user_name, typing) relays one update
+        self.send = send
+        if interval_ms is None:
+            interval_ms = float(os.environ.get('AGENTMIX_TYPING_INTERVAL_MS', 1000))
+        self.interval = interval_ms / 1000.0
+        # (conversation_id, sid) -> {'sent', 'sent_at', 'wanted', 'user_name', 'scheduled'}
+        self.states: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.deadlines: List[Tuple[float, Tuple[str, str]]] = []
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.flusher = None
+        self.relayed = 0
+        self.coalesced = 0
+
+    def update(self, conversation_id: str, sid: str, user_name: str, typing: bool):
+        """Record a typing_start/typing_stop; relays now, later, or not at all"""
+        key = (conversation_id, sid)
+        with self.lock:
+            state = self.states.setdefault(key, {'sent': False, 'sent_at': 0.0, 'scheduled': False})
+            state['wanted'] = typing
+            state['user_name'] = user_name
+            if state['scheduled'] or state['wanted'] == state['sent']:
+                # Already relayed, or will be once the interval is over
+                self.coalesced += 1
+                return
+            due = state['sent_at'] + self.interval
+            if due > time.monotonic():
+                state['scheduled'] = True
+                heapq.heappush(self.deadlines, (due, key))
+                self._ensure_flusher()
+                self.ready.notify()
+                return
+            self._mark_sent(state)
+        self.send(conversation_id, sid, user_name, typing)
+
+    def _mark_sent(self, state):  # called with the lock held
+        state['sent'] = state['wanted']
+        state['sent_at'] = time.monotonic()
+        self.relayed += 1
+
+    def leave(self, sid: str, conversation_id: str = None):
+        """Show a client that left (one conversation, or all on disconnect) as no longer typing"""
+        stopped = []
+        with self.lock:
+            for key in [key for key in self.states if key[1] == sid and conversation_id in (None, key[0])]:
+                state = self.states.pop(key)
+                if state['sent']:
+                    stopped.append((key[0], state['user_name']))
+        for stopped_id, user_name in stopped:
+            self.send(stopped_id, sid, user_name, False)
+
+    def _ensure_flusher(self):
+        if self.flusher is None or not self.flusher.is_alive():
+            self.flusher = threading.Thread(target=self._run_flusher, daemon=True, name='agentmix-typing')
+            self.flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            with self.lock:
+                while not self.deadlines:
+                    self.ready.wait()
+                due, key = self.deadlines[0]
+                if due > time.monotonic():
+                    self.ready.wait(due - time.monotonic())
+                    continue
+                heapq.heappop(self.deadlines)
+                state = self.states.get(key)
+                if state is None or not state['scheduled']:
+                    continue
+                state['scheduled'] = False
+                if state['wanted'] == state['sent']:
+                    continue
+                self._mark_sent(state)
+                update = (key[0], key[1], state['user_name'], state['sent'])
+            try:
+                self.send(*update)
+            except Exception as e:
+                print(f"Error relaying typing state: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'relayed': self.relayed, 'coalesced': self.coalesced, 'tracked': len(self.states)}
+
+
+inbound_throttle = InboundThrottle()
+
+typing_coalescer = None
+
+
+def get_typing_coalescer() -> Optional[TypingCoalescer]:
+    return typing_coalescer
+
+
+def init_typing_coalescer(send) -> TypingCoalescer:
+    """Create the global TypingCoalescer relaying updates through ``send``"""
+    global typing_coalescer
+    typing_coalescer = TypingCoalescer(send)
+    return typing_coalescer
@@ -0,0 +1,201 @@
+"""
+Priority lanes for conversation scheduling.
+
+Conversations run in one of three lanes:
+    interactive  a human is watching (room subscribers) or recently took part (HITL)
+    normal       everything else
+    bulk         background batch runs (explicit options['lane'] = 'bulk')
+
+Wherever conversations wait for capacity (admission slots, provider call slots)
+the lanes share it by smooth weighted round-robin, so interactive work gets most
+of a contended resource without shutting the others out. Starvation protection
+serves whatever has waited longer than the aging limit first, whatever its lane.
+
+Configuration:
+    AGENTMIX_LANE_WEIGHTS              e.g. "interactive=6,normal=3,bulk=1" (the default)
+    AGENTMIX_LANE_AGING_SECONDS        wait after which an entry is served first (default 30)
+    AGENTMIX_MAX_CALLS_PER_PROVIDER    concurrent provider calls per provider (0 = unlimited)
+    AGENTMIX_PROVIDER_CALL_LIMITS      per-provider overrides, e.g. "openai=8,ollama=1"
+"""
+
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+LANES = ('interactive', 'normal', 'bulk')
+DEFAULT_LANE = 'normal'
+DEFAULT_LANE_WEIGHTS = {'interactive': 6, 'normal': 3, 'bulk': 1}
+DEFAULT_AGING_SECONDS = 30.0
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """Parse "name=number,name=number" into a dict"""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, number = item.split('=', 1)
+        try:
+            limits[name.strip()] = int(number)
+        except ValueError:
+            print(f"Ignoring invalid limit: {item}")
+    return limits
+
+
+def get_lane_weights() -> Dict[str, int]:
+    weights = dict(DEFAULT_LANE_WEIGHTS)
+    weights.update({
+        lane: max(1, weight)
+        for lane, weight in parse_limits(os.environ.get('AGENTMIX_LANE_WEIGHTS', '')).items()
+        if lane in LANES
+    })
+    return weights
+
+
+def get_aging_seconds() -> float:
+    return float(os.environ.get('AGENTMIX_LANE_AGING_SECONDS', DEFAULT_AGING_SECONDS))
+
+
+class _Entry:
+    __slots__ = ('item', 'lane', 'enqueued_at')
+
+    def __init__(self, item, lane, enqueued_at):
+        self.item = item
+        self.lane = lane
+        self.enqueued_at = enqueued_at
+
+
+class LaneQueue:
+    """FIFO per lane, weighted fair across lanes, with aging. Not thread-safe."""
+
+    def __init__(self, weights: Dict[str, int] = None, aging_seconds: float = None):
+        self.weights = weights or get_lane_weights()
+        self.aging_seconds = get_aging_seconds() if aging_seconds is None else aging_seconds
+        self.lanes = {lane: deque() for lane in LANES}
+        self.credit = {lane: 0 for lane in LANES}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.lanes.values())
+
+    def push(self, item: Any, lane: str = DEFAULT_LANE):
+        lane = lane if lane in self.lanes else DEFAULT_LANE
+        self.lanes[lane].append(_Entry(item, lane, time.time()))
+
+    def remove(self, item: Any) -> bool:
+        for entries in self.lanes.values():
+            for entry in entries:
+                if entry.item == item:
+                    entries.remove(entry)
+                    return True
+        return False
+
+    def pop(self, eligible: Callable[[Any], bool] = None) -> Optional[Any]:
+        """Take the next item, optionally only among those ``eligible`` accepts"""
+        candidates = {}
+        for lane, entries in self.lanes.items():
+            for entry in entries:
+                if eligible is None or eligible(entry.item):
+                    candidates[lane] = entry
+                    break
+        if not candidates:
+            return None
+
+        entry = self._choose(candidates, self.credit, time.time())
+        self.lanes[entry.lane].remove(entry)
+        return entry.item
+
+    def _choose(self, candidates: Dict[str, _Entry], credit: Dict[str, int], now: float) -> _Entry:
+        oldest = min(candidates.values(), key=lambda entry: entry.enqueued_at)
+        if self.aging_seconds and now - oldest.enqueued_at >= self.aging_seconds:
+            return oldest
+
+        # Smooth weighted round-robin over the lanes that have work
+        total = 0
+        for lane in candidates:
+            credit[lane] += self.weights.get(lane, 1)
+            total += self.weights.get(lane, 1)
+        lane = max(candidates, key=lambda name: (credit[name], -LANES.index(name)))
+        credit[lane] -= total
+        return candidates[lane]
+
+    def ordered(self) -> List[Any]:
+        """Items in the order they would be served if nothing else arrived"""
+        lanes = {lane: deque(entries) for lane, entries in self.lanes.items()}
+        credit = dict(self.credit)
+        now = time.time()
+        order = []
+        while any(lanes.values()):
+            candidates = {lane: entries[0] for lane, entries in lanes.items() if entries}
+            entry = self._choose(candidates, credit, now)
+            lanes[entry.lane].popleft()
+            order.append(entry.item)
+        return order
+
+    def lane_lengths(self) -> Dict[str, int]:
+        return {lane: len(entries) for lane, entries in self.lanes.items()}
+
+
+class LaneGate:
+    """Counting semaphore whose waiters are woken lane by lane through a LaneQueue"""
+
+    def __init__(self, capacity: int, weights: Dict[str, int] = None, aging_seconds: float = None):
+        self.capacity = capacity
+        self.in_use = 0
+        self.lock = threading.Lock()
+        self.waiters = LaneQueue(weights, aging_seconds)
+
+    def acquire(self, lane: str = DEFAULT_LANE):
+        with self.lock:
+            if self.in_use < self.capacity and not len(self.waiters):
+                self.in_use += 1
+                return
+            event = threading.Event()
+            self.waiters.push(event, lane)
+        event.wait()
+
+    def release(self):
+        with self.lock:
+            event = self.waiters.pop()
+            if event is None:
+                self.in_use -= 1
+            else:
+                # Hand the slot straight to the chosen waiter
+                event.set()
+
+    @contextlib.contextmanager
+    def slot(self, lane: str = DEFAULT_LANE):
+        self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class ProviderGates:
+    """Per-provider LaneGates bounding concurrent provider calls"""
+
+    def __init__(self, default_limit: int = 0, limits: Dict[str, int] = None):
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self.gates = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ProviderGates':
+        return cls(
+            default_limit=int(os.environ.get('AGENTMIX_MAX_CALLS_PER_PROVIDER', 0)),
+            limits=parse_limits(os.environ.get('AGENTMIX_PROVIDER_CALL_LIMITS', ''))
+        )
+
+    def slot(self, provider: str, lane: str = DEFAULT_LANE):
+        limit = self.limits.get(provider, self.default_limit)
+        if not limit:
+            return contextlib.nullcontext()
+        with self.lock:
+            gate = self.gates.get(provider)
+            if gate is None:
+                gate = self.gates[provider] = LaneGate(limit)
+        return gate.slot(lane)
@@ -0,0 +1,175 @@
+"""
+Local stand-in for the Redis pub/sub subset used as a Socket.IO message queue.
+
+python-socketio's RedisManager only needs PUBLISH/SUBSCRIBE, so this small
+threaded RESP server lets several web and orchestrator processes on one machine
+share Socket.IO events without installing Redis. It is intended for development
+and tests; production deployments should point AGENTMIX_SOCKETIO_MESSAGE_QUEUE
+at a real Redis.
+
+    python src/services/local_message_queue.py --port 6399
+    AGENTMIX_SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6399/0
+"""
+
+import argparse
+import socketserver
+import threading
+from typing import Dict, List, Set
+
+
+def _encode_bulk(value: bytes) -> bytes:
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def _encode_array(items: List[bytes], kind: bytes = b'*') -> bytes:
+    return kind + b'%d\r\n' % len(items) + b''.join(items)
+
+
+HELLO_FIELDS = [
+    (b'server', _encode_bulk(b'redis')),
+    (b'version', _encode_bulk(b'7.0.0')),
+    (b'proto', None),
+    (b'id', b':1\r\n'),
+    (b'mode', _encode_bulk(b'standalone')),
+    (b'role', _encode_bulk(b'master')),
+    (b'modules', b'*0\r\n')
+]
+
+
+class _PubSubHandler(socketserver.StreamRequestHandler):
+    """One client connection speaking RESP"""
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.channels = set()
+        self.protocol = 2
+
+    def push(self, items: List[bytes]) -> bytes:
+        """Encode an out-of-band pub/sub frame for the negotiated protocol"""
+        return _encode_array(items, b'>' if self.protocol == 3 else b'*')
+
+    def send(self, payload: bytes):
+        with self.write_lock:
+            self.wfile.write(payload)
+            self.wfile.flush()
+
+    def read_command(self) -> List[bytes]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        line = line.rstrip(b'\r\n')
+        if not line.startswith(b'*'):
+            # Inline command, e.g. from redis-cli or telnet
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline().rstrip(b'\r\n')
+            length = int(header[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        try:
+            while True:
+                args = self.read_command()
+                if args is None:
+                    break
+                if not args:
+                    continue
+                if not self.dispatch(args[0].upper(), args[1:]):
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.server.unsubscribe_all(self)
+
+    def dispatch(self, command: bytes, args: List[bytes]) -> bool:
+        server = self.server
+        if command == b'PING':
+            if self.channels and self.protocol == 2:
+                self.send(_encode_array([_encode_bulk(b'pong'), _encode_bulk(args[0] if args else b'')]))
+            else:
+                self.send(b'+PONG\r\n')
+        elif command == b'PUBLISH':
+            self.send(b':%d\r\n' % server.publish(args[0], args[1]))
+        elif command == b'SUBSCRIBE':
+            for channel in args:
+                server.subscribe(self, channel)
+                self.send(self.push([_encode_bulk(b'subscribe'), _encode_bulk(channel), b':%d\r\n' % len(self.channels)]))
+        elif command == b'UNSUBSCRIBE':
+            for channel in (args or list(self.channels)):
+                server.unsubscribe(self, channel)
+                self.send(self.push([_encode_bulk(b'unsubscribe'), _encode_bulk(channel), b':%d\r\n' % len(self.channels)]))
+        elif command == b'HELLO':
+            if args and args[0] in (b'2', b'3'):
+                self.protocol = int(args[0])
+            items = []
+            for key, value in HELLO_FIELDS:
+                items.append(_encode_bulk(key))
+                items.append(value if value is not None else b':%d\r\n' % self.protocol)
+            if self.protocol == 3:
+                self.send(b'%%%d\r\n' % len(HELLO_FIELDS) + b''.join(items))
+            else:
+                self.send(_encode_array(items))
+        elif command in (b'SELECT', b'CLIENT', b'AUTH'):
+            self.send(b'+OK\r\n')
+        elif command == b'QUIT':
+            self.send(b'+OK\r\n')
+            return False
+        else:
+            self.send(b'-ERR unknown command\r\n')
+        return True
+
+
+class LocalPubSubServer(socketserver.ThreadingTCPServer):
+    """Threaded RESP2/RESP3 server implementing PUBLISH/SUBSCRIBE"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6399):
+        super().__init__((host, port), _PubSubHandler)
+        self.subscribers: Dict[bytes, Set[_PubSubHandler]] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, handler: _PubSubHandler, channel: bytes):
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(handler)
+            handler.channels.add(channel)
+
+    def unsubscribe(self, handler: _PubSubHandler, channel: bytes):
+        with self.lock:
+            self.subscribers.get(channel, set()).discard(handler)
+            handler.channels.discard(channel)
+
+    def unsubscribe_all(self, handler: _PubSubHandler):
+        for channel in list(handler.channels):
+            self.unsubscribe(handler, channel)
+
+    def publish(self, channel: bytes, message: bytes) -> int:
+        with self.lock:
+            handlers = list(self.subscribers.get(channel, ()))
+        items = [_encode_bulk(b'message'), _encode_bulk(channel), _encode_bulk(message)]
+        delivered = 0
+        for handler in handlers:
+            try:
+                handler.send(handler.push(items))
+                delivered += 1
+            except OSError:
+                self.unsubscribe_all(handler)
+        return delivered
+
+    def start_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Redis pub/sub stand-in for the Socket.IO message queue')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6399)
+    args = parser.parse_args()
+    print(f"Local message queue listening on redis://{args.host}:{args.port}/0")
+    LocalPubSubServer(args.host, args.port).serve_forever()
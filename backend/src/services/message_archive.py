@@ -0,0 +1,288 @@
+"""
+Cold storage for the messages of finished conversations.
+
+The archival job moves completed conversations that have not changed for a
+while out of the ``message`` table into one segment file per conversation. A
+segment is a series of gzip members, each holding a block of messages as JSON
+lines, so it is still a valid .jsonl.gz file for external tools. The byte offset
+and length of every member are kept in ``conversation_archive``, which lets a
+page of history be read by decompressing only the blocks it covers.
+
+Messages are ordered by id everywhere - history pages, exports, segments,
+reconnect replay and SSE - which the (conversation_id, id) index serves.
+Imported messages keep their own timestamps but are ordered as inserted.
+
+Reads go through get_conversation_messages() / iter_conversation_messages(),
+which return archived and hot messages alike, or their rendered_* variants,
+which return the messages as JSON text (see message_render) - archived lines
+are passed on as they were written.
+
+Configuration:
+    AGENTMIX_ARCHIVE_DIR               where segments are written (default src/database/archive)
+    AGENTMIX_ARCHIVE_AFTER_DAYS        age of a completed conversation before it is archived (default 30)
+    AGENTMIX_ARCHIVE_INTERVAL_SECONDS  run the job in the background this often (default 0, off);
+                                       enable it in one process only
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+from src.models.user import db
+from src.models.message import Message
+from src.models.conversation import Conversation
+from src.models.conversation_archive import ConversationArchive
+from src.services.vector_index import forget_conversation
+from src.services.message_render import message_renders
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'archive')
+BLOCK_SIZE = 256  # messages per gzip member
+
+
+def get_archive_dir() -> str:
+    return os.environ.get('AGENTMIX_ARCHIVE_DIR', DEFAULT_ARCHIVE_DIR)
+
+
+def segment_path(conversation_id: str) -> str:
+    """Relative segment path, fanned out over subdirectories by hash"""
+    digest = hashlib.md5(conversation_id.encode('utf-8')).hexdigest()
+    safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', conversation_id)[:80]
+    return os.path.join(digest[:2], f"{safe_id}-{digest[:8]}.jsonl.gz")
+
+
+def write_segment(path: str, lines: List[str], keep_bytes: int = 0) -> List[Dict[str, int]]:
+    """Write rendered records as gzip members of BLOCK_SIZE lines; returns the new blocks' index.
+
+    ``keep_bytes`` of the existing segment are kept in front of the new
+    members, which appends to it without moving the blocks already indexed.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    blocks = []
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        if keep_bytes:
+            with open(path, 'rb') as existing:
+                remaining = keep_bytes
+                while remaining > 0:
+                    chunk = existing.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        raise IOError(f"Segment {path} is shorter than its index")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        for start in range(0, len(lines), BLOCK_SIZE):
+            block = lines[start:start + BLOCK_SIZE]
+            data = ''.join(line + '\n' for line in block)
+            compressed = gzip.compress(data.encode('utf-8'))
+            blocks.append({'offset': f.tell(), 'length': len(compressed), 'count': len(block)})
+            f.write(compressed)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return blocks
+
+
+def read_segment(path: str, blocks: List[Dict[str, int]], offset: int = 0,
+                 limit: Optional[int] = None) -> Iterator[str]:
+    """Yield archived records (JSON lines) from ``offset``, decompressing only the blocks needed"""
+    remaining = limit
+    position = 0
+    with open(path, 'rb') as f:
+        for block in blocks:
+            if remaining is not None and remaining <= 0:
+                return
+            if position + block['count'] <= offset:
+                position += block['count']
+                continue
+
+            f.seek(block['offset'])
+            lines = gzip.decompress(f.read(block['length'])).decode('utf-8').splitlines()
+            skip = max(0, offset - position)
+            position += block['count']
+            for line in lines[skip:]:
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                yield line
+
+
+def archive_conversation(conversation_id: str) -> Optional[ConversationArchive]:
+    """Move one conversation's messages into a segment file (requires an app context).
+
+    Messages added after a conversation was archived (a bulk ingest, say) are
+    appended to its segment the next time it is archived.
+    """
+    archive = ConversationArchive.query.get(conversation_id)
+    messages = db.session.query(Message.id, Message.timestamp).filter_by(
+        conversation_id=conversation_id
+    ).order_by(Message.id).all()
+    if not messages:
+        return None
+
+    lines = message_renders.render([message.id for message in messages], keep=False)
+    timestamps = [message.timestamp for message in messages if message.timestamp]
+    # The file is written before the transaction; if the commit fails it is
+    # simply overwritten by the next attempt (an append keeps only the indexed bytes)
+    if archive is None:
+        relative_path = segment_path(conversation_id)
+        blocks = write_segment(os.path.join(get_archive_dir(), relative_path), lines)
+        archive = ConversationArchive(
+            conversation_id=conversation_id,
+            path=relative_path,
+            message_count=len(messages),
+            compressed_bytes=sum(block['length'] for block in blocks),
+            first_timestamp=min(timestamps) if timestamps else None,
+            last_timestamp=max(timestamps) if timestamps else None
+        )
+        archive.set_block_index(blocks)
+        db.session.add(archive)
+    else:
+        old_blocks = archive.get_block_index()
+        kept = old_blocks[-1]['offset'] + old_blocks[-1]['length'] if old_blocks else 0
+        blocks = write_segment(os.path.join(get_archive_dir(), archive.path), lines, kept)
+        archive.set_block_index(old_blocks + blocks)
+        archive.message_count += len(messages)
+        archive.compressed_bytes = kept + sum(block['length'] for block in blocks)
+        if timestamps:
+            archive.first_timestamp = min([archive.first_timestamp, *timestamps] if archive.first_timestamp else timestamps)
+            archive.last_timestamp = max([archive.last_timestamp, *timestamps] if archive.last_timestamp else timestamps)
+        archive.archived_at = datetime.utcnow()
+    # Archived messages leave the retrieval index along with the FTS index
+    forget_conversation(conversation_id)
+    message_renders.forget_conversation(conversation_id)
+    Message.query.filter(Message.id.in_([message.id for message in messages])).delete(synchronize_session=False)
+    db.session.commit()
+    return archive
+
+
+def archive_completed_conversations(older_than_days: float = None, limit: int = 50) -> List[str]:
+    """Archive completed conversations untouched for ``older_than_days`` that have hot messages (requires an app context)"""
+    if older_than_days is None:
+        older_than_days = float(os.environ.get('AGENTMIX_ARCHIVE_AFTER_DAYS', 30))
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    has_hot_messages = db.session.query(Message.id).filter(Message.conversation_id == Conversation.id).exists()
+
+    candidates = Conversation.query.filter(
+        Conversation.status == 'completed',
+        Conversation.updated_at < cutoff,
+        has_hot_messages
+    ).order_by(Conversation.updated_at).limit(limit).all()
+
+    archived = []
+    for conversation in candidates:
+        try:
+            if archive_conversation(conversation.id):
+                archived.append(conversation.id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error archiving conversation {conversation.id}: {e}")
+    return archived
+
+
+def get_rendered_messages(conversation_id: str, offset: int = 0,
+                          limit: Optional[int] = None) -> List[str]:
+    """Messages of a conversation as JSON texts, oldest first, archived ones included"""
+    archive = ConversationArchive.query.get(conversation_id)
+    results = []
+    hot_offset = offset
+
+    if archive:
+        if offset < archive.message_count:
+            results.extend(read_segment(
+                os.path.join(get_archive_dir(), archive.path),
+                archive.get_block_index(),
+                offset,
+                limit
+            ))
+        hot_offset = max(0, offset - archive.message_count)
+
+    if limit is not None and len(results) >= limit:
+        return results
+
+    query = db.session.query(Message.id).filter_by(conversation_id=conversation_id).order_by(Message.id)
+    if hot_offset:
+        query = query.offset(hot_offset)
+    if limit is not None:
+        query = query.limit(limit - len(results))
+    results.extend(message_renders.render([message_id for (message_id,) in query]))
+    return results
+
+
+def get_conversation_messages(conversation_id: str, offset: int = 0,
+                              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Messages of a conversation as dicts, oldest first, archived ones included"""
+    return [json.loads(text) for text in get_rendered_messages(conversation_id, offset, limit)]
+
+
+def count_conversation_messages(conversation_id: str) -> int:
+    archive = ConversationArchive.query.get(conversation_id)
+    archived = archive.message_count if archive else 0
+    return archived + Message.query.filter_by(conversation_id=conversation_id).count()
+
+
+def iter_rendered_messages(conversation_id: str, batch_size: int = 500) -> Iterator[str]:
+    """Stream every message of a conversation as JSON text, archived ones first"""
+    archive = ConversationArchive.query.get(conversation_id)
+    if archive:
+        yield from read_segment(os.path.join(get_archive_dir(), archive.path), archive.get_block_index())
+
+    last_id = 0
+    while True:
+        message_ids = [
+            message_id for (message_id,) in
+            db.session.query(Message.id).filter(
+                Message.conversation_id == conversation_id,
+                Message.id > last_id
+            ).order_by(Message.id).limit(batch_size)
+        ]
+        if not message_ids:
+            return
+        yield from message_renders.render(message_ids, keep=False)
+        last_id = message_ids[-1]
+
+
+def iter_conversation_messages(conversation_id: str, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Stream every message of a conversation, archived ones first"""
+    for text in iter_rendered_messages(conversation_id, batch_size):
+        yield json.loads(text)
+
+
+def delete_archive(conversation_id: str):
+    """Remove a conversation's segment and archive row (caller commits)"""
+    archive = ConversationArchive.query.get(conversation_id)
+    if not archive:
+        return
+    try:
+        os.remove(os.path.join(get_archive_dir(), archive.path))
+    except FileNotFoundError:
+        pass
+    db.session.delete(archive)
+
+
+def start_archive_scheduler(app, interval: float = None) -> Optional[threading.Thread]:
+    """Run the archival job periodically in a background thread"""
+    if interval is None:
+        interval = float(os.environ.get('AGENTMIX_ARCHIVE_INTERVAL_SECONDS', 0))
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    archived = archive_completed_conversations()
+                    if archived:
+                        print(f"Archived {len(archived)} conversation(s)")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error in archive job: {e}")
+
+    thread = threading.Thread(target=run, daemon=True, name='agentmix-archive')
+    thread.start()
+    return thread
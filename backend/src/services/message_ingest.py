@@ -0,0 +1,251 @@
+"""
+Bulk message ingest and transcript import.
+
+The conversation and its participants are looked up once per request; records
+are then validated in memory and written with executemany inserts, committed
+every AGENTMIX_INGEST_CHUNK_SIZE rows (default 5000) so a large upload never
+holds the write lock for long. Each chunk is added to the full-text index with
+one statement (see message_search.batch_indexing). Vectors for retrieval are
+filled in by a background backfill after the upload, since bulk inserts bypass
+the ORM insert listener.
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, Set, Tuple
+from src.models.user import db
+from src.models.message import Message
+from src.models.conversation import Conversation
+from src.models.ai_agent import AIAgent
+from src.services.message_search import batch_indexing
+from src.services.vector_index import forget_conversation
+from src.services.message_render import message_renders
+
+MESSAGE_TYPES = ('text', 'ai', 'human', 'system', 'tool_call')
+MAX_REPORTED_ERRORS = 100
+
+
+class IngestError(ValueError):
+    """The upload as a whole cannot be ingested"""
+    pass
+
+
+def get_chunk_size() -> int:
+    return int(os.environ.get('AGENTMIX_INGEST_CHUNK_SIZE', 5000))
+
+
+def iter_stream_lines(stream, chunk_size: int = 65536) -> Iterable[bytes]:
+    """Split a binary stream into lines, reading it in large chunks"""
+    buffer = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (buffer + chunk).split(b'\n')
+        buffer = lines.pop()
+        yield from lines
+    if buffer:
+        yield buffer
+
+
+def parse_ndjson(lines: Iterable) -> Iterable[Tuple[int, Any]]:
+    """Yield (line number, parsed value) for each non-blank line; bad JSON yields the error"""
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, IngestError(f'Invalid JSON: {e}')
+
+
+def is_agent_id(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class MessageIngestor:
+    """Validates message records for one conversation and inserts them in chunks"""
+
+    def __init__(self, conversation_id: str, participant_ids: Set[int], chunk_size: int = None):
+        self.conversation_id = conversation_id
+        self.participant_ids = set(participant_ids)
+        self.chunk_size = chunk_size or get_chunk_size()
+        self.now = datetime.utcnow()
+        self.pending = []
+        self.inserted = 0
+        self.skipped = 0
+        self.errors = []
+
+    @classmethod
+    def for_conversation(cls, conversation: Conversation, chunk_size: int = None) -> 'MessageIngestor':
+        return cls(conversation.id, conversation.get_participants(), chunk_size)
+
+    def validate(self, record: Any) -> Dict[str, Any]:
+        """Turn a record into an insertable row, raising IngestError if it is invalid"""
+        if not isinstance(record, dict):
+            raise IngestError('Each message must be a JSON object')
+        sender_id = record.get('sender_id')
+        if sender_id is None:
+            raise IngestError('Missing required field: sender_id')
+        if not is_agent_id(sender_id):
+            raise IngestError('sender_id must be an agent ID')
+        if sender_id not in self.participant_ids:
+            raise IngestError('Sender is not a participant in this conversation')
+        receiver_id = record.get('receiver_id')
+        if receiver_id is not None and not is_agent_id(receiver_id):
+            raise IngestError('receiver_id must be an agent ID')
+        if receiver_id is not None and receiver_id not in self.participant_ids:
+            raise IngestError('Receiver is not a participant in this conversation')
+        content = record.get('content')
+        if not isinstance(content, str) or not content:
+            raise IngestError('Missing required field: content')
+        message_type = record.get('message_type', 'text')
+        if message_type not in MESSAGE_TYPES:
+            raise IngestError(f'Unknown message type: {message_type}')
+
+        timestamp = record.get('timestamp')
+        if timestamp:
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except (TypeError, ValueError):
+                raise IngestError('timestamp must be an ISO 8601 date')
+
+        metadata = record.get('metadata', record.get('message_metadata'))
+        if metadata is not None and not isinstance(metadata, str):
+            metadata = json.dumps(metadata)
+
+        return {
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'content': content,
+            'message_type': message_type,
+            'conversation_id': self.conversation_id,
+            'timestamp': timestamp or self.now,
+            'message_metadata': metadata
+        }
+
+    def add(self, index: int, record: Any) -> bool:
+        """Validate and buffer one record; invalid ones are counted and reported"""
+        try:
+            if isinstance(record, Exception):
+                raise record
+            row = self.validate(record)
+        except IngestError as e:
+            self.skipped += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({'index': index, 'error': str(e)})
+            return False
+        self.pending.append(row)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Insert the buffered rows in one executemany and commit.
+
+        The conversation's updated_at is bumped with them, so the archiver does
+        not take a conversation that has just been written to for an idle one.
+        """
+        if not self.pending:
+            return
+        try:
+            with batch_indexing():
+                db.session.execute(Message.__table__.insert(), self.pending)
+            Conversation.query.filter_by(id=self.conversation_id).update(
+                {Conversation.updated_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.inserted += len(self.pending)
+        self.pending = []
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            'conversation_id': self.conversation_id,
+            'inserted': self.inserted,
+            'skipped': self.skipped,
+            'errors': self.errors
+        }
+
+
+def ingest_messages(conversation: Conversation, records: Iterable[Tuple[int, Any]],
+                    atomic: bool = False) -> Dict[str, Any]:
+    """Ingest (index, record) pairs into a conversation (requires an app context).
+
+    With ``atomic`` every record is validated before anything is written and
+    one invalid record rejects the whole upload; otherwise invalid records are
+    skipped and reported while the rest are inserted.
+    """
+    ingestor = MessageIngestor.for_conversation(conversation)
+    if atomic:
+        rows = []
+        for index, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                rows.append(ingestor.validate(record))
+            except IngestError as e:
+                raise IngestError(f'Message {index}: {e}')
+        for start in range(0, len(rows), ingestor.chunk_size):
+            ingestor.pending = rows[start:start + ingestor.chunk_size]
+            ingestor.flush()
+    else:
+        for index, record in records:
+            ingestor.add(index, record)
+        ingestor.flush()
+    return ingestor.result()
+
+
+def import_transcript(header: Dict[str, Any], records: Iterable[Tuple[int, Any]]) -> Dict[str, Any]:
+    """Create a conversation from a transcript header and ingest its messages.
+
+    The header has the shape written by the export endpoint: name,
+    description, participants (agent ids) and optionally status. The
+    conversation always gets a new id. Participants are checked with one query.
+    """
+    if not isinstance(header, dict) or not header.get('name'):
+        raise IngestError('Transcript header must include the conversation name')
+    participant_ids = header.get('participants') or []
+    if not isinstance(participant_ids, list) or not all(is_agent_id(agent_id) for agent_id in participant_ids):
+        raise IngestError('Transcript participants must be a list of agent IDs')
+    found_ids = {
+        agent_id for (agent_id,) in
+        db.session.query(AIAgent.id).filter(AIAgent.id.in_(participant_ids))
+    }
+    missing = [agent_id for agent_id in participant_ids if agent_id not in found_ids]
+    if missing:
+        raise IngestError(f'Agent with ID {missing[0]} not found')
+
+    conversation = Conversation(
+        id=str(uuid.uuid4()),
+        name=header['name'],
+        description=header.get('description', ''),
+        status=header.get('status') if header.get('status') in ('active', 'paused', 'completed') else 'completed'
+    )
+    conversation.set_participants(participant_ids)
+    db.session.add(conversation)
+    db.session.commit()
+
+    ingestor = MessageIngestor(conversation.id, found_ids)
+    try:
+        for index, record in records:
+            ingestor.add(index, record)
+        ingestor.flush()
+    except Exception:
+        # Leave no half-imported conversation behind
+        forget_conversation(conversation.id)
+        message_renders.forget_conversation(conversation.id)
+        Message.query.filter_by(conversation_id=conversation.id).delete()
+        db.session.delete(conversation)
+        db.session.commit()
+        raise
+    result = ingestor.result()
+    result['conversation'] = conversation.to_dict()
+    return result
@@ -0,0 +1,184 @@
+"""
+Messages rendered once as JSON, for history pages and exports.
+
+A message's REST form (the dict of Message.to_dict()) is rendered to compact
+JSON text when the message is written, kept in a process-wide LRU cache
+(AGENTMIX_MESSAGE_CACHE_MB, default 64; 0 disables it) and spliced verbatim into
+the responses of ``GET /conversations/<id>/messages`` and the JSON lines of
+``/export``, however many viewers load the same history. Messages that are not
+cached are read in one query with their sender and receiver names joined in
+(instead of two lazy relationship loads each) and cached on the way out.
+
+Archive segments hold the same rendering, one message per line, so archived
+history is served from the decompressed lines without decoding them.
+
+Renders name their sender and receiver, so entries of renamed or deleted agents
+are dropped (invalidate_agent_profiles, passed on to every web process when
+orchestrator workers are sharded), as are the entries of conversations
+that are deleted, archived or whose import failed.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import aliased
+from src.models.user import db
+from src.models.message import Message
+from src.models.ai_agent import AIAgent
+
+LOAD_CHUNK = 500
+
+
+def render_record(record: Dict[str, Any]) -> str:
+    """Canonical JSON text of a message record"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+def message_record(message_id: int, sender_id: Optional[int], receiver_id: Optional[int], content: str,
+                   message_type: str, conversation_id: str, timestamp, metadata: Optional[str],
+                   sender_name: Optional[str] = None, receiver_name: Optional[str] = None) -> Dict[str, Any]:
+    """The dict of Message.to_dict(), built from columns and already known names"""
+    return {
+        'id': message_id,
+        'sender_id': sender_id,
+        'receiver_id': receiver_id,
+        'content': content,
+        'message_type': message_type,
+        'conversation_id': conversation_id,
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'message_metadata': metadata,
+        'sender_name': sender_name,
+        'receiver_name': receiver_name
+    }
+
+
+def load_records(message_ids: Iterable[int]) -> List[Dict[str, Any]]:
+    """Records of the given messages with names joined in, in no particular order (requires an app context)"""
+    message_ids = list(message_ids)
+    sender = aliased(AIAgent)
+    receiver = aliased(AIAgent)
+    records = []
+    # Chunked to stay under SQLite's bound parameter limit
+    for start in range(0, len(message_ids), LOAD_CHUNK):
+        rows = db.session.query(
+            Message.id, Message.sender_id, Message.receiver_id, Message.content, Message.message_type,
+            Message.conversation_id, Message.timestamp, Message.message_metadata, sender.name, receiver.name
+        ).outerjoin(sender, sender.id == Message.sender_id).outerjoin(
+            receiver, receiver.id == Message.receiver_id
+        ).filter(Message.id.in_(message_ids[start:start + LOAD_CHUNK])).all()
+        records.extend(message_record(*row) for row in rows)
+    return records
+
+
+class MessageRenderCache:
+    """LRU map of message id to its rendered JSON, bounded by total text size"""
+
+    def __init__(self, max_bytes: int = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('AGENTMIX_MESSAGE_CACHE_MB', 64)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        # message_id -> (conversation_id, sender_id, receiver_id, text)
+        self.entries: 'OrderedDict[int, Tuple[str, Optional[int], Optional[int], str]]' = OrderedDict()
+        self.by_conversation: Dict[str, Set[int]] = {}
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, record: Dict[str, Any]) -> str:
+        """Render a record, cache it and return the text"""
+        text = render_record(record)
+        if self.max_bytes <= 0 or record.get('id') is None:
+            return text
+        message_id = record['id']
+        with self.lock:
+            self._pop(message_id)
+            self.entries[message_id] = (record['conversation_id'], record['sender_id'], record['receiver_id'], text)
+            self.by_conversation.setdefault(record['conversation_id'], set()).add(message_id)
+            self.size += len(text)
+            while self.size > self.max_bytes and self.entries:
+                self._pop(next(iter(self.entries)))
+        return text
+
+    def store(self, message: Message, sender_name: Optional[str] = None, receiver_name: Optional[str] = None) -> str:
+        """Render a message just committed by its writer, which knows the names"""
+        return self.put(message_record(
+            message.id, message.sender_id, message.receiver_id, message.content, message.message_type,
+            message.conversation_id, message.timestamp, message.message_metadata, sender_name, receiver_name
+        ))
+
+    def _pop(self, message_id: int):  # called with the lock held
+        entry = self.entries.pop(message_id, None)
+        if entry is None:
+            return
+        self.size -= len(entry[3])
+        members = self.by_conversation.get(entry[0])
+        if members is not None:
+            members.discard(message_id)
+            if not members:
+                del self.by_conversation[entry[0]]
+
+    def get_many(self, message_ids: List[int]) -> Dict[int, str]:
+        """Cached texts of the given messages; missing ones are left out"""
+        found = {}
+        with self.lock:
+            for message_id in message_ids:
+                entry = self.entries.get(message_id)
+                if entry is not None:
+                    self.entries.move_to_end(message_id)
+                    found[message_id] = entry[3]
+            self.hits += len(found)
+            self.misses += len(message_ids) - len(found)
+        return found
+
+    def render(self, message_ids: List[int], keep: bool = True) -> List[str]:
+        """Texts of the given messages in order, loading the missing ones (requires an app context).
+
+        With ``keep=False`` the loaded ones are not cached, so a one-off bulk
+        read (an export, archiving) does not evict what viewers are reading.
+        """
+        rendered = self.get_many(message_ids)
+        missing = [message_id for message_id in message_ids if message_id not in rendered]
+        for record in load_records(missing):
+            rendered[record['id']] = self.put(record) if keep else render_record(record)
+        # A message deleted in between is skipped
+        return [rendered[message_id] for message_id in message_ids if message_id in rendered]
+
+    def forget_conversation(self, conversation_id: str):
+        with self.lock:
+            for message_id in list(self.by_conversation.get(conversation_id, ())):
+                self._pop(message_id)
+
+    def forget_agents(self, agent_ids: Iterable[int]):
+        """Drop renders naming any of these agents"""
+        agent_ids = set(agent_ids)
+        with self.lock:
+            stale = [message_id for message_id, entry in self.entries.items()
+                     if entry[1] in agent_ids or entry[2] in agent_ids]
+            for message_id in stale:
+                self._pop(message_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'messages': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+message_renders = MessageRenderCache()
+
+
+def render_envelope(envelope: Dict[str, Any], field: str, rendered: str) -> str:
+    """JSON of ``envelope`` with ``field`` set to an already rendered value"""
+    head = json.dumps(envelope, separators=(',', ':'))[:-1]
+    return f"{head}{',' if envelope else ''}{json.dumps(field)}:{rendered}}}"
+
+
+def render_array(rendered: List[str]) -> str:
+    return f"[{','.join(rendered)}]"
@@ -0,0 +1,213 @@
+"""
+Full-text search over message content.
+
+On SQLite an external-content FTS5 table, ``message_fts``, indexes
+``message.content`` and is kept in sync by triggers, so every write path
+(including orchestrator worker processes) maintains it without code changes.
+On PostgreSQL a generated ``tsvector`` column with a GIN index plays the same
+role. Messages moved to cold storage by the archival job leave the index with
+their rows.
+
+Bulk writers wrap their inserts in batch_indexing(), which switches the
+per-row insert trigger off for their transaction and indexes the new rows with
+one INSERT ... SELECT, several times faster than row-at-a-time.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import sqlalchemy as sa
+from src.models.user import db
+from src.models.message import Message
+from src.models.ai_agent import AIAgent
+from src.models.conversation import Conversation
+
+# The insert trigger is skipped while message_fts_state.deferred is set (see batch_indexing)
+SQLITE_INSERT_TRIGGER = [
+    "CREATE TABLE IF NOT EXISTS message_fts_state (deferred INTEGER NOT NULL)",
+    "INSERT INTO message_fts_state (deferred) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM message_fts_state)",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message
+        WHEN (SELECT deferred FROM message_fts_state) = 0 BEGIN
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END"""
+]
+
+SQLITE_SETUP = [
+    """CREATE VIRTUAL TABLE message_fts USING fts5(
+        content, content='message', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    *SQLITE_INSERT_TRIGGER,
+    """CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF content ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    # Index the messages written before the table existed
+    "INSERT INTO message_fts(message_fts) VALUES ('rebuild')"
+]
+
+POSTGRES_SETUP = [
+    """ALTER TABLE message ADD COLUMN IF NOT EXISTS content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_message_content_tsv ON message USING GIN (content_tsv)"
+]
+
+# Indexes created before batch_indexing() existed get the conditional trigger
+SQLITE_UPGRADE = ["DROP TRIGGER IF EXISTS message_fts_insert", *SQLITE_INSERT_TRIGGER]
+
+SNIPPET_TOKENS = 12
+
+
+class SearchQueryError(ValueError):
+    """The search query could not be parsed"""
+    pass
+
+
+def init_message_search():
+    """Create the full-text index and its triggers if missing (requires an app context)"""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == 'sqlite':
+            exists = connection.execute(sa.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'"
+            )).first()
+            if not exists:
+                for statement in SQLITE_SETUP:
+                    connection.execute(sa.text(statement))
+            elif not connection.execute(sa.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts_state'"
+            )).first():
+                for statement in SQLITE_UPGRADE:
+                    connection.execute(sa.text(statement))
+        elif dialect == 'postgresql':
+            for statement in POSTGRES_SETUP:
+                connection.execute(sa.text(statement))
+        else:
+            print(f"Full-text search is not available for the {dialect} backend")
+
+
+@contextmanager
+def batch_indexing():
+    """Index messages inserted in the block with one statement instead of per row.
+
+    Must run inside the caller's transaction, which the caller commits (or rolls
+    back, restoring the trigger). SQLite has a single writer, so no other
+    connection inserts while the trigger is off.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        yield
+        return
+    db.session.execute(sa.text("UPDATE message_fts_state SET deferred = 1"))
+    start = db.session.execute(sa.text("SELECT coalesce(max(id), 0) FROM message")).scalar()
+    yield
+    db.session.execute(
+        sa.text("INSERT INTO message_fts(rowid, content) SELECT id, content FROM message WHERE id > :start"),
+        {'start': start}
+    )
+    db.session.execute(sa.text("UPDATE message_fts_state SET deferred = 0"))
+
+
+def quote_fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query matching all terms, the last one as a prefix"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    if not terms:
+        return ''
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_messages(query: str, conversation_id: str = None, agent_id: int = None,
+                    since: datetime = None, until: datetime = None, page: int = 1,
+                    per_page: int = 20, advanced: bool = False,
+                    with_total: bool = False) -> Dict[str, Any]:
+    """Ranked full-text search over messages with optional filters.
+
+    ``advanced`` passes the query through as FTS5 syntax (phrases, OR, NEAR,
+    column filters); otherwise every whitespace-separated term must match.
+    Pages are fetched one row past ``per_page`` to report has_more without
+    counting; ``with_total`` adds an exact (slower) count.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        match = sa.literal_column('message_fts')
+        fts = sa.table('message_fts', sa.column('rowid'))
+        match_query = query if advanced else quote_fts_query(query)
+        if not match_query:
+            raise SearchQueryError('Empty search query')
+        rank = sa.func.bm25(match)
+        snippet = sa.func.snippet(match, 0, '<mark>', '</mark>', '…', SNIPPET_TOKENS)
+        base = sa.select(Message.id).select_from(
+            fts.join(Message.__table__, Message.id == fts.c.rowid)
+        ).where(sa.text('message_fts MATCH :match').bindparams(match=match_query))
+        order = rank
+    elif dialect == 'postgresql':
+        ts_query = sa.func.websearch_to_tsquery('english', query)
+        tsv = sa.literal_column('message.content_tsv')
+        rank = sa.func.ts_rank_cd(tsv, ts_query)
+        snippet = sa.func.ts_headline(
+            'english', Message.content, ts_query,
+            f'StartSel=<mark>, StopSel=</mark>, MaxWords={SNIPPET_TOKENS}, MinWords=4'
+        )
+        base = sa.select(Message.id).where(tsv.op('@@')(ts_query))
+        order = rank.desc()
+    else:
+        raise SearchQueryError(f'Full-text search is not available for the {dialect} backend')
+
+    # Deleted conversations are hidden until the purge job removes their rows
+    deleted = sa.select(Conversation.id).where(Conversation.status == 'deleted')
+    filters = [sa.or_(Message.conversation_id.is_(None), Message.conversation_id.not_in(deleted))]
+    if conversation_id:
+        filters.append(Message.conversation_id == conversation_id)
+    if agent_id is not None:
+        filters.append(Message.sender_id == agent_id)
+    if since:
+        filters.append(Message.timestamp >= since)
+    if until:
+        filters.append(Message.timestamp <= until)
+    base = base.where(*filters)
+
+    statement = base.add_columns(
+        Message.conversation_id,
+        Message.sender_id,
+        AIAgent.name.label('sender_name'),
+        Message.message_type,
+        Message.timestamp,
+        snippet.label('snippet'),
+        rank.label('rank')
+    ).outerjoin(AIAgent, AIAgent.id == Message.sender_id).order_by(order, Message.id.desc())
+    statement = statement.limit(per_page + 1).offset((page - 1) * per_page)
+
+    try:
+        rows = db.session.execute(statement).all()
+        total = None
+        if with_total:
+            total = db.session.execute(sa.select(sa.func.count()).select_from(base.subquery())).scalar()
+    except sa.exc.OperationalError as e:
+        db.session.rollback()
+        raise SearchQueryError(f'Invalid search query: {e.orig}')
+
+    results: List[Dict[str, Any]] = [
+        {
+            'id': row.id,
+            'conversation_id': row.conversation_id,
+            'sender_id': row.sender_id,
+            'sender_name': row.sender_name,
+            'message_type': row.message_type,
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+            'snippet': row.snippet,
+            'score': round(abs(float(row.rank)), 4)
+        }
+        for row in rows[:per_page]
+    ]
+    response = {
+        'results': results,
+        'page': page,
+        'per_page': per_page,
+        'has_more': len(rows) > per_page
+    }
+    if with_total:
+        response['total'] = total
+    return response
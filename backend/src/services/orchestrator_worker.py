@@ -0,0 +1,505 @@
+"""
+Out-of-process conversation orchestration for AgentMix.
+
+Conversation loops run in separate worker processes (``src/worker.py``) so they
+stop competing with Flask/Socket.IO request handling for the GIL. The web tier
+keeps a ShardedOrchestrator, which exposes the same interface as
+ConversationOrchestratorHITL. It assigns each conversation to a worker by
+consistent hashing over conversation_id.
+
+A queue broker (a multiprocessing manager) carries control commands to the
+workers, replies back to the web process that issued each command, and a shared
+table of per-worker state snapshots. A single web process hosts the broker
+itself; under ``src/launcher.py`` the launcher hosts it for every web worker.
+Workers send Socket.IO events through the Socket.IO message queue when
+AGENTMIX_SOCKETIO_MESSAGE_QUEUE is set, and otherwise relay them to the web
+process over the broker. The web processes also publish their room presence
+to the broker for the workers (see presence). In the first case the message queue only reaches
+Socket.IO clients, so the worker also passes each conversation event to every
+web process over the broker, for their replay buffers and SSE streams.
+"""
+
+import bisect
+import hashlib
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager, DictProxy
+from typing import List, Dict, Any, Optional
+
+DEFAULT_QUEUE_ADDRESS = '127.0.0.1:5100'
+DEFAULT_CLIENT_NAME = 'web'
+STATE_INTERVAL_SECONDS = 1.0
+COMMAND_TIMEOUT_SECONDS = 10.0
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to worker ids"""
+
+    def __init__(self, nodes: List[int], replicas: int = 100):
+        self.replicas = replicas
+        self._ring = []
+        self._owners = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def _hash(self, key: str) -> int:
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+
+    def add_node(self, node: int):
+        for replica in range(self.replicas):
+            point = self._hash(f'{node}:{replica}')
+            bisect.insort(self._ring, point)
+            self._owners[point] = node
+
+    def remove_node(self, node: int):
+        for replica in range(self.replicas):
+            point = self._hash(f'{node}:{replica}')
+            self._ring.remove(point)
+            del self._owners[point]
+
+    def get_node(self, key: str) -> int:
+        point = self._hash(key)
+        idx = bisect.bisect(self._ring, point) % len(self._ring)
+        return self._owners[self._ring[idx]]
+
+
+class QueueEmitter:
+    """Socket.IO stand-in for worker processes that forwards emits to the web tier"""
+
+    def __init__(self, event_queue):
+        self.event_queue = event_queue
+
+    def emit(self, event, data=None, room=None, conversation_id=None, **kwargs):
+        self.event_queue.put(('emit', event, data, room, conversation_id))
+
+
+class EventFanout:
+    """Broker-side object putting an item on the event queue of every web process"""
+
+    def __init__(self, event_queues: Dict[str, Any], lock: threading.Lock):
+        self.event_queues = event_queues
+        self.lock = lock
+
+    def put(self, item):
+        with self.lock:
+            event_queues = list(self.event_queues.values())
+        for event_queue in event_queues:
+            event_queue.put(item)
+
+
+class _BrokerServerManager(BaseManager):
+    pass
+
+
+class _BrokerClientManager(BaseManager):
+    pass
+
+
+_BrokerClientManager.register('get_command_queue')
+_BrokerClientManager.register('get_event_queue')
+_BrokerClientManager.register('get_event_fanout')
+_BrokerClientManager.register('get_state_table', proxytype=DictProxy)
+_BrokerClientManager.register('get_presence_table', proxytype=DictProxy)
+
+
+def parse_address(address: str):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def get_queue_address() -> str:
+    return os.environ.get('AGENTMIX_WORKER_QUEUE_ADDRESS', DEFAULT_QUEUE_ADDRESS)
+
+
+def get_authkey() -> bytes:
+    """Shared secret for the broker; generated once per process tree if unset"""
+    if not os.environ.get('AGENTMIX_WORKER_AUTHKEY'):
+        os.environ['AGENTMIX_WORKER_AUTHKEY'] = secrets.token_hex(16)
+    return os.environ['AGENTMIX_WORKER_AUTHKEY'].encode('utf-8')
+
+
+def serve_broker(num_workers: int, address: str = None) -> threading.Thread:
+    """Host the command/event queues and state table on a background thread"""
+    command_queues = {worker_id: queue.Queue() for worker_id in range(num_workers)}
+    event_queues = {}
+    state_table = {}
+    presence_table = {}
+    lock = threading.Lock()
+
+    def get_event_queue(client_name):
+        with lock:
+            return event_queues.setdefault(client_name, queue.Queue())
+
+    _BrokerServerManager.register('get_command_queue', callable=lambda worker_id: command_queues[int(worker_id)])
+    fanout = EventFanout(event_queues, lock)
+
+    _BrokerServerManager.register('get_event_queue', callable=get_event_queue)
+    _BrokerServerManager.register('get_event_fanout', callable=lambda: fanout)
+    _BrokerServerManager.register('get_state_table', callable=lambda: state_table, proxytype=DictProxy)
+    _BrokerServerManager.register('get_presence_table', callable=lambda: presence_table, proxytype=DictProxy)
+    manager = _BrokerServerManager(address=parse_address(address or get_queue_address()), authkey=get_authkey())
+    server = manager.get_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def connect_broker(address: str = None, retries: int = 30) -> _BrokerClientManager:
+    """Connect to the broker, retrying while it starts up"""
+    address = address or get_queue_address()
+    for attempt in range(retries):
+        try:
+            manager = _BrokerClientManager(address=parse_address(address), authkey=get_authkey())
+            manager.connect()
+            return manager
+        except (ConnectionRefusedError, OSError):
+            time.sleep(1)
+    raise RuntimeError(f"Could not reach orchestrator queue broker at {address}")
+
+
+def spawn_workers(num_workers: int, address: str = None, database_uri: str = None) -> List[subprocess.Popen]:
+    """Launch src/worker.py once per shard"""
+    worker_script = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'worker.py')
+    env = dict(os.environ)
+    get_authkey()
+    env['AGENTMIX_WORKER_AUTHKEY'] = os.environ['AGENTMIX_WORKER_AUTHKEY']
+    if database_uri:
+        env['AGENTMIX_DATABASE_URI'] = database_uri
+    return [
+        subprocess.Popen(
+            [sys.executable, worker_script, '--worker-id', str(worker_id), '--num-workers', str(num_workers),
+             '--address', address or get_queue_address()],
+            env=env
+        )
+        for worker_id in range(num_workers)
+    ]
+
+
+class ShardedOrchestrator:
+    """Web-tier facade routing orchestrator calls to sharded worker processes"""
+
+    def __init__(self, socketio, num_workers: int, address: str = None, client_name: str = None):
+        self.socketio = socketio
+        self.num_workers = num_workers
+        self.address = address or get_queue_address()
+        self.client_name = client_name or DEFAULT_CLIENT_NAME
+        self.ring = HashRing(list(range(num_workers)))
+        self.pending_replies = {}
+        self.worker_processes = []
+        self.command_queues = {}
+        self.event_queue = None
+        self.state_table = None
+        self.presence_table = None
+        self.event_fanout = None
+
+    def start(self, host_broker: bool = True, spawn: bool = True, database_uri: str = None):
+        """Connect to (or host) the broker, start relaying, and optionally launch workers"""
+        if host_broker:
+            serve_broker(self.num_workers, self.address)
+        manager = connect_broker(self.address)
+        self.command_queues = {
+            worker_id: manager.get_command_queue(worker_id) for worker_id in range(self.num_workers)
+        }
+        self.event_queue = manager.get_event_queue(self.client_name)
+        self.event_fanout = manager.get_event_fanout()
+        self.state_table = manager.get_state_table()
+        self.presence_table = manager.get_presence_table()
+
+        threading.Thread(target=self._relay_events, daemon=True).start()
+        threading.Thread(target=self._publish_presence_loop, daemon=True).start()
+
+        if spawn:
+            self.worker_processes = spawn_workers(self.num_workers, self.address, database_uri)
+        return self
+
+    def _relay_events(self):
+        """Forward relayed worker emits to Socket.IO, pass on worker events and resolve command replies"""
+        while True:
+            item = self.event_queue.get()
+            try:
+                kind = item[0]
+                if kind == 'emit':
+                    _, event, data, room, conversation_id = item
+                    if room:
+                        self.socketio.emit(event, data, room=room)
+                    else:
+                        self.socketio.emit(event, data, conversation_id=conversation_id)
+                elif kind == 'notify':
+                    # Sent to clients through the message queue; only the listeners are left
+                    _, conversation_id, event, data = item
+                    if hasattr(self.socketio, 'notify'):
+                        self.socketio.notify(conversation_id, event, data)
+                elif kind == 'invalidate_agents':
+                    # An agent was changed through another web process
+                    _, agent_ids = item
+                    self._forget_agents(agent_ids)
+                elif kind == 'reply':
+                    _, request_id, result = item
+                    pending = self.pending_replies.get(request_id)
+                    if pending:
+                        pending['result'] = result
+                        pending['event'].set()
+            except Exception as e:
+                print(f"Error relaying worker event: {e}")
+
+    def _forget_agents(self, agent_ids: List[int]):
+        from src.services.agent_profiles import agent_profile_cache
+        from src.services.message_render import message_renders
+
+        for agent_id in agent_ids:
+            agent_profile_cache.invalidate(agent_id)
+        message_renders.forget_agents(agent_ids)
+
+    def _publish_presence_loop(self):
+        """Share this process's room presence with the workers, which serve no clients"""
+        from src.services.presence import presence
+
+        published = None
+        while True:
+            try:
+                snapshot = presence.snapshot()
+                if snapshot != published:
+                    self.presence_table[self.client_name] = snapshot
+                    published = snapshot
+            except Exception as e:
+                print(f"Error publishing presence: {e}")
+            time.sleep(STATE_INTERVAL_SECONDS)
+
+    @property
+    def active_conversations(self) -> Dict[str, Dict[str, Any]]:
+        """Merged state snapshots published by every worker"""
+        merged = {}
+        for snapshot in self.state_table.values():
+            merged.update(snapshot)
+        return merged
+
+    def worker_for(self, conversation_id: str) -> int:
+        return self.ring.get_node(conversation_id)
+
+    def _call(self, conversation_id: str, command: str, *args) -> Any:
+        """Send a command to the owning worker and wait for its result"""
+        request_id = uuid.uuid4().hex
+        pending = {'event': threading.Event(), 'result': False}
+        self.pending_replies[request_id] = pending
+        try:
+            worker_id = self.worker_for(conversation_id)
+            self.command_queues[worker_id].put((request_id, self.client_name, command, conversation_id) + args)
+            if not pending['event'].wait(COMMAND_TIMEOUT_SECONDS):
+                print(f"Timed out waiting for worker {worker_id} to {command} {conversation_id}")
+            return pending['result']
+        finally:
+            self.pending_replies.pop(request_id, None)
+
+    def start_conversation(self, conversation_id: str, options: Dict[str, Any] = None) -> bool:
+        return self._call(conversation_id, 'start', options)
+
+    def admit_conversation(self, conversation_id: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        result = self._call(conversation_id, 'admit', options)
+        return result or {'success': False, 'status': 'invalid', 'error': 'Orchestrator worker did not respond'}
+
+    def pause_conversation(self, conversation_id: str, reason: str = "Human intervention requested") -> bool:
+        return self._call(conversation_id, 'pause', reason)
+
+    def resume_conversation(self, conversation_id: str) -> bool:
+        return self._call(conversation_id, 'resume')
+
+    def stop_conversation(self, conversation_id: str) -> bool:
+        return self._call(conversation_id, 'stop')
+
+    def send_human_message(self, conversation_id: str, user_message: str, user_name: str = "User") -> bool:
+        return self._call(conversation_id, 'human_message', user_message, user_name)
+
+    def request_human_input(self, conversation_id: str, requesting_agent: str, request_message: str) -> bool:
+        return self._call(conversation_id, 'request_human_input', requesting_agent, request_message)
+
+    def recover_conversations(self, owns=None) -> List[str]:
+        """Workers recover their own shards from checkpoints when they start"""
+        return []
+
+    def invalidate_agent(self, agent_id: int):
+        self.invalidate_agents([agent_id])
+
+    def invalidate_agents(self, agent_ids: List[int]):
+        """Tell every worker and web process to drop cached profiles and renders of some agents (no reply awaited)"""
+        for command_queue in self.command_queues.values():
+            command_queue.put((None, self.client_name, 'invalidate_agents', list(agent_ids)))
+        self.event_fanout.put(('invalidate_agents', list(agent_ids)))
+
+    def get_active_conversations(self) -> List[str]:
+        return [
+            conversation_id for conversation_id, status in self.active_conversations.items()
+            if status.get('active')
+        ]
+
+    def is_conversation_active(self, conversation_id: str) -> bool:
+        return self.active_conversations.get(conversation_id, {}).get('active', False)
+
+    def get_conversation_status(self, conversation_id: str) -> Dict[str, Any]:
+        return self.active_conversations.get(conversation_id, {'active': False})
+
+
+class OrchestratorWorker:
+    """Runs a ConversationOrchestratorHITL for one shard inside a worker process"""
+
+    COMMANDS = {
+        'start': 'start_conversation',
+        'admit': 'admit_conversation',
+        'invalidate_agents': 'invalidate_agents',
+        'pause': 'pause_conversation',
+        'resume': 'resume_conversation',
+        'stop': 'stop_conversation',
+        'human_message': 'send_human_message',
+        'request_human_input': 'request_human_input'
+    }
+
+    def __init__(self, worker_id: int, address: str = None, database_uri: str = None, num_workers: int = 1):
+        self.worker_id = worker_id
+        self.num_workers = num_workers
+        self.address = address or get_queue_address()
+        self.database_uri = database_uri
+        self.manager = None
+        self.command_queue = None
+        self.state_table = None
+        self.presence_table = None
+        self.app = None
+        self.orchestrator = None
+
+    def create_app(self):
+        from flask import Flask
+        from src.models.user import db
+        from src.models.ai_agent import AIAgent
+        from src.models.message import Message
+        from src.models.conversation import Conversation
+        from src.models.conversation_state import ConversationState
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_uri
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+        return app
+
+    def create_emitter(self):
+        """Emit through the Socket.IO message queue if configured, else relay via the broker.
+
+        Relayed emits are coalesced by the web tier's RoomEmitter; emits through
+        the message queue are coalesced here, and every conversation event is
+        also handed to each web process's RoomEmitter listeners (replay buffer,
+        SSE bus) over the broker.
+        """
+        message_queue = os.environ.get('AGENTMIX_SOCKETIO_MESSAGE_QUEUE')
+        if message_queue:
+            from flask_socketio import SocketIO
+            from src.services.event_emitter import RoomEmitter
+            emitter = RoomEmitter(SocketIO(message_queue=message_queue))
+            fanout = self.manager.get_event_fanout()
+            emitter.listeners.append(
+                lambda conversation_id, event, data: fanout.put(('notify', conversation_id, event, data))
+            )
+            return emitter
+        return QueueEmitter(self.manager.get_event_queue(DEFAULT_CLIENT_NAME))
+
+    def run(self):
+        from src.services.conversation_orchestrator_hitl import ConversationOrchestratorHITL
+        from src.services.admission import AdmissionController
+        from src.services.message_render import message_renders
+
+        # History is served by the web processes; renders cached here would never be read
+        message_renders.max_bytes = 0
+        self.manager = connect_broker(self.address)
+        self.command_queue = self.manager.get_command_queue(self.worker_id)
+        self.state_table = self.manager.get_state_table()
+        self.presence_table = self.manager.get_presence_table()
+        self.app = self.create_app()
+        self.orchestrator = ConversationOrchestratorHITL(self.create_emitter(), self.app)
+        # The configured caps are for the whole deployment; this shard admits against its share
+        self.orchestrator.admission = AdmissionController.from_env(self.worker_id, self.num_workers)
+        threading.Thread(target=self._publish_state_loop, daemon=True).start()
+
+        # Pick up this shard's conversations from their checkpoints
+        ring = HashRing(list(range(self.num_workers)))
+        self.orchestrator.recover_conversations(
+            owns=lambda conversation_id: ring.get_node(conversation_id) == self.worker_id
+        )
+        self.publish_state()
+        print(f"Orchestrator worker {self.worker_id} ready (pid {os.getpid()})")
+
+        while True:
+            item = self.command_queue.get()
+            request_id, reply_to, command, conversation_id = item[:4]
+            if command == 'shutdown':
+                break
+            result = self.handle_command(command, conversation_id, *item[4:])
+            if request_id is not None:
+                self.manager.get_event_queue(reply_to).put(('reply', request_id, result))
+            self.publish_state()
+
+    def handle_command(self, command: str, conversation_id: str, *args) -> bool:
+        method_name = self.COMMANDS.get(command)
+        if not method_name:
+            print(f"Unknown worker command: {command}")
+            return False
+        try:
+            with self.app.app_context():
+                return getattr(self.orchestrator, method_name)(conversation_id, *args)
+        except Exception as e:
+            print(f"Worker {self.worker_id} failed to {command} {conversation_id}: {e}")
+            return False
+
+    def publish_state(self):
+        conversation_ids = self.orchestrator.get_active_conversations()
+        conversation_ids += list(self.orchestrator.admission.queue_positions())
+        self.state_table[self.worker_id] = {
+            conversation_id: self.orchestrator.get_conversation_status(conversation_id)
+            for conversation_id in conversation_ids
+        }
+
+    def refresh_presence(self):
+        """Take in the room presence published by every web process"""
+        from src.services.presence import presence
+
+        merged = {}
+        for snapshot in self.presence_table.values():
+            for conversation_id, count in snapshot.items():
+                merged[conversation_id] = merged.get(conversation_id, 0) + count
+        presence.set_remote(merged)
+
+    def _publish_state_loop(self):
+        while True:
+            time.sleep(STATE_INTERVAL_SECONDS)
+            try:
+                self.refresh_presence()
+                self.publish_state()
+            except Exception as e:
+                print(f"Worker {self.worker_id} failed to publish state: {e}")
+
+
+def init_sharded_orchestrator(socketio, num_workers: int, database_uri: str = None) -> ShardedOrchestrator:
+    """Start (or join) the broker and workers and install the sharded facade.
+
+    AGENTMIX_HOST_WORKER_BROKER=0 joins a broker hosted elsewhere (the launcher)
+    under a per-process client name; AGENTMIX_SPAWN_WORKERS=0 leaves starting
+    src/worker.py processes to the caller.
+    """
+    from src.services import conversation_orchestrator_hitl as orchestrator_module
+
+    host_broker = os.environ.get('AGENTMIX_HOST_WORKER_BROKER', '1') != '0'
+    spawn = os.environ.get('AGENTMIX_SPAWN_WORKERS', '1') != '0'
+    # Relayed emits go to the default client, so only web processes that get
+    # their events from the Socket.IO message queue need their own reply queue
+    if host_broker or not os.environ.get('AGENTMIX_SOCKETIO_MESSAGE_QUEUE'):
+        client_name = DEFAULT_CLIENT_NAME
+    else:
+        client_name = f'web-{os.getpid()}'
+    orchestrator = ShardedOrchestrator(socketio, num_workers, client_name=client_name).start(
+        host_broker=host_broker,
+        spawn=spawn,
+        database_uri=database_uri
+    )
+    orchestrator_module.conversation_orchestrator_hitl = orchestrator
+    return orchestrator
@@ -0,0 +1,71 @@
+"""
+Turn pacing for conversation loops.
+
+A conversation's pacing policy decides how long the loop waits before the next
+turn:
+    none      back-to-back turns at provider speed
+    fixed     a fixed delay after every turn (options['turn_delay'], default 1 s)
+    adaptive  the fixed delay while someone is watching, no delay when headless
+    rate      at most options['turns_per_minute'] turn starts per minute
+
+Pick the policy per conversation with options['pacing'] when starting it. The
+default comes from AGENTMIX_PACING (default 'fixed') and AGENTMIX_TURN_DELAY_SECONDS.
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict
+
+PACING_POLICIES = ('none', 'fixed', 'adaptive', 'rate')
+DEFAULT_TURN_DELAY_SECONDS = 1.0
+DEFAULT_TURNS_PER_MINUTE = 30
+
+
+class TurnPacer:
+    """Computes the wait before each turn under a pacing policy"""
+
+    def __init__(self, policy: str = 'fixed', turn_delay: float = DEFAULT_TURN_DELAY_SECONDS,
+                 turns_per_minute: float = DEFAULT_TURNS_PER_MINUTE,
+                 is_watched: Callable[[], bool] = None):
+        if policy not in PACING_POLICIES:
+            raise ValueError(f"Unknown pacing policy: {policy}")
+        self.policy = policy
+        self.turn_delay = max(0.0, float(turn_delay))
+        self.turns_per_minute = max(0.1, float(turns_per_minute))
+        self.is_watched = is_watched or (lambda: True)
+        self.last_turn_started = None
+
+    @classmethod
+    def from_options(cls, options: Dict[str, Any], is_watched: Callable[[], bool] = None,
+                     default_delay: float = None) -> 'TurnPacer':
+        """Build a pacer from conversation start options, falling back to the environment"""
+        options = options or {}
+        if default_delay is None:
+            default_delay = float(os.environ.get('AGENTMIX_TURN_DELAY_SECONDS', DEFAULT_TURN_DELAY_SECONDS))
+        # An option given as None means the default, same as leaving it out
+        turn_delay = options.get('turn_delay')
+        turns_per_minute = options.get('turns_per_minute')
+        return cls(
+            policy=options.get('pacing') or os.environ.get('AGENTMIX_PACING', 'fixed'),
+            turn_delay=turn_delay if turn_delay is not None else default_delay,
+            turns_per_minute=turns_per_minute if turns_per_minute is not None else DEFAULT_TURNS_PER_MINUTE,
+            is_watched=is_watched
+        )
+
+    def next_delay(self) -> float:
+        """Seconds to wait before starting the next turn"""
+        if self.policy == 'none':
+            return 0.0
+        if self.policy == 'fixed':
+            return self.turn_delay
+        if self.policy == 'adaptive':
+            return self.turn_delay if self.is_watched() else 0.0
+
+        # rate: space turn starts evenly, counting the time the last turn took
+        if self.last_turn_started is None:
+            return 0.0
+        interval = 60.0 / self.turns_per_minute
+        return max(0.0, self.last_turn_started + interval - time.monotonic())
+
+    def turn_started(self):
+        self.last_turn_started = time.monotonic()
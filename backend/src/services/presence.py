@@ -0,0 +1,113 @@
+"""
+Who is watching which conversation.
+
+The Socket.IO handlers record every join, leave and disconnect here, so the
+orchestrator and the RoomEmitter can tell an unwatched conversation without
+asking the Socket.IO server. A tracker only sees the clients of its own process: it is
+``authoritative`` (and events may be suppressed for empty rooms) only in a
+web process that serves every client, i.e. without
+AGENTMIX_SOCKETIO_MESSAGE_QUEUE. Elsewhere an empty room just means unknown.
+
+Sharded orchestrator workers serve no clients at all. The web processes
+publish their snapshot() over the worker broker and each worker adds the
+merged counts in with set_remote(), so lanes and adaptive pacing there still
+see who is watching (about a second behind).
+"""
+
+import threading
+from typing import Dict, List, Set
+from src.services.event_emitter import conversation_rooms, sse_room, ROOM_PREFIX
+
+
+class PresenceTracker:
+    """Subscriber counts of conversation rooms in this process"""
+
+    def __init__(self, authoritative: bool = False):
+        self.authoritative = authoritative
+        self.room_members: Dict[str, Set[str]] = {}
+        self.member_rooms: Dict[str, Set[str]] = {}
+        self.connections: Set[str] = set()
+        # Subscriber counts per conversation reported by other processes
+        self.remote: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def connect(self, sid: str):
+        with self.lock:
+            self.connections.add(sid)
+
+    def join(self, sid: str, room: str):
+        with self.lock:
+            self.room_members.setdefault(room, set()).add(sid)
+            self.member_rooms.setdefault(sid, set()).add(room)
+
+    def leave(self, sid: str, room: str):
+        with self.lock:
+            self._leave(sid, room)
+
+    def _leave(self, sid: str, room: str):
+        members = self.room_members.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self.room_members[room]
+        rooms = self.member_rooms.get(sid)
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                del self.member_rooms[sid]
+
+    def disconnect(self, sid: str) -> List[str]:
+        """Drop a client from every room; returns the rooms it was in"""
+        with self.lock:
+            self.connections.discard(sid)
+            rooms = list(self.member_rooms.get(sid, ()))
+            for room in rooms:
+                self._leave(sid, room)
+            return rooms
+
+    def count(self, room: str) -> int:
+        members = self.room_members.get(room)
+        return len(members) if members else 0
+
+    def watchers(self, conversation_id: str) -> int:
+        """Subscribers of the conversation across its room variants and SSE streams"""
+        return (sum(self.count(room) for room in conversation_rooms(conversation_id))
+                + self.count(sse_room(conversation_id))
+                + self.remote.get(conversation_id, 0))
+
+    def is_watched(self, conversation_id: str) -> bool:
+        return self.watchers(conversation_id) > 0
+
+    def is_headless(self, conversation_id: str) -> bool:
+        """Known for certain to have no subscribers"""
+        return self.authoritative and not self.is_watched(conversation_id)
+
+    def room_is_empty(self, room: str) -> bool:
+        """Known for certain to have no members"""
+        return self.authoritative and self.count(room) == 0
+
+    def has_connections(self) -> bool:
+        return not self.authoritative or bool(self.connections)
+
+    def set_remote(self, counts: Dict[str, int]):
+        """Replace the subscriber counts reported by other processes"""
+        self.remote = dict(counts)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Subscriber count per watched conversation in this process"""
+        with self.lock:
+            counts = {}
+            for room, members in self.room_members.items():
+                if room.startswith(ROOM_PREFIX):
+                    conversation_id = room[len(ROOM_PREFIX):].split(':', 1)[0]
+                    counts[conversation_id] = counts.get(conversation_id, 0) + len(members)
+            return counts
+
+
+presence = PresenceTracker()
+
+
+def init_presence(authoritative: bool) -> PresenceTracker:
+    """Declare whether this process sees every client (call once at startup)"""
+    presence.authoritative = authoritative
+    return presence
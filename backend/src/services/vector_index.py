@@ -0,0 +1,415 @@
+"""
+Vector index over message embeddings, and the retrieval context builder that
+feeds relevant older messages into agent prompts.
+
+Embeddings live in the ``message_embedding`` table. A listener on Message
+inserts writes the vector in the same flush as the message, so every ORM write
+path keeps the table current; backfill_embeddings() covers messages written
+before the table existed, by bulk inserts, or with a different embedder. Each
+process keeps an in-memory copy that catches up incrementally before a search,
+so orchestrator workers see each other's messages.
+
+Search is exact cosine similarity over a NumPy matrix when NumPy is installed
+and over plain float arrays otherwise. With NumPy and a large index, IVF mode
+partitions the vectors around k-means centroids and scans only the nprobe
+partitions nearest to the query.
+
+Configuration:
+    AGENTMIX_VECTOR_INDEX          flat | ivf | auto (default auto: ivf once past the threshold, NumPy only)
+    AGENTMIX_VECTOR_IVF_THRESHOLD  vectors before auto switches to ivf (default 50000)
+    AGENTMIX_VECTOR_IVF_NPROBE     partitions scanned per query (default 8)
+    AGENTMIX_RETRIEVAL             default scope: off | conversation | all (default conversation)
+    AGENTMIX_RETRIEVAL_TOP_K       older messages added per turn (default 3)
+    AGENTMIX_RETRIEVAL_MIN_SCORE   minimum cosine similarity (default 0.25)
+    AGENTMIX_RETRIEVAL_BUDGET_MS   time a turn may spend on retrieval before it is skipped (default 50)
+"""
+
+import heapq
+import math
+import operator
+import os
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import sqlalchemy as sa
+from sqlalchemy import event
+from src.models.user import db
+from src.models.message import Message
+from src.models.ai_agent import AIAgent
+from src.models.conversation import Conversation
+from src.models.message_embedding import MessageEmbedding
+from src.services.embeddings import get_embedder
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RETRIEVAL_SCOPES = ('off', 'conversation', 'all')
+INDEX_MODES = ('flat', 'ivf', 'auto')
+
+# Rows loaded per query when catching up with the table
+REFRESH_BATCH = 2000
+# Ids can commit out of order (e.g. PostgreSQL sequences); re-check this many
+# ids below the highest one seen
+REFRESH_OVERLAP = 200
+# Retrieved messages are clipped to keep the prompt tail short
+RETRIEVED_CONTENT_CHARS = 400
+
+
+def pack_vector(values: Sequence[float]) -> bytes:
+    return array('f', values).tobytes()
+
+
+def unpack_vector(data: bytes) -> array:
+    vector = array('f')
+    vector.frombytes(data)
+    return vector
+
+
+@event.listens_for(Message, 'after_insert')
+def _embed_new_message(mapper, connection, message):
+    """Store the embedding of a new message in the same flush as the message"""
+    try:
+        embedder = get_embedder()
+        vector = embedder.embed(message.content)
+    except Exception as e:
+        # Left for backfill_embeddings(); never fail the message write
+        print(f"Error embedding message {message.id}: {e}")
+        return
+    connection.execute(MessageEmbedding.__table__.insert().values(
+        message_id=message.id,
+        conversation_id=message.conversation_id,
+        embedder=embedder.name,
+        dim=embedder.dim,
+        vector=pack_vector(vector),
+        created_at=datetime.utcnow()
+    ))
+
+
+def backfill_embeddings(batch_size: int = 500) -> int:
+    """Embed messages that have no vector from the current embedder (requires an app context)"""
+    embedder = get_embedder()
+    table = MessageEmbedding.__table__
+    total = 0
+    while True:
+        rows = db.session.query(Message.id, Message.conversation_id, Message.content).outerjoin(
+            MessageEmbedding,
+            sa.and_(MessageEmbedding.message_id == Message.id, MessageEmbedding.embedder == embedder.name)
+        ).filter(MessageEmbedding.message_id.is_(None)).order_by(Message.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        vectors = embedder.embed_many([row.content for row in rows])
+        now = datetime.utcnow()
+        # Replace vectors left by a previous embedder
+        db.session.execute(table.delete().where(table.c.message_id.in_([row.id for row in rows])))
+        db.session.execute(table.insert(), [
+            {
+                'message_id': row.id,
+                'conversation_id': row.conversation_id,
+                'embedder': embedder.name,
+                'dim': embedder.dim,
+                'vector': pack_vector(vector),
+                'created_at': now
+            }
+            for row, vector in zip(rows, vectors)
+        ])
+        db.session.commit()
+        total += len(rows)
+    return total
+
+
+_backfill_pending = False
+_backfill_thread = None
+_backfill_lock = threading.Lock()
+
+
+def request_backfill(app):
+    """Embed bulk-inserted messages in a background thread.
+
+    Requests made while a backfill runs are folded into one more pass, so
+    every committed message is covered without two passes racing.
+    """
+    global _backfill_pending, _backfill_thread
+    with _backfill_lock:
+        _backfill_pending = True
+        if _backfill_thread is not None:
+            return
+
+        def run():
+            global _backfill_pending, _backfill_thread
+            while True:
+                with _backfill_lock:
+                    if not _backfill_pending:
+                        _backfill_thread = None
+                        return
+                    _backfill_pending = False
+                with app.app_context():
+                    try:
+                        backfill_embeddings()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Error backfilling embeddings: {e}")
+
+        _backfill_thread = threading.Thread(target=run, daemon=True, name='agentmix-embed')
+        _backfill_thread.start()
+
+
+def forget_conversation(conversation_id: str):
+    """Drop a conversation's vectors before its messages are deleted (caller commits)"""
+    MessageEmbedding.query.filter_by(conversation_id=conversation_id).delete(synchronize_session=False)
+    vector_index.forget(conversation_id)
+
+
+class IVFPartitions:
+    """Inverted-file partitioning of index rows around k-means centroids (NumPy only)"""
+
+    def __init__(self, matrix, nlist: int, iterations: int = 8, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        sample = matrix[rng.choice(len(matrix), min(len(matrix), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for partition in range(nlist):
+                members = sample[assignment == partition]
+                if len(members):
+                    centroids[partition] = members.mean(axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1, norms)
+        self.centroids = centroids
+
+        self.lists = [[] for _ in range(nlist)]
+        for start in range(0, len(matrix), 8192):
+            assignment = np.argmax(matrix[start:start + 8192] @ centroids.T, axis=1)
+            for offset, partition in enumerate(assignment):
+                self.lists[partition].append(start + offset)
+        self.built_rows = len(matrix)
+
+    def add(self, row: int, vector):
+        self.lists[int(np.argmax(self.centroids @ vector))].append(row)
+
+    def candidates(self, query, nprobe: int):
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        lists = [np.asarray(self.lists[partition], dtype=np.int64) for partition in nearest]
+        return np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+
+
+class VectorIndex:
+    """In-memory copy of message_embedding for one embedder, searched by cosine similarity"""
+
+    def __init__(self, mode: str = None, ivf_threshold: int = None, nprobe: int = None):
+        self.mode = mode or os.environ.get('AGENTMIX_VECTOR_INDEX', 'auto')
+        if self.mode not in INDEX_MODES:
+            raise ValueError(f"Unknown vector index mode: {self.mode}")
+        self.ivf_threshold = ivf_threshold or int(os.environ.get('AGENTMIX_VECTOR_IVF_THRESHOLD', 50000))
+        self.nprobe = nprobe or int(os.environ.get('AGENTMIX_VECTOR_IVF_NPROBE', 8))
+        if self.mode == 'ivf' and np is None:
+            print("NumPy is not installed; the vector index falls back to flat search")
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.embedder_name = None
+        self.dim = None
+        self.last_id = 0
+        self.ids = []                # row -> message id
+        self.known = set()
+        self.by_conversation = {}    # conversation id -> [row]
+        self.vectors = []            # row -> array('f'), without NumPy
+        self.matrix = None           # rows x dim float32, with NumPy (capacity grows by doubling)
+        self.id_array = None
+        self.ivf = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self, deadline: float = None):
+        """Load vectors written since the last refresh (requires an app context)"""
+        embedder = get_embedder()
+        with self.lock:
+            if self.embedder_name != embedder.name:
+                self.reset()
+                self.embedder_name = embedder.name
+                self.dim = embedder.dim
+
+            after = max(0, self.last_id - REFRESH_OVERLAP)
+            while True:
+                rows = db.session.execute(
+                    sa.select(MessageEmbedding.message_id, MessageEmbedding.conversation_id, MessageEmbedding.vector)
+                    .where(MessageEmbedding.embedder == embedder.name, MessageEmbedding.message_id > after)
+                    .order_by(MessageEmbedding.message_id)
+                    .limit(REFRESH_BATCH)
+                ).all()
+                for row in rows:
+                    if row.message_id not in self.known and len(row.vector) == 4 * self.dim:
+                        self._append(row.message_id, row.conversation_id, row.vector)
+                if rows:
+                    after = rows[-1].message_id
+                    self.last_id = max(self.last_id, after)
+                if len(rows) < REFRESH_BATCH or (deadline and time.monotonic() > deadline):
+                    break
+            self._maybe_build_ivf()
+
+    def _append(self, message_id: int, conversation_id: Optional[str], data: bytes):
+        row = len(self.ids)
+        self.ids.append(message_id)
+        self.known.add(message_id)
+        self.by_conversation.setdefault(conversation_id, []).append(row)
+        if np is None:
+            self.vectors.append(unpack_vector(data))
+            return
+
+        if self.matrix is None:
+            self.matrix = np.zeros((1024, self.dim), dtype=np.float32)
+            self.id_array = np.zeros(1024, dtype=np.int64)
+        elif row >= len(self.matrix):
+            self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+            self.id_array = np.concatenate([self.id_array, np.zeros_like(self.id_array)])
+        self.matrix[row] = np.frombuffer(data, dtype=np.float32)
+        self.id_array[row] = message_id
+        if self.ivf:
+            self.ivf.add(row, self.matrix[row])
+
+    def _maybe_build_ivf(self):
+        if np is None or self.mode == 'flat' or not self.ids:
+            return
+        rows = len(self.ids)
+        if self.mode == 'auto' and rows < self.ivf_threshold:
+            return
+        # (Re)build when first enabled and whenever the index has doubled
+        if self.ivf is None or rows >= 2 * self.ivf.built_rows:
+            nlist = max(16, int(math.sqrt(rows)))
+            if rows >= nlist:
+                self.ivf = IVFPartitions(self.matrix[:rows], nlist)
+
+    def forget(self, conversation_id: str):
+        """Stop returning a conversation's messages (their rows are skipped from now on)"""
+        with self.lock:
+            for row in self.by_conversation.pop(conversation_id, []):
+                # The ids stay known, so a refresh re-reading the overlap does not add them back
+                self.ids[row] = 0
+                if self.id_array is not None:
+                    self.id_array[row] = 0
+
+    def search(self, query: Sequence[float], k: int, conversation_id: str = None,
+               before_id: int = None, deadline: float = None) -> List[Tuple[float, int]]:
+        """Top-k (score, message id) pairs by cosine similarity, best first.
+
+        ``conversation_id`` restricts the search to one conversation and
+        ``before_id`` to messages older than it. Without NumPy the scan stops
+        at ``deadline`` and returns the best matches found so far.
+        """
+        with self.lock:
+            if not self.ids or k <= 0:
+                return []
+            rows = self.by_conversation.get(conversation_id, []) if conversation_id is not None else None
+            if np is not None:
+                return self._search_numpy(query, k, rows, before_id)
+            return self._search_python(query, k, rows, before_id, deadline)
+
+    def _search_numpy(self, query, k, rows, before_id):
+        query = np.asarray(query, dtype=np.float32)
+        if rows is not None:
+            candidates = np.asarray(rows, dtype=np.int64)
+        elif self.ivf is not None:
+            candidates = self.ivf.candidates(query, self.nprobe)
+        else:
+            candidates = np.arange(len(self.ids), dtype=np.int64)
+
+        ids = self.id_array[candidates]
+        keep = ids > 0
+        if before_id is not None:
+            keep &= ids < before_id
+        candidates, ids = candidates[keep], ids[keep]
+        if not len(candidates):
+            return []
+
+        scores = self.matrix[candidates] @ query
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(ids[i])) for i in top]
+
+    def _search_python(self, query, k, rows, before_id, deadline):
+        query = array('f', query)
+        best = []
+        candidates = rows if rows is not None else range(len(self.ids))
+        for position, row in enumerate(candidates):
+            if deadline and position % 256 == 0 and time.monotonic() > deadline:
+                break
+            message_id = self.ids[row]
+            if not message_id or (before_id is not None and message_id >= before_id):
+                continue
+            score = sum(map(operator.mul, query, self.vectors[row]))
+            if len(best) < k:
+                heapq.heappush(best, (score, message_id))
+            elif score > best[0][0]:
+                heapq.heapreplace(best, (score, message_id))
+        return sorted(best, reverse=True)
+
+
+def build_retrieval_context(conversation_id: str, history: List[Dict[str, Any]], scope: str = None,
+                            top_k: int = None, budget_ms: float = None) -> Optional[str]:
+    """Find older messages relevant to the recent window and format them for the prompt tail.
+
+    Returns None when retrieval is off, nothing scores above the cut-off, or
+    the latency budget runs out (requires an app context).
+    """
+    scope = scope or os.environ.get('AGENTMIX_RETRIEVAL', 'conversation')
+    if scope == 'off' or not history:
+        return None
+    window_ids = [msg['id'] for msg in history if msg.get('id')]
+    if not window_ids:
+        return None
+    if top_k is None:
+        top_k = int(os.environ.get('AGENTMIX_RETRIEVAL_TOP_K', 3))
+    if budget_ms is None:
+        budget_ms = float(os.environ.get('AGENTMIX_RETRIEVAL_BUDGET_MS', 50))
+    min_score = float(os.environ.get('AGENTMIX_RETRIEVAL_MIN_SCORE', 0.25))
+    deadline = time.monotonic() + budget_ms / 1000.0
+
+    # The latest message is what the next speaker is about to address
+    query = get_embedder().embed(history[-1]['content'])
+    vector_index.refresh(deadline)
+    if time.monotonic() > deadline:
+        return None
+    hits = vector_index.search(
+        query,
+        top_k,
+        conversation_id=conversation_id if scope == 'conversation' else None,
+        before_id=min(window_ids),
+        deadline=deadline
+    )
+    hit_ids = [message_id for score, message_id in hits if score >= min_score]
+    if not hit_ids or time.monotonic() > deadline:
+        return None
+
+    # Other processes' indexes still hold the vectors of deleted conversations until the purge
+    deleted = sa.select(Conversation.id).where(Conversation.status == 'deleted')
+    rows = db.session.query(
+        Message.id, Message.conversation_id, Message.content, Message.message_type, AIAgent.name
+    ).outerjoin(AIAgent, AIAgent.id == Message.sender_id).filter(
+        Message.id.in_(hit_ids),
+        sa.or_(Message.conversation_id.is_(None), Message.conversation_id.not_in(deleted))
+    ).order_by(Message.id).all()
+    if not rows:
+        return None
+
+    lines = []
+    for row in rows:
+        speaker = 'Human' if row.message_type == 'human' else (row.name or 'System')
+        source = '' if row.conversation_id == conversation_id else ' (earlier conversation)'
+        content = row.content
+        if len(content) > RETRIEVED_CONTENT_CHARS:
+            content = content[:RETRIEVED_CONTENT_CHARS].rstrip() + '…'
+        lines.append(f"- {speaker}{source}: {content}")
+    return "Relevant earlier messages:\n" + '\n'.join(lines)
+
+
+# Global instance
+vector_index = VectorIndex()
@@ -0,0 +1,20 @@
+import os
+import sys
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from src.services.orchestrator_worker import OrchestratorWorker
+
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run an AgentMix orchestrator worker process')
+    parser.add_argument('--worker-id', type=int, required=True, help='Shard owned by this worker (0-based)')
+    parser.add_argument('--num-workers', type=int, default=1, help='Total number of orchestrator workers')
+    parser.add_argument('--address', default=None, help='host:port of the web tier queue manager')
+    args = parser.parse_args()
+
+    database_uri = os.environ.get('AGENTMIX_DATABASE_URI', DEFAULT_DATABASE_URI)
+    OrchestratorWorker(args.worker_id, args.address, database_uri, args.num_workers).run()
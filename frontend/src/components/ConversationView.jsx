@@ -27,6 +27,7 @@ const ConversationView = ({ agents }) => {
     selectedConversation,
     setSelectedConversation,
     socket,
+    markMessagesSeen,
   } = useConversation()
   const [messages, setMessages] = useState([])
   const [showCreateForm, setShowCreateForm] = useState(false)
@@ -48,11 +49,8 @@ const ConversationView = ({ agents }) => {
     if (!socket) return
     const onNewMessage = (data) => {
       if (selectedConversation && data.conversation_id === selectedConversation.id) {
-        setMessages(prev => {
-          const exists = prev.find(msg => msg.id === data.message.id)
-          if (exists) return prev
-          return [...prev, data.message]
-        })
+        // A message replayed on rejoin may already be here
+        setMessages(prev => prev.some(msg => msg.id === data.message.id) ? prev : [...prev, data.message])
       }
     }
     const onConversationStatus = (data) => {
@@ -100,6 +98,7 @@ const ConversationView = ({ agents }) => {
       if (data.success) {
         console.log('Fetched messages:', data.messages)
         setMessages(data.messages)
+        markMessagesSeen(conversationId, data.messages)
       }
     } catch (error) {
       console.error('Error fetching messages:', error)
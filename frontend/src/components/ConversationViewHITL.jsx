@@ -38,6 +38,7 @@ const ConversationViewHITL = ({ agents }) => {
     isTyping,
     setIsTyping,
     socket,
+    markMessagesSeen,
     pauseConversation,
     resumeConversation,
     sendHumanMessage,
@@ -68,7 +69,8 @@ const ConversationViewHITL = ({ agents }) => {
     if (!socket || !selectedConversation) return
     const onNewMessage = (data) => {
       if (data.conversation_id === selectedConversation.id) {
-        setMessages(prev => [...prev, data.message])
+        // A message replayed on rejoin may already be here
+        setMessages(prev => prev.some(msg => msg.id === data.message.id) ? prev : [...prev, data.message])
         scrollToBottom()
       }
     }
@@ -148,6 +150,7 @@ const ConversationViewHITL = ({ agents }) => {
       if (response.ok) {
         const data = await response.json()
         setMessages(data.messages || [])
+        markMessagesSeen(conversationId, data.messages || [])
       }
     } catch (error) {
       console.error('Error fetching messages:', error)
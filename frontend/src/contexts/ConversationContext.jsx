@@ -1,4 +1,4 @@
-import React, { createContext, useContext, useState, useEffect, useCallback } from 'react'
+import React, { createContext, useContext, useState, useEffect, useCallback, useRef } from 'react'
 import io from 'socket.io-client'
 
 // Conversation Context
@@ -21,6 +21,17 @@ export const ConversationProvider = ({ children }) => {
   const [socket, setSocket] = useState(null)
   const [socketConnected, setSocketConnected] = useState(false)
 
+  // Id of the newest message seen per conversation, sent as last_seen_id on
+  // (re)join so the server replays only what was missed
+  const lastSeenIds = useRef({})
+
+  const markMessagesSeen = useCallback((conversationId, messages) => {
+    const newest = messages.reduce((max, msg) => Math.max(max, msg.id || 0), lastSeenIds.current[conversationId] || 0)
+    if (newest > 0) {
+      lastSeenIds.current[conversationId] = newest
+    }
+  }, [])
+
   // Initialize WebSocket connection
   useEffect(() => {
     const newSocket = io('/')
@@ -37,7 +48,19 @@ export const ConversationProvider = ({ children }) => {
       setSocketConnected(false)
     })
 
+    // Rooms joined with batch: true deliver coalesced events in one frame;
+    // hand each one to the listeners of its own event, in order
+    newSocket.on('event_batch', ({ events }) => {
+      events.forEach(({ event, data }) => {
+        newSocket.listeners(event).forEach((listener) => listener(data))
+      })
+    })
+
     // Conversation events
+    newSocket.on('new_message', (data) => {
+      markMessagesSeen(data.conversation_id, [data.message])
+    })
+
     newSocket.on('conversation_status', (data) => {
       setConversationStatus(prev => ({
         ...prev,
@@ -73,15 +96,28 @@ export const ConversationProvider = ({ children }) => {
     return () => {
       newSocket.disconnect()
     }
-  }, [selectedConversation])
+  }, [selectedConversation, markMessagesSeen])
 
-  // Join/leave conversation rooms
+  // Join/leave conversation rooms, rejoining after every reconnect
   useEffect(() => {
     if (socket && selectedConversation) {
-      socket.emit('join_conversation', { conversation_id: selectedConversation.id })
+      const conversationId = selectedConversation.id
+      const join = () => {
+        const lastSeenId = lastSeenIds.current[conversationId]
+        socket.emit('join_conversation', {
+          conversation_id: conversationId,
+          batch: true,
+          ...(lastSeenId ? { last_seen_id: lastSeenId } : {})
+        })
+      }
+      if (socket.connected) {
+        join()
+      }
+      socket.on('connect', join)
 
       return () => {
-        socket.emit('leave_conversation', { conversation_id: selectedConversation.id })
+        socket.off('connect', join)
+        socket.emit('leave_conversation', { conversation_id: conversationId })
       }
     }
   }, [socket, selectedConversation])
@@ -145,6 +181,7 @@ export const ConversationProvider = ({ children }) => {
     waitingForHuman,
     socketConnected,
     socket,
+    markMessagesSeen,
 
     // Actions
     startConversation,